@@ -0,0 +1,74 @@
+import argparse
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+import common
+from synthetic import write_daily_csv
+from data_preprocessing import prepare_data
+from backtesting import backtest, error_metrics, summarize
+
+
+def loop_metrics(actual, predicted, codes):
+    # Per-item errors the straightforward way, one pandas group at a time
+    frame = pd.DataFrame({'actual': actual, 'predicted': predicted, 'code': codes})
+    results = {}
+    for code, group in frame.groupby('code'):
+        errors = (group['predicted'] - group['actual']).abs()
+        results[code] = (errors.mean(), (errors / group['actual'].abs()).mean() * 100)
+    return results
+
+
+def one_pass_predictions(rows, features):
+    # test_model's old evaluate-then-predict against the single batched prediction a fold makes
+    from model import create_model
+
+    X = np.random.default_rng(0).random((rows, features), dtype=np.float32)
+    y = np.random.default_rng(1).random(rows, dtype=np.float32)
+    model = create_model([features])
+    model.predict_on_batch(X[:1])
+
+    _, two_passes = common.measure(lambda: (model.evaluate(X, y, verbose=0), model.predict(X, verbose=0)), repeat=3)
+    common.report('evaluate + predict', two_passes, rows)
+    _, one_call = common.measure(model.predict_on_batch, X, repeat=3)
+    common.report('predict_on_batch', one_call, rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Walk-forward backtesting: vectorized metrics, batched predictions and parallel folds')
+    parser.add_argument('--items', type=int, default=50)
+    parser.add_argument('--rows', type=int, default=400, help='daily rows per item')
+    parser.add_argument('--folds', type=int, default=4)
+    parser.add_argument('--epochs', type=int, default=3)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    rows = 1_000_000
+    actual = rng.uniform(0.05, 50, rows)
+    predicted = actual * rng.normal(1, 0.1, rows)
+    codes = rng.integers(0, 5000, rows)
+    _, looped = common.measure(loop_metrics, actual, predicted, codes, repeat=1)
+    common.report('per-item metrics, pandas groups', looped, rows)
+    _, vectorized = common.measure(error_metrics, actual, predicted, codes, 5000, repeat=3)
+    common.report('per-item metrics, bincount', vectorized, rows)
+
+    with tempfile.TemporaryDirectory() as directory:
+        datasets, schema = prepare_data(write_daily_csv(os.path.join(directory, 'daily.csv'), args.items, args.rows), 'embedding')
+        timings = {}
+        for workers in sorted({1, args.workers}):
+            folds, items = backtest(datasets, schema, args.folds, workers=workers, epochs=args.epochs, patience=None)
+            timings[workers] = folds.attrs['elapsed']
+        print(folds.to_string(index=False))
+        print(summarize(folds).to_string())
+        for workers, elapsed in timings.items():
+            print(f"{workers:>3} workers  {elapsed:8.1f} s  speedup {timings[1] / elapsed:5.2f}x")
+
+    # Last, since the backtest configures TensorFlow's thread pools before its first op
+    one_pass_predictions(200_000, 60)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,41 @@
+import argparse
+import os
+import tempfile
+import time
+
+import common  # noqa: F401 - puts src/ and utils/ on sys.path
+from synthetic import write_daily_csv
+from data_preprocessing import prepare_data
+from model import create_model, model_inputs
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare one-hot and embedding item encodings')
+    parser.add_argument('--items', type=int, nargs='+', default=[50, 200])
+    parser.add_argument('--rows', type=int, default=400, help='daily rows per item, enough for the monthly lags')
+    parser.add_argument('--epochs', type=int, default=2)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        for items in args.items:
+            path = write_daily_csv(os.path.join(directory, f'daily_{items}.csv'), items, args.rows)
+            for encoding in ('onehot', 'embedding'):
+                start = time.perf_counter()
+                datasets, schema = prepare_data(path, encoding)
+                X_train, X_test, y_train, y_test, _ = datasets[0]
+                preprocess_time = time.perf_counter() - start
+
+                X_train = X_train.astype('float32')
+                X_test = X_test.astype('float32')
+                model = create_model([X_train.shape[1]], schema.num_items)
+
+                start = time.perf_counter()
+                model.fit(model_inputs(model, X_train), y_train.astype('float32'), epochs=args.epochs, batch_size=256, verbose=0)
+                epoch_time = (time.perf_counter() - start) / args.epochs
+
+                print(f"{items:>6} items  {encoding:<10} X_train {X_train.memory_usage().sum() / 2**20:9.2f} MiB  "
+                      f"params {model.count_params():>9}  preprocess {preprocess_time:6.2f} s  epoch {epoch_time:6.2f} s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,42 @@
+import argparse
+import os
+import tempfile
+import time
+
+import common  # noqa: F401 - puts src/ and utils/ on sys.path
+from synthetic import write_daily_csv
+from data_preprocessing import prepare_data
+from feature_cache import cached_prepare_data
+
+
+def main():
+    parser = argparse.ArgumentParser(description='preprocess_data against the feature cache')
+    parser.add_argument('--items', type=int, default=500)
+    parser.add_argument('--rows', type=int, default=400, help='daily rows per item')
+    parser.add_argument('--encoding', default='onehot', choices=['onehot', 'embedding'])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = write_daily_csv(os.path.join(directory, 'daily.csv'), args.items, args.rows)
+        cache_dir = os.path.join(directory, 'cache')
+
+        start = time.perf_counter()
+        prepare_data(path, args.encoding)
+        print(f"prepare_data         {time.perf_counter() - start:8.3f} s")
+
+        start = time.perf_counter()
+        cached_prepare_data(path, args.encoding, cache_dir=cache_dir)
+        print(f"cache miss + store   {time.perf_counter() - start:8.3f} s")
+
+        start = time.perf_counter()
+        cached_prepare_data(path, args.encoding, cache_dir=cache_dir)
+        print(f"cache hit            {time.perf_counter() - start:8.3f} s")
+
+        # A second entry pushes the first one out of a one-entry cache
+        other = 'embedding' if args.encoding == 'onehot' else 'onehot'
+        cached_prepare_data(path, other, cache_dir=cache_dir, max_entries=1)
+        print(f"Entries after eviction: {len([name for name in os.listdir(cache_dir) if not name.endswith('.json')])}")
+
+
+if __name__ == '__main__':
+    main()
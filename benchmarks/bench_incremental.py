@@ -0,0 +1,78 @@
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+import common  # noqa: F401 - puts src/ and utils/ on sys.path
+from synthetic import make_daily_frame
+from data_preprocessing import prepare_data
+from model import create_model, model_inputs, training_metadata
+from artifacts import save_bundle
+from incremental import incremental_update
+
+
+def full_training(path, model_dir, encoding, epochs):
+    # What main does without a saved model: preprocess everything, train from scratch, save a bundle
+    datasets, schema = prepare_data(path, encoding)
+    X_train, X_test, y_train, y_test, scaler_price = datasets[0]
+    model = create_model([X_train.shape[1]], schema.num_items)
+    model.fit(model_inputs(model, X_train.astype('float32')), np.asarray(y_train, dtype='float32'), epochs=epochs, verbose=0)
+
+    predictions = scaler_price.inverse_transform(model.predict(model_inputs(model, X_test.astype('float32')), verbose=0))
+    actual = scaler_price.inverse_transform(np.asarray(y_test).reshape(-1, 1))
+    trained_until = max(X_train.index.max(), X_test.index.max())
+    save_bundle(model_dir, model, schema, training_metadata(trained_until, actual, predictions))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Incremental fine-tuning on new days against a full retrain')
+    parser.add_argument('--items', type=int, default=100)
+    parser.add_argument('--days', type=int, default=400)
+    parser.add_argument('--new-days', type=int, default=3)
+    parser.add_argument('--epochs', type=int, default=5)
+    parser.add_argument('--encoding', default='embedding', choices=['onehot', 'embedding'])
+    args = parser.parse_args()
+
+    frame = make_daily_frame(args.items, args.days)
+    dates = sorted(frame['Date'].unique())
+    cutoff = dates[-args.new_days - 1]
+
+    with tempfile.TemporaryDirectory() as directory:
+        old_path = os.path.join(directory, 'old.csv')
+        new_path = os.path.join(directory, 'daily.csv')
+        frame[frame['Date'] <= cutoff].to_csv(old_path, index=False)
+        frame.to_csv(new_path, index=False)
+
+        model_dir = os.path.join(directory, 'model')
+        full_training(old_path, model_dir, args.encoding, args.epochs)
+        shutil.copytree(model_dir, os.path.join(directory, 'before'))
+
+        start = time.perf_counter()
+        result = incremental_update(model_dir, new_path)
+        incremental = time.perf_counter() - start
+        print(f"incremental update  {incremental:8.2f} s  ({result})")
+
+        start = time.perf_counter()
+        full_training(new_path, os.path.join(directory, 'full'), args.encoding, args.epochs)
+        full = time.perf_counter() - start
+        print(f"full retrain        {full:8.2f} s  ({full / incremental:.1f}x slower)")
+
+        # The drift checks escalate instead of fine-tuning
+        for name, change in (
+            ('price jump', lambda rows: rows.assign(**{'Average Price': rows['Average Price'] * 3})),
+            ('new items', lambda rows: rows.assign(Name=rows['Name'] + ' (new)')),
+        ):
+            drifted = frame.copy()
+            later = drifted['Date'] > cutoff
+            drifted.loc[later] = change(drifted.loc[later])
+            drifted.to_csv(new_path, index=False)
+            drift_dir = os.path.join(directory, name)
+            shutil.copytree(os.path.join(directory, 'before'), drift_dir)
+            print(f"{name:<19} -> {incremental_update(drift_dir, new_path)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+import argparse
+import os
+import tempfile
+import threading
+import time
+
+import numpy as np
+import requests
+
+import common  # noqa: F401 - puts src/ and utils/ on sys.path
+from synthetic import write_daily_csv
+from data_preprocessing import prepare_data
+from model import create_model, model_inputs
+from artifacts import save_bundle
+from inference import MicroBatcher, Predictor, serve
+
+
+def percentiles(latencies):
+    latencies = np.asarray(latencies) * 1000
+    return np.percentile(latencies, 50), np.percentile(latencies, 99)
+
+
+def time_calls(call, rows, requests_count):
+    latencies = []
+    start = time.perf_counter()
+    for index in range(requests_count):
+        row = rows[index % len(rows)]
+        call_start = time.perf_counter()
+        call(row)
+        latencies.append(time.perf_counter() - call_start)
+    elapsed = time.perf_counter() - start
+    return latencies, requests_count / elapsed
+
+
+def time_concurrent(call, rows, clients, requests_per_client):
+    # `clients` threads each sending single-row requests back to back
+    latencies = []
+    lock = threading.Lock()
+
+    def client(offset):
+        own = []
+        for index in range(requests_per_client):
+            call_start = time.perf_counter()
+            call(rows[(offset + index) % len(rows)])
+            own.append(time.perf_counter() - call_start)
+        with lock:
+            latencies.extend(own)
+
+    threads = [threading.Thread(target=client, args=(offset,)) for offset in range(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, clients * requests_per_client / (time.perf_counter() - start)
+
+
+def report(name, latencies, throughput):
+    p50, p99 = percentiles(latencies)
+    print(f"{name:<34} p50 {p50:8.3f} ms  p99 {p99:8.3f} ms  {throughput:10.0f} rows/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Latency and throughput of the inference service')
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--encoding', default='embedding', choices=['onehot', 'embedding'])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        datasets, schema = prepare_data(write_daily_csv(os.path.join(directory, 'daily.csv'), 50, 400), args.encoding)
+        X_train, X_test, y_train, y_test, scaler_price = datasets[0]
+        X_train = X_train.astype('float32')
+        X_test = X_test.to_numpy(dtype=np.float32)
+        model = create_model([X_train.shape[1]], schema.num_items)
+        model.fit(model_inputs(model, X_train), y_train.astype('float32'), epochs=1, batch_size=256, verbose=0)
+        model_dir = os.path.join(directory, 'model')
+        save_bundle(model_dir, model, schema, {'horizon': 'Day'})
+
+        # Every backend predicts the same prices as Keras
+        expected = scaler_price.inverse_transform(model.predict(model_inputs(model, X_test), verbose=0)).ravel()
+        predictors = {backend: Predictor(model_dir, backend=backend) for backend in ('tensorflow', 'numpy')}
+        for predictor in predictors.values():
+            np.testing.assert_allclose(predictor.predict(X_test), expected, rtol=1e-4, atol=1e-4)
+
+        rows = X_test[:, None, :]
+        report('model.predict, 1 row', *time_calls(
+            lambda row: model.predict(model_inputs(model, row), verbose=0), rows, min(args.requests, 200)
+        ))
+        for backend, predictor in predictors.items():
+            report(f'Predictor[{backend}], 1 row', *time_calls(predictor.predict, rows, args.requests))
+
+        batches = [X_test[start:start + 256] for start in range(0, len(X_test) - 256, 256)]
+        latencies, calls_per_second = time_calls(predictors['numpy'].predict, batches, 200)
+        report('Predictor[numpy], 256 rows', latencies, calls_per_second * 256)
+
+        predictor = predictors['numpy']
+        report(f'{args.clients} clients, no batching', *time_concurrent(
+            predictor.predict, rows, args.clients, args.requests // args.clients
+        ))
+        batcher = MicroBatcher(predictor.predict)
+        report(f'{args.clients} clients, micro-batched', *time_concurrent(
+            lambda row: batcher.submit(row).result(), rows, args.clients, args.requests // args.clients
+        ))
+        print(f"  {batcher.rows / max(batcher.batches, 1):.1f} rows per batch")
+        batcher.close()
+
+        server, batcher = serve(model_dir, port=0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = f'http://127.0.0.1:{server.server_port}/predict'
+        sessions = threading.local()
+
+        def post(row):
+            if not hasattr(sessions, 'session'):
+                sessions.session = requests.Session()
+            response = sessions.session.post(url, json={'instances': row.tolist()})
+            response.raise_for_status()
+
+        report(f'HTTP, {args.clients} clients', *time_concurrent(post, rows, args.clients, args.requests // args.clients))
+        print(f"  {batcher.rows / max(batcher.batches, 1):.1f} rows per batch")
+        server.shutdown()
+        server.server_close()
+        batcher.close()
+
+
+if __name__ == '__main__':
+    main()
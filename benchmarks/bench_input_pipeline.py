@@ -0,0 +1,66 @@
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+import common  # noqa: F401 - puts src/ and utils/ on sys.path
+from synthetic import write_daily_csv
+from data_preprocessing import preprocess_data
+from input_pipeline import build_feature_stores, make_dataset
+from model import create_model, model_inputs
+
+
+def time_fit(model, inputs, y=None, batch_size=32):
+    start = time.perf_counter()
+    history = model.fit(inputs, y, batch_size=None if y is None else batch_size, epochs=1, shuffle=False, verbose=0)
+    return time.perf_counter() - start, history.history['loss'][-1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare in-memory and streamed (tf.data) training input')
+    parser.add_argument('--items', type=int, default=200)
+    parser.add_argument('--rows', type=int, default=400, help='daily rows per item')
+    parser.add_argument('--encoding', default='embedding', choices=['onehot', 'embedding'])
+    parser.add_argument('--batch-size', type=int, default=256)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = write_daily_csv(os.path.join(directory, 'daily.csv'), args.items, args.rows)
+
+        start = time.perf_counter()
+        datasets = preprocess_data(path, args.encoding)
+        print(f"preprocess_data       {time.perf_counter() - start:8.2f} s")
+
+        start = time.perf_counter()
+        stores, schema = build_feature_stores(path, os.path.join(directory, 'features'), args.encoding, buckets=8, chunksize=20000)
+        print(f"build_feature_stores  {time.perf_counter() - start:8.2f} s")
+
+        X_train, X_test, y_train, _, _ = datasets[0]
+        samples = len(X_train)
+
+        # Reading alone, without a model
+        dataset = make_dataset(stores[0], 'train', args.batch_size, shuffle_buffer=10000)
+        start = time.perf_counter()
+        for _ in dataset:
+            pass
+        print(f"tf.data read          {samples / (time.perf_counter() - start):10.0f} samples/s")
+
+        # One epoch from the same initial weights, unshuffled, through both paths
+        model = create_model([X_train.shape[1]], schema.num_items)
+        weights = model.get_weights()
+        inputs = model_inputs(model, X_train.astype('float32'))
+        elapsed, memory_loss = time_fit(model, inputs, y_train.to_numpy(dtype=np.float32), args.batch_size)
+        print(f"in-memory fit         {samples / elapsed:10.0f} samples/s  loss {memory_loss:.6f}")
+
+        model.set_weights(weights)
+        model.optimizer = None
+        model.compile(optimizer='adam', loss='mean_squared_error')
+        dataset = make_dataset(stores[0], 'train', args.batch_size, two_inputs=len(model.inputs) > 1)
+        elapsed, stream_loss = time_fit(model, dataset)
+        print(f"tf.data fit           {samples / elapsed:10.0f} samples/s  loss {stream_loss:.6f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,37 @@
+import argparse
+import os
+import tempfile
+
+import common
+from instrumentation import Tracer
+
+
+def spans(tracer, count):
+    for _ in range(count):
+        with tracer.span('fetch', endpoint='priceoverview') as attributes:
+            attributes['bytes'] = 1024
+        tracer.count('bytes_fetched', 1024)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Cost of a timing span and counter, in memory and written to a JSONL trace')
+    parser.add_argument('--spans', type=int, default=20000)
+    args = parser.parse_args()
+
+    _, stats = common.measure(spans, Tracer(path=None), args.spans)
+    common.report('span, in memory', stats, args.spans)
+
+    with tempfile.TemporaryDirectory() as directory:
+        tracer = Tracer(path=os.path.join(directory, 'trace.jsonl'))
+        _, stats = common.measure(spans, tracer, args.spans)
+        common.report('span, JSONL trace', stats, args.spans)
+        tracer.close()
+
+        tracer = Tracer(path=os.path.join(directory, 'memory.jsonl'), trace_memory=True)
+        _, stats = common.measure(spans, tracer, args.spans)
+        common.report('span, JSONL trace + tracemalloc', stats, args.spans)
+        tracer.close()
+
+
+if __name__ == '__main__':
+    main()
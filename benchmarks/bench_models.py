@@ -0,0 +1,27 @@
+import argparse
+import os
+import tempfile
+
+import common  # noqa: F401 - puts src/ and utils/ on sys.path
+from synthetic import write_daily_csv
+from data_preprocessing import prepare_data
+from model_registry import MODELS, compare_models
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Accuracy against fit and predict time of every registered model')
+    parser.add_argument('--items', type=int, default=50)
+    parser.add_argument('--rows', type=int, default=400, help='daily rows per item')
+    parser.add_argument('--epochs', type=int, default=50)
+    parser.add_argument('--encoding', default='onehot', choices=['onehot', 'embedding'])
+    parser.add_argument('--models', nargs='+', choices=list(MODELS))
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        datasets, schema = prepare_data(write_daily_csv(os.path.join(directory, 'daily.csv'), args.items, args.rows), args.encoding)
+        table = compare_models(datasets, schema, args.models, args.epochs, patience=10)
+    print(table.to_string(index=False))
+
+
+if __name__ == '__main__':
+    main()
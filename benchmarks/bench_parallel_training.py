@@ -0,0 +1,33 @@
+import argparse
+import os
+import tempfile
+
+import common  # noqa: F401 - puts src/ and utils/ on sys.path
+from synthetic import write_daily_csv
+from data_preprocessing import prepare_data
+from parallel_training import train_horizons
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Train every horizon and configuration one after another, then in parallel')
+    parser.add_argument('--items', type=int, default=50)
+    parser.add_argument('--rows', type=int, default=400, help='daily rows per item')
+    parser.add_argument('--epochs', type=int, default=5)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        datasets, schema = prepare_data(write_daily_csv(os.path.join(directory, 'daily.csv'), args.items, args.rows), 'embedding')
+
+        timings = {}
+        for workers in sorted({1, args.workers}):
+            table = train_horizons(datasets, schema, workers=workers, epochs=args.epochs, patience=None)
+            timings[workers] = table.attrs['elapsed']
+        print(table.drop(columns='PID').to_string(index=False))
+
+        for workers, elapsed in timings.items():
+            print(f"{workers:>3} workers  {elapsed:8.1f} s  speedup {timings[1] / elapsed:5.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+import argparse
+import gc
+import subprocess
+import json
+import sys
+import os
+
+import common  # noqa: F401 - puts src/ and utils/ on sys.path
+from common import measure
+from bs4 import BeautifulSoup
+import parsers
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+# The full html.parser tree the engines replaced, measured alongside them
+SOUP = 'html.parser tree'
+
+
+def parse_item_details_soup(html):
+    # The previous behaviour: a full html.parser tree of the whole page
+    soup = BeautifulSoup(html, 'html.parser')
+    name = soup.select_one('.market_listing_item_name').text
+    game = soup.select_one('.market_listing_game_name').text
+    item_type_element = soup.select_one('#largeiteminfo_item_type').text
+    elements = soup.select('.market_commodity_orders_header_promote')
+    return (name, game, item_type_element) + tuple(element.text for element in elements[:4])
+
+
+def parse_item_links_soup(results_html):
+    soup = BeautifulSoup(results_html, 'html.parser')
+    return [item['href'] for item in soup.select('.market_listing_row_link')]
+
+
+def load_pages():
+    with open(os.path.join(FIXTURES, 'listing.html')) as f:
+        listing_html = f.read()
+    with open(os.path.join(FIXTURES, 'search_render.json')) as f:
+        results_html = json.load(f)['results_html']
+    return listing_html, results_html
+
+
+def resident_memory():
+    # Current RSS in bytes from /proc, or the peak where there is no /proc
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        from instrumentation import peak_rss
+        return peak_rss()
+
+
+def tree_memory(name, copies=20):
+    # Run in a fresh process per engine: the RSS one parse tree of each page takes, from `copies` trees kept
+    # alive at once. tracemalloc cannot see the trees selectolax and lxml build in C, RSS does
+    listing_html, results_html = load_pages()
+    if name == SOUP:
+        parse = lambda html: BeautifulSoup(html, 'html.parser')  # noqa: E731
+    else:
+        parse = parsers.get_engine(name).parse
+        # The engines only parse the listing's body, without its scripts and styles
+        listing_html = parsers.strip_page(listing_html)
+    # Load the lazily imported parts of the library before measuring
+    parse('<p></p>')
+    gc.collect()
+
+    sizes = {}
+    for page, html in (('listing', listing_html), ('search', results_html)):
+        before = resident_memory()
+        trees = [parse(html) for _ in range(copies)]
+        sizes[page] = max(0, resident_memory() - before) / len(trees)
+        del trees
+        gc.collect()
+    print(json.dumps(sizes))
+
+
+def measure_tree_memory(name):
+    output = subprocess.run([sys.executable, __file__, '--tree-memory', name], capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def report_engine(label, stats, items, tree_bytes):
+    print(f"{label:<40} best {stats['best'] * 1000:10.2f} ms   mean {stats['mean'] * 1000:10.2f} ms   "
+          f"tree {tree_bytes / 2**10:9.1f} KiB   {items / stats['best']:12.0f} items/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the HTML parser engines on saved Steam pages')
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--tree-memory', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.tree_memory:
+        tree_memory(args.tree_memory)
+        return
+
+    listing_html, results_html = load_pages()
+
+    trees = measure_tree_memory(SOUP)
+    expected_details, stats = measure(parse_item_details_soup, listing_html, repeat=args.repeat)
+    report_engine(f'listing: full {SOUP}', stats, 1, trees['listing'])
+    expected_links, stats = measure(parse_item_links_soup, results_html, repeat=args.repeat)
+    report_engine(f'search: full {SOUP}', stats, len(expected_links), trees['search'])
+
+    for name in parsers.available_engines():
+        engine = parsers.get_engine(name)
+        trees = measure_tree_memory(name)
+
+        details, stats = measure(parsers.parse_item_details, listing_html, engine, repeat=args.repeat)
+        assert details == expected_details, f'{name} read different item details: {details}'
+        report_engine(f'listing: {name}', stats, 1, trees['listing'])
+
+        links, stats = measure(parsers.parse_item_links, results_html, engine, repeat=args.repeat)
+        assert links == expected_links, f'{name} read different item links'
+        report_engine(f'search: {name}', stats, len(links), trees['search'])
+
+
+if __name__ == '__main__':
+    main()
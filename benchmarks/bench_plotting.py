@@ -0,0 +1,57 @@
+import argparse
+import os
+import tempfile
+import time
+
+os.environ.setdefault('PLOT_HEADLESS', '1')
+
+import numpy as np
+
+import common  # noqa: F401 - puts src/ and utils/ on sys.path
+import visualization
+
+
+def predictions(rows, seed=0):
+    # Log-normal prices like the market's, with a proportional prediction error
+    rng = np.random.default_rng(seed)
+    y_true = rng.lognormal(0, 1.5, rows)
+    return y_true, y_true * rng.normal(1, 0.1, rows)
+
+
+def render(mode, max_points, arrays):
+    visualization.LARGE_PLOTS = mode
+    visualization.MAX_POINTS = max_points
+    start = time.perf_counter()
+    visualization.plot_predictions(*arrays)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Rendering prediction plots of large test sets to files')
+    parser.add_argument('--rows', type=int, default=500000, help='daily test rows; weekly and monthly get 1/7 and 1/30 of them')
+    args = parser.parse_args()
+
+    y_day, p_day = predictions(args.rows)
+    y_week, p_week = predictions(args.rows // 7, seed=1)
+    y_month, p_month = predictions(args.rows // 30, seed=2)
+    arrays = (y_day, p_day, y_week, p_week, y_month, p_month)
+
+    with tempfile.TemporaryDirectory() as directory:
+        visualization.PLOT_DIR = directory
+        full = render('hexbin', args.rows + 1, arrays)
+        print(f"scatter every point     {full:8.2f} s")
+        for mode in ('hexbin', 'sample'):
+            elapsed = render(mode, 20000, arrays)
+            print(f"{mode:<23} {elapsed:8.2f} s  ({full / elapsed:.1f}x faster)")
+
+        # With the worker, the caller only pays for handing the arrays over
+        worker = visualization.PlotWorker()
+        start = time.perf_counter()
+        worker.submit(visualization.plot_predictions, *arrays)
+        submitted = time.perf_counter() - start
+        worker.close()
+        print(f"background submit       {submitted * 1000:8.2f} ms  (rendered in {time.perf_counter() - start:.2f} s)")
+
+
+if __name__ == '__main__':
+    main()
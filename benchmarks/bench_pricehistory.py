@@ -0,0 +1,45 @@
+from datetime import datetime, timedelta
+import argparse
+import random
+
+import common  # noqa: F401 - puts src/ and utils/ on sys.path
+from common import measure, report
+from scraper import process_pricehistory_data, process_pricehistory_data_loop
+
+
+def make_pricehistory(rows, seed=0):
+    # Synthetic pricehistory in Steam's format: daily points first, then hourly points for the last month
+    rng = random.Random(seed)
+    hourly = min(rows // 2, 24 * 30)
+    daily = rows - hourly
+    end = datetime(2023, 6, 1)
+    start = end - timedelta(days=daily)
+
+    data = []
+    for day in range(daily):
+        date = start + timedelta(days=day, hours=1)
+        data.append([date.strftime('%b %d %Y %H: +0'), round(rng.uniform(0.03, 50), 3), str(rng.randint(1, 5000))])
+    for hour in range(hourly):
+        date = end + timedelta(hours=hour)
+        data.append([date.strftime('%b %d %Y %H: +0'), round(rng.uniform(0.03, 50), 3), str(rng.randint(1, 500))])
+    return data
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the loop and vectorized process_pricehistory_data')
+    parser.add_argument('--rows', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    # tests/test_pricehistory.py checks that both versions return the same days
+    for rows in args.rows:
+        data = make_pricehistory(rows)
+        _, loop_stats = measure(process_pricehistory_data_loop, data, repeat=args.repeat)
+        _, vector_stats = measure(process_pricehistory_data, data, repeat=args.repeat)
+        report(f'loop ({rows} rows)', loop_stats, rows)
+        report(f'vectorized ({rows} rows)', vector_stats, rows)
+        print(f"{'speedup':<40} {loop_stats['best'] / vector_stats['best']:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
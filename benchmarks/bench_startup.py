@@ -0,0 +1,39 @@
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+import common
+
+SRC_DIR = os.path.join(common.ROOT, 'src')
+
+# How much of each subcommand gets loaded before it starts working
+COMMANDS = ['preprocess', 'train', 'predict', 'plot', 'bench']
+
+
+def time_run(code, repeat):
+    # Wall time of a fresh interpreter, best of `repeat`
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', code], cwd=SRC_DIR, check=True, capture_output=True)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Startup time of every main.py subcommand')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    baseline = time_run('pass', args.repeat)
+    print(f"{'python':<12} {baseline:7.2f} s")
+    print(f"{'--help':<12} {time_run('import main; main.build_parser()', args.repeat):7.2f} s")
+    for command in COMMANDS:
+        elapsed = time_run(f'import main; main.import_command({command!r})', args.repeat)
+        print(f"{command:<12} {elapsed:7.2f} s")
+
+
+if __name__ == '__main__':
+    main()
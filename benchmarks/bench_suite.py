@@ -0,0 +1,250 @@
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+
+import numpy as np
+
+import common
+from synthetic import DAILY_SIZES, write_daily_rows
+from stub_server import FIXTURES, start_stub
+
+# Every run is saved here as <time>-<commit>.json, to compare with --compare
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+SUITES = ['crawl', 'pricehistory', 'preprocess', 'training', 'inference']
+
+
+def percentiles(latencies):
+    # p50 and p99 in milliseconds
+    if not len(latencies):
+        return None, None
+    latencies = np.asarray(latencies) * 1000
+    return float(np.percentile(latencies, 50)), float(np.percentile(latencies, 99))
+
+
+def result(name, throughput, unit, latencies=(), **extra):
+    p50, p99 = percentiles(latencies)
+    print(f"  {name:<36} {throughput:12.1f} {unit:<8}" + (f"  p50 {p50:9.3f} ms  p99 {p99:9.3f} ms" if p50 is not None else ''))
+    return {'name': name, 'throughput': throughput, 'unit': unit, 'p50_ms': p50, 'p99_ms': p99, **extra}
+
+
+def time_calls(func, args_list):
+    latencies = []
+    start = time.perf_counter()
+    for args in args_list:
+        call_start = time.perf_counter()
+        func(*args)
+        latencies.append(time.perf_counter() - call_start)
+    return latencies, time.perf_counter() - start
+
+
+def bench_crawl(args, directory):
+    # The full crawl - search pages, listing, priceoverview, pricehistory and histogram per item - against the
+    # stub server, so it measures our own overhead plus the chosen simulated latency
+    server = start_stub(items=args.items, delay=args.delay_ms / 1000)
+    os.environ['STEAM_BASE_URL'] = server.base_url
+    os.environ.setdefault('STEAM_RATE_LIMITS', ','.join(f'{endpoint}=100000:1000' for endpoint in
+                                                        ('search', 'listings', 'priceoverview', 'pricehistory', 'itemordershistogram', 'default')))
+    os.environ.pop('API_KEY', None)
+    from instrumentation import tracer
+    from scraper import DirectClient, iter_item_links
+    from storage import MarketStore
+    import crawler
+
+    # The links of a run are pulled from the stub's search pages while the first items are crawled
+    store = MarketStore(os.path.join(directory, 'market.db'), directory)
+    start = time.perf_counter()
+    frames = asyncio.run(crawler.crawl(DirectClient(), iter_item_links(args.items), 'stub', workers=args.crawl_workers, store=store))
+    elapsed = time.perf_counter() - start
+    store.close()
+    server.shutdown()
+    server.server_close()
+
+    crawled = len(frames[0])
+    results = [result('items', crawled / elapsed, 'items/s', tracer.durations['item'], workers=args.crawl_workers, delay_ms=args.delay_ms)]
+    results.append(result('requests', sum(server.requests.values()) / elapsed, 'req/s', tracer.durations['fetch']))
+    return results
+
+
+def bench_pricehistory(args, directory):
+    # The recorded pricehistory response, repeated to 10^3-10^5 points
+    from scraper import process_pricehistory_data
+
+    with open(os.path.join(FIXTURES, 'pricehistory.json')) as f:
+        prices = json.load(f)['prices']
+    results = []
+    for rows in (10 ** 3, 10 ** 4, 10 ** 5):
+        data = (prices * (rows // len(prices) + 1))[:rows]
+        latencies, _ = time_calls(process_pricehistory_data, [(data,)] * args.repeat)
+        results.append(result(f'process_pricehistory_data {rows}', rows / min(latencies), 'rows/s', latencies, rows=rows))
+    return results
+
+
+def bench_preprocess(args, directory):
+    # preprocess_data end to end on synthetic daily.csv files, read_csv included
+    from data_preprocessing import preprocess_data
+
+    results = []
+    for rows in args.sizes:
+        path = write_daily_rows(os.path.join(directory, f'daily-{rows}.csv'), rows)
+        latencies, _ = time_calls(preprocess_data, [(path, args.encoding)] * args.repeat)
+        results.append(result(f'preprocess_data {rows}', rows / min(latencies), 'rows/s', latencies, rows=rows))
+    return results
+
+
+def bench_training(args, directory):
+    # Per-step latency and samples per second of the daily model, after an epoch to build and trace it
+    from data_preprocessing import prepare_data
+    from model import create_model, model_inputs
+    import tensorflow as tf
+
+    class StepTimer(tf.keras.callbacks.Callback):
+        def on_epoch_begin(self, epoch, logs=None):
+            self.steps = []
+
+        def on_train_batch_begin(self, batch, logs=None):
+            self.start = time.perf_counter()
+
+        def on_train_batch_end(self, batch, logs=None):
+            self.steps.append(time.perf_counter() - self.start)
+
+    datasets, schema = prepare_data(write_daily_rows(os.path.join(directory, 'daily-training.csv'), args.training_rows), args.encoding)
+    X_train, X_test, y_train, _, _ = datasets[0]
+    X = X_train.to_numpy(dtype=np.float32)
+    y = y_train.to_numpy(dtype=np.float32)
+    model = create_model([X.shape[1]], schema.num_items)
+    inputs = model_inputs(model, X)
+
+    results = []
+    for batch_size in (32, 256):
+        timer = StepTimer()
+        model.fit(inputs, y, epochs=1, batch_size=batch_size, verbose=0)
+        start = time.perf_counter()
+        model.fit(inputs, y, epochs=args.epochs, batch_size=batch_size, callbacks=[timer], verbose=0)
+        elapsed = time.perf_counter() - start
+        results.append(result(f'fit batch {batch_size}', len(X) * args.epochs / elapsed, 'rows/s', timer.steps, rows=len(X)))
+    return results
+
+
+def bench_inference(args, directory):
+    # Single-row latency and batch throughput of both Predictor backends on a saved bundle
+    from data_preprocessing import prepare_data
+    from model import create_model, model_inputs
+    from artifacts import save_bundle
+    from inference import Predictor
+
+    datasets, schema = prepare_data(write_daily_rows(os.path.join(directory, 'daily-inference.csv'), 20000), args.encoding)
+    X_train, X_test, y_train, _, _ = datasets[0]
+    X_train = X_train.to_numpy(dtype=np.float32)
+    X_test = X_test.to_numpy(dtype=np.float32)
+    model = create_model([X_train.shape[1]], schema.num_items)
+    model.fit(model_inputs(model, X_train), y_train.to_numpy(dtype=np.float32), epochs=1, batch_size=256, verbose=0)
+    model_dir = os.path.join(directory, 'model')
+    save_bundle(model_dir, model, schema, {'horizon': 'Day'})
+
+    results = []
+    rows = [(X_test[index % len(X_test)][None, :],) for index in range(args.requests)]
+    batches = [(X_test[start:start + 256],) for start in range(0, len(X_test) - 255, 256)] * 4
+    for backend in ('numpy', 'tensorflow'):
+        predictor = Predictor(model_dir, backend=backend)
+        latencies, elapsed = time_calls(predictor.predict, rows)
+        results.append(result(f'Predictor[{backend}] 1 row', len(rows) / elapsed, 'rows/s', latencies))
+        latencies, elapsed = time_calls(predictor.predict, batches)
+        results.append(result(f'Predictor[{backend}] 256 rows', len(batches) * 256 / elapsed, 'rows/s', latencies))
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=common.ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def run(args):
+    run_info = {
+        'commit': git_commit(),
+        'time': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'args': vars(args),
+        'suites': {},
+    }
+    with tempfile.TemporaryDirectory() as directory:
+        for suite in args.suites:
+            print(suite)
+            try:
+                run_info['suites'][suite] = globals()[f'bench_{suite}'](args, directory)
+            except ImportError as e:
+                # e.g. scraper_api or playwright missing - recorded, so a comparison shows the suite did not run
+                print(f"  skipped: {e}")
+                run_info['suites'][suite] = {'skipped': str(e)}
+
+    os.makedirs(args.results_dir, exist_ok=True)
+    stamp = datetime.datetime.now().strftime('%Y%m%d-%H%M%S')
+    path = os.path.join(args.results_dir, f"{stamp}-{run_info['commit']}.json")
+    with open(path, 'w') as f:
+        json.dump(run_info, f, indent=2)
+    print(f"Saved results to {path}")
+    return path
+
+
+def compare(old_path, new_path):
+    # Throughput of the new run relative to the old one, above 1 is faster; latencies side by side
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+    print(f"{old['commit']} -> {new['commit']}")
+    for suite, results in new['suites'].items():
+        before = old['suites'].get(suite)
+        if isinstance(results, dict) or not isinstance(before, list):
+            print(f"{suite}: not run in both")
+            continue
+        before = {entry['name']: entry for entry in before}
+        print(suite)
+        for entry in results:
+            if entry['name'] not in before:
+                continue
+            previous = before[entry['name']]
+            line = f"  {entry['name']:<36} {entry['throughput'] / previous['throughput']:6.2f}x {entry['unit']}"
+            if entry['p50_ms'] is not None and previous['p50_ms'] is not None:
+                line += f"   p50 {previous['p50_ms']:9.3f} -> {entry['p50_ms']:9.3f} ms   p99 {previous['p99_ms']:9.3f} -> {entry['p99_ms']:9.3f} ms"
+            print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline throughput and latency of the crawl, preprocessing, training and inference')
+    parser.add_argument('suites', nargs='*', default=SUITES, metavar='suite', help=f"any of: {', '.join(SUITES)}")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[size for size in DAILY_SIZES if size <= 10 ** 5],
+                        help=f"daily.csv rows for preprocess, up to {DAILY_SIZES[-1]:.0e}")
+    parser.add_argument('--encoding', default='embedding', choices=['onehot', 'embedding'])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--items', type=int, default=200, help='items to crawl from the stub')
+    parser.add_argument('--crawl-workers', type=int, default=8)
+    parser.add_argument('--delay-ms', type=float, default=0.0, help='simulated latency of every stub response')
+    parser.add_argument('--training-rows', type=int, default=20000)
+    parser.add_argument('--epochs', type=int, default=2)
+    parser.add_argument('--requests', type=int, default=1000, help='single-row inference requests')
+    parser.add_argument('--results-dir', default=RESULTS_DIR)
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help='compare two saved result files instead of running')
+    args = parser.parse_args()
+    unknown = [suite for suite in args.suites if suite not in SUITES]
+    if unknown:
+        parser.error(f"unknown suites {unknown}, choose from: {', '.join(SUITES)}")
+
+    if args.compare:
+        compare(*args.compare)
+    else:
+        run(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,39 @@
+import os
+import sys
+import time
+import tracemalloc
+
+# The project modules live in src/ and utils/ and import each other by bare module name
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for directory in ('src', 'utils'):
+    path = os.path.join(ROOT, directory)
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+
+def measure(func, *args, repeat=5, **kwargs):
+    # Run func several times and report the best and mean wall time, plus peak traced memory
+    timings = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        timings.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    func(*args, **kwargs)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return result, {
+        'best': min(timings),
+        'mean': sum(timings) / len(timings),
+        'peak_memory': peak,
+    }
+
+
+def report(name, stats, items=None):
+    line = f"{name:<40} best {stats['best'] * 1000:10.2f} ms   mean {stats['mean'] * 1000:10.2f} ms   peak {stats['peak_memory'] / 2**20:8.2f} MiB"
+    if items:
+        line += f"   {items / stats['best']:12.0f} items/s"
+    print(line)
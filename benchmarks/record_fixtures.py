@@ -0,0 +1,49 @@
+import argparse
+import json
+import os
+import re
+from urllib.parse import quote, unquote
+
+import requests
+
+from stub_server import FIXTURES, STEAM_URL
+
+# Recording pricehistory needs a logged-in session
+HEADERS = {'Cookie': f"steamLoginSecure={os.getenv('STEAM_LOGIN_SECURE', '')}"}
+
+
+def save(name, text):
+    with open(os.path.join(FIXTURES, name), 'w', encoding='utf-8') as f:
+        f.write(text)
+    print(f"Saved {name} ({len(text) / 1024:.0f} KiB)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Record fresh Steam market responses as benchmark fixtures')
+    parser.add_argument('--link', default=f'{STEAM_URL}/market/listings/730/Prisma%202%20Case')
+    args = parser.parse_args()
+
+    appid, name = args.link.split('/listings/')[1].split('/')[:2]
+    name = unquote(name)
+    session = requests.Session()
+
+    search = session.get(f'{STEAM_URL}/market/search/render/?query=&start=0&count=100&search_descriptions=0&sort_column=popular&sort_dir=desc')
+    save('search_render.json', search.text)
+
+    listing = session.get(args.link)
+    save('listing.html', listing.text)
+
+    item_nameid = re.search(r'Market_LoadOrderSpread\(\s*(\d+)\s*\)', listing.text).group(1)
+    save('itemordershistogram.json', session.get(
+        f'{STEAM_URL}/market/itemordershistogram?country=US&language=english&currency=1&item_nameid={item_nameid}&two_factor=0'
+    ).text)
+    save('priceoverview.json', session.get(f'{STEAM_URL}/market/priceoverview/?appid={appid}&currency=1&market_hash_name={quote(name)}').text)
+
+    pricehistory = session.get(f'{STEAM_URL}/market/pricehistory/?appid={appid}&market_hash_name={quote(name)}', headers=HEADERS)
+    if not json.loads(pricehistory.text or '{}').get('prices'):
+        raise SystemExit("pricehistory came back empty - set STEAM_LOGIN_SECURE to a logged-in session cookie")
+    save('pricehistory.json', pricehistory.text)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,153 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, quote, unquote, urlsplit
+from collections import Counter, defaultdict, deque
+import argparse
+import threading
+import json
+import time
+import os
+import re
+
+# listing.html and search_render.json are recorded from the Steam Community market; priceoverview, pricehistory
+# and itemordershistogram are synthetic, generated offline in Steam's response format. record_fixtures.py
+# re-records all five
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+STEAM_URL = 'https://steamcommunity.com'
+
+
+def load_fixture(name):
+    with open(os.path.join(FIXTURES, name), encoding='utf-8') as f:
+        return f.read()
+
+
+class StubSteam(ThreadingHTTPServer):
+    # Serves the recorded fixtures on the Steam market paths, so the scraper can crawl offline. Every search
+    # result and listing gets its own item name, and `delay` seconds are added to each response to stand in for
+    # network latency
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, address, items=1000, delay=0.0):
+        super().__init__(address, StubHandler)
+        self.items = items
+        self.delay = delay
+        self.requests = Counter()
+        self.lock = threading.Lock()
+        # Error responses queued per route by fail(), answered before the fixtures are
+        self.failures = defaultdict(deque)
+
+        self.search = json.loads(load_fixture('search_render.json'))
+        self.listing = load_fixture('listing.html')
+        # The name of the item the listing was recorded for, replaced by each requested item's name
+        self.listing_item = re.search(r'class="market_listing_item_name"[^>]*>([^<]*)<', self.listing).group(1)
+        self.priceoverview = load_fixture('priceoverview.json').encode()
+        self.pricehistory = load_fixture('pricehistory.json').encode()
+        self.histogram = load_fixture('itemordershistogram.json').encode()
+
+        # The search page's rows, with their links numbered so each result is a different item
+        self.search_rows = re.findall(r'<a class="market_listing_row_link".*?</a>', self.search['results_html'], flags=re.S)
+
+    @property
+    def base_url(self):
+        return f'http://{self.server_address[0]}:{self.server_address[1]}'
+
+    def count(self, route):
+        with self.lock:
+            self.requests[route] += 1
+
+    def fail(self, route, status, times=1, headers=None):
+        # The next `times` requests of a route get `status`, e.g. a 429 with Retry-After, to exercise retries
+        with self.lock:
+            self.failures[route].extend([(status, headers or {})] * times)
+
+    def next_failure(self, route):
+        with self.lock:
+            return self.failures[route].popleft() if self.failures[route] else None
+
+    def search_page(self, start, count):
+        rows = []
+        for index in range(start, min(start + count, self.items)):
+            row = self.search_rows[index % len(self.search_rows)]
+            link = f'{self.base_url}/market/listings/730/{quote(f"Stub Item {index}")}'
+            rows.append(re.sub(r'href="[^"]*"', f'href="{link}"', row, count=1))
+        page = {**self.search, 'start': start, 'pagesize': count, 'total_count': self.items, 'results_html': '\n'.join(rows)}
+        return json.dumps(page).encode()
+
+    def listing_page(self, name):
+        return self.listing.replace(self.listing_item, name).replace(STEAM_URL, self.base_url).encode()
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def send_body(self, body, content_type='application/json', route=None):
+        if self.server.delay:
+            time.sleep(self.server.delay)
+        self.server.count(route)
+        failure = self.server.next_failure(route)
+        if failure is not None:
+            status, headers = failure
+            self.send_response(status)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        if url.path.startswith('/market/search/render'):
+            start = int(query.get('start', ['0'])[0])
+            count = int(query.get('count', ['100'])[0])
+            self.send_body(self.server.search_page(start, count), route='search')
+        elif url.path.startswith('/market/listings/'):
+            name = unquote(url.path.rstrip('/').split('/')[-1])
+            self.send_body(self.server.listing_page(name), 'text/html; charset=utf-8', route='listings')
+        elif url.path.startswith('/market/priceoverview'):
+            self.send_body(self.server.priceoverview, route='priceoverview')
+        elif url.path.startswith('/market/pricehistory'):
+            self.send_body(self.server.pricehistory, route='pricehistory')
+        elif url.path.startswith('/market/itemordershistogram'):
+            self.send_body(self.server.histogram, route='itemordershistogram')
+        else:
+            self.send_error(404)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub(host='127.0.0.1', port=0, items=1000, delay=0.0):
+    # Runs the stub on a background thread; point the scraper at it with STEAM_BASE_URL=server.base_url
+    server = StubSteam((host, port), items, delay)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve the recorded Steam market fixtures locally')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--items', type=int, default=1000, help='number of search results')
+    parser.add_argument('--delay-ms', type=float, default=0.0, help='added to every response')
+    args = parser.parse_args()
+
+    server = StubSteam((args.host, args.port), args.items, args.delay_ms / 1000)
+    print(f"Serving the Steam fixtures on {server.base_url} - crawl with STEAM_BASE_URL={server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,34 @@
+import numpy as np
+import pandas as pd
+
+
+def make_daily_frame(items, rows_per_item, seed=0, start='2020-01-01'):
+    # A daily.csv-shaped frame: one row per item and day with a random-walk price
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range(start, periods=rows_per_item, freq='D')
+    base = rng.uniform(0.05, 50, size=(items, 1))
+    steps = rng.normal(0, 0.02, size=(items, rows_per_item))
+    prices = base * np.exp(np.cumsum(steps, axis=1))
+    volumes = rng.integers(1, 5000, size=(items, rows_per_item))
+
+    return pd.DataFrame({
+        'Date': np.tile(dates.strftime('%Y-%m-%d %H:%M:%S'), items),
+        'Average Price': prices.ravel().round(4),
+        'Total Volume': volumes.ravel(),
+        'Name': np.repeat([f'Item {index}' for index in range(items)], rows_per_item),
+    })
+
+
+def write_daily_csv(path, items, rows_per_item, seed=0):
+    make_daily_frame(items, rows_per_item, seed).to_csv(path, index=False)
+    return path
+
+
+# Sizes the benchmark suite generates daily.csv at, in rows
+DAILY_SIZES = (10 ** 3, 10 ** 4, 10 ** 5, 10 ** 6)
+
+
+def write_daily_rows(path, rows, days=400, seed=0):
+    # About `rows` rows in all: enough items with `days` days each that every horizon has training and test rows
+    days = min(days, rows)
+    return write_daily_csv(path, max(1, rows // days), days, seed)
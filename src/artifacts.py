@@ -0,0 +1,104 @@
+from datetime import datetime
+import tempfile
+import shutil
+import pickle
+import json
+import os
+
+import numpy as np
+
+from data_preprocessing import FeatureSchema, SchemaMismatch
+from instrumentation import get_logger
+
+logger = get_logger(__name__)
+
+MODEL_FILE = 'model.keras'
+SCHEMA_FILE = 'schema.json'
+SCALERS_FILE = 'scalers.pkl'
+
+# The bundle directory names its live version in this file
+CURRENT_FILE = 'CURRENT'
+
+# Older versions kept next to the live one
+KEEP_VERSIONS = 3
+
+
+def bundle_exists(directory):
+    return os.path.exists(os.path.join(directory, CURRENT_FILE))
+
+
+def current_version(directory):
+    with open(os.path.join(directory, CURRENT_FILE)) as f:
+        return f.read().strip()
+
+
+def write_atomic(path, text):
+    # Readers see either the old or the new contents, never a partly written file
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+    with os.fdopen(fd, 'w') as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+
+
+def save_bundle(directory, model, schema, metadata=None):
+    # Model weights, scalers and schema are written into a new version directory, which only becomes
+    # the live one once all of it is on disk - a crash mid-save leaves the previous bundle in place
+    os.makedirs(directory, exist_ok=True)
+    version = datetime.now().strftime('%Y%m%d-%H%M%S-%f')
+    temp_dir = tempfile.mkdtemp(dir=directory, prefix='.tmp-')
+
+    model.save(os.path.join(temp_dir, MODEL_FILE))
+    with open(os.path.join(temp_dir, SCALERS_FILE), 'wb') as f:
+        pickle.dump({'price': schema.scaler_price, 'volume': schema.scaler_volume}, f)
+    with open(os.path.join(temp_dir, SCHEMA_FILE), 'w') as f:
+        json.dump({**schema.to_dict(), 'metadata': metadata or {}}, f, indent=2)
+
+    os.replace(temp_dir, os.path.join(directory, version))
+    write_atomic(os.path.join(directory, CURRENT_FILE), version)
+    prune_versions(directory)
+    logger.info(f"Saved model bundle {directory}/{version}")
+    return version
+
+
+def prune_versions(directory, keep=KEEP_VERSIONS):
+    live = current_version(directory)
+    versions = sorted(name for name in os.listdir(directory) if not name.startswith('.') and name != CURRENT_FILE)
+    for version in versions[:-keep]:
+        if version != live:
+            shutil.rmtree(os.path.join(directory, version), ignore_errors=True)
+
+
+def load_schema(directory, version=None):
+    # The schema and metadata alone, without loading TensorFlow's model
+    path = os.path.join(directory, version or current_version(directory))
+    with open(os.path.join(path, SCALERS_FILE), 'rb') as f:
+        scalers = pickle.load(f)
+    with open(os.path.join(path, SCHEMA_FILE)) as f:
+        values = json.load(f)
+    return FeatureSchema.from_dict(values, scalers['price'], scalers['volume']), values.get('metadata', {})
+
+
+def load_bundle(directory, version=None, compile=True):
+    # TensorFlow is only imported here, so reading a schema stays cheap
+    import tensorflow as tf
+
+    version = version or current_version(directory)
+    schema, metadata = load_schema(directory, version)
+    model = tf.keras.models.load_model(os.path.join(directory, version, MODEL_FILE), compile=compile)
+    return model, schema, metadata
+
+
+def check_schema(saved, schema, horizon, columns):
+    # The data must have been built exactly like the data the saved model was trained on
+    if list(columns) != saved.columns.get(horizon):
+        raise SchemaMismatch(f"The saved model was trained on different {horizon} columns; retrain it or remove the bundle")
+    if schema is None:
+        return
+    if schema.encoding != saved.encoding or schema.items != saved.items:
+        raise SchemaMismatch("The saved model was trained with a different item encoding or set of items")
+    for name in ('scaler_price', 'scaler_volume'):
+        new, old = getattr(schema, name), getattr(saved, name)
+        if not (np.allclose(new.data_min_, old.data_min_) and np.allclose(new.data_max_, old.data_max_)):
+            raise SchemaMismatch(f"The data was scaled differently from the saved model ({name}); preprocess with the saved schema")
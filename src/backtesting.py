@@ -0,0 +1,170 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import multiprocessing
+import time
+import os
+
+import numpy as np
+import pandas as pd
+
+from data_preprocessing import HORIZONS
+from input_pipeline import item_codes_of
+from parallel_training import horizon_order, init_worker
+from instrumentation import get_logger
+
+logger = get_logger(__name__)
+
+# Actual prices below this are left out of MAPE, which is undefined at zero
+MAPE_MIN_PRICE = 1e-6
+
+
+def walk_forward_cutoffs(dates, folds, min_train_share=0.5):
+    # Rolling-origin cutoffs: fold k trains on every period up to cutoff k and is tested on the periods up
+    # to the next cutoff, with the periods after the first min_train_share split evenly between the folds
+    periods = np.unique(dates)
+    first = int(len(periods) * min_train_share)
+    if len(periods) - first < folds:
+        raise ValueError(f"{len(periods)} periods are too few for {folds} folds after {min_train_share:.0%} of them")
+    bounds = np.linspace(first, len(periods), folds + 1).astype(np.int64)
+    return [(periods[start - 1], periods[end - 1]) for start, end in zip(bounds[:-1], bounds[1:])]
+
+
+def split_fold(X, y, cutoff, end, window=None):
+    # Expanding window by default, or only the last `window` periods before the cutoff
+    dates = X.index.to_numpy()
+    train = dates <= cutoff
+    if window is not None:
+        periods = np.unique(dates[train])
+        if window < len(periods):
+            train &= dates > periods[-window - 1]
+    test = (dates > cutoff) & (dates <= end)
+    return X[train], y[train], X[test], y[test]
+
+
+def error_metrics(actual, predicted, codes=None, num_codes=None):
+    # MAE and MAPE over all rows, or per code (item) with every code reduced in one bincount pass
+    errors = np.abs(predicted - actual)
+    valid = np.abs(actual) > MAPE_MIN_PRICE
+    percentages = np.divide(errors, np.abs(actual), out=np.zeros_like(errors), where=valid)
+    if codes is None:
+        return {
+            'Rows': len(actual),
+            'MAE': float(errors.mean()) if len(actual) else np.nan,
+            'MAPE': float(percentages[valid].mean() * 100) if valid.any() else np.nan,
+        }
+
+    rows = np.bincount(codes, minlength=num_codes)
+    mape_rows = np.bincount(codes, weights=valid, minlength=num_codes)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return {
+            'Rows': rows,
+            'MAE': np.bincount(codes, weights=errors, minlength=num_codes) / rows,
+            'MAPE': np.bincount(codes, weights=percentages, minlength=num_codes) / mape_rows * 100,
+        }
+
+
+def run_fold(horizon, fold, cutoff, data, num_items, model_name, config, epochs, patience):
+    # Train on the data up to the cutoff and predict the whole test period at once, in a worker process.
+    # The MLP holds out its latest training rows for early stopping, so the test period never influences training
+    from model_registry import evaluate_model, make_model
+
+    X_train, y_train, X_test, y_test, scaler_price = data
+    start = time.perf_counter()
+    model = make_model(model_name, num_items, epochs, patience, {**config, 'run_name': f'backtest-{horizon.lower()}-{fold}'})
+    model.fit(X_train, y_train)
+    actual, predicted, _ = evaluate_model(model, X_test, y_test, scaler_price)
+
+    return {
+        'Horizon': horizon,
+        'Fold': fold,
+        'Cutoff': cutoff,
+        'Train Rows': len(X_train),
+        'Seconds': round(time.perf_counter() - start, 2),
+        'predicted': predicted,
+        'actual': actual,
+    }
+
+
+def backtest(datasets, schema, folds=4, horizons=None, model_name='mlp', config=None, workers=None, epochs=1000, patience=20,
+             window=None, min_train_share=0.5):
+    # Walk-forward evaluation of every horizon over `folds` cutoffs, a fresh model per fold, trained in parallel
+    # worker processes. Returns one row per horizon and fold, and the errors of every item over all folds
+    config = config or {}
+    # Every item gets an embedding row, including items that only appear after a fold's cutoff
+    num_items = schema.num_items
+    runs = []
+    item_codes = {}
+    for (horizon, _), (X_train, X_test, y_train, y_test, scaler_price) in zip(HORIZONS, datasets):
+        if horizons and horizon not in horizons:
+            continue
+        # The training and test splits together are the horizon's whole history, in date order
+        X = pd.concat([X_train, X_test])
+        y = pd.concat([y_train, y_test])
+        try:
+            cutoffs = walk_forward_cutoffs(X.index, folds, min_train_share)
+        except ValueError as e:
+            # Typically the monthly horizon of a short history - the other horizons are still worth reporting
+            logger.warning(f"Skipping the {horizon} horizon: {e}")
+            continue
+        for fold, (cutoff, end) in enumerate(cutoffs):
+            fold_X_train, fold_y_train, fold_X_test, fold_y_test = split_fold(X, y, cutoff, end, window)
+            item_codes[horizon, fold] = item_codes_of(fold_X_test, schema)
+            data = (fold_X_train, fold_y_train, fold_X_test, fold_y_test, scaler_price)
+            runs.append((horizon, fold, str(pd.Timestamp(cutoff).date()), data, num_items))
+
+    if not runs:
+        raise ValueError(f"No horizon has enough periods for {folds} folds")
+    workers = workers or min(len(runs), os.cpu_count() or 1)
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    tensorflow = model_name == 'mlp'
+    logger.info(f"Backtesting {len(runs)} folds on {workers} workers with {threads} threads each")
+
+    start = time.perf_counter()
+    results = []
+    if workers == 1:
+        init_worker(threads, tensorflow)
+        for run in runs:
+            results.append(run_fold(*run, model_name, config, epochs, patience))
+    else:
+        # Spawned, not forked - TensorFlow's runtime is not fork-safe
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(workers, mp_context=context, initializer=init_worker, initargs=(threads, tensorflow)) as executor:
+            futures = [executor.submit(run_fold, *run, model_name, config, epochs, patience) for run in runs]
+            for future in as_completed(futures):
+                result = future.result()
+                logger.info(f"Finished {result['Horizon']} fold {result['Fold']} in {result['Seconds']}s")
+                results.append(result)
+    elapsed = time.perf_counter() - start
+
+    fold_rows = []
+    item_tables = []
+    by_horizon = {}
+    for result in results:
+        by_horizon.setdefault(result['Horizon'], []).append(result)
+
+    for horizon, horizon_results in by_horizon.items():
+        actual = np.concatenate([result['actual'] for result in horizon_results])
+        predicted = np.concatenate([result['predicted'] for result in horizon_results])
+        codes = np.concatenate([item_codes[horizon, result['Fold']] for result in horizon_results])
+
+        for result in horizon_results:
+            metrics = error_metrics(result.pop('actual'), result.pop('predicted'))
+            fold_rows.append({**result, 'Test Rows': metrics.pop('Rows'), **metrics})
+
+        per_item = error_metrics(actual, predicted, codes, len(schema.items))
+        table = pd.DataFrame({'Horizon': horizon, 'Item': schema.items, **per_item})
+        item_tables.append(table[table['Rows'] > 0])
+
+    fold_table = pd.DataFrame(fold_rows).sort_values(['Horizon', 'Fold'], key=horizon_order, ignore_index=True)
+    fold_table.attrs['elapsed'] = elapsed
+    item_table = pd.concat(item_tables).sort_values(['Horizon', 'MAE'], key=horizon_order, ascending=[True, False], ignore_index=True)
+    logger.info(f"Backtested {len(runs)} folds in {elapsed:.1f}s ({fold_table['Seconds'].sum():.1f}s of training in total)")
+    return fold_table, item_table
+
+
+def summarize(fold_table):
+    # Mean and spread of the fold errors for every horizon
+    return (
+        fold_table.groupby('Horizon', sort=False)[['MAE', 'MAPE']]
+        .agg(['mean', 'std'])
+        .sort_index(key=lambda index: index.map({horizon: order for order, (horizon, _) in enumerate(HORIZONS)}))
+    )
@@ -2,58 +2,206 @@ import pandas as pd
 from sklearn.model_selection import train_test_split
 from sklearn.preprocessing import MinMaxScaler
 
-def preprocess_data():
+from instrumentation import get_logger, span
+
+logger = get_logger(__name__)
+
+# Earlier periods of the same item used as features
+LAGS = (1, 2, 3)
+
+# Rolling means over the previous N periods of the same item
+ROLLING_WINDOWS = (3, 7)
+
+# Column holding the item's integer id when items are encoded for an embedding
+ITEM_ID_COLUMN = 'Item Id'
+
+# Share of each horizon, taken from the end of the timeline, held out for testing
+TEST_SIZE = 0.2
+
+# Bump whenever the features built from daily.csv change, so models trained on the old ones are refused
+FEATURE_VERSION = 1
+
+# Horizon name and the frequency each item is averaged to (None keeps the daily rows)
+HORIZONS = [('Day', None), ('Week', 'W'), ('Month', 'MS')]
+
+
+class SchemaMismatch(ValueError):
+    pass
+
+
+class FeatureSchema:
+    # Everything that turns daily rows into the exact features a model was trained on:
+    # the fitted scalers, the item categories and the column order of every horizon
+    def __init__(self, encoding, items, scaler_price, scaler_volume, columns=None, feature_version=FEATURE_VERSION):
+        self.encoding = encoding
+        self.items = list(items)
+        self.scaler_price = scaler_price
+        self.scaler_volume = scaler_volume
+        self.columns = columns or {}
+        self.feature_version = feature_version
+
+    @property
+    def categories(self):
+        return pd.CategoricalDtype(self.items)
+
+    @property
+    def num_items(self):
+        # Rows of the item embedding - every item the schema knows, whether or not a split holds it - or None
+        # when the items are one-hot columns
+        return len(self.items) if self.encoding == 'embedding' else None
+
+    def transform(self, data):
+        # Scale with the stored scalers and give 'Name' the stored categories, never refitting either - items the
+        # schema has no category for have no features a model trained with it could use
+        known = data['Name'].isin(self.items)
+        if not known.all():
+            unknown = data.loc[~known, 'Name'].unique()
+            raise SchemaMismatch(f"{len(unknown)} items are not in the schema, e.g. {list(unknown[:3])}; refit the schema to learn them")
+        data = data.copy()
+        data['Name'] = data['Name'].astype(self.categories)
+        data['Average Price'] = self.scaler_price.transform(data[['Average Price']])
+        data['Total Volume'] = self.scaler_volume.transform(data[['Total Volume']])
+        return data
+
+    def check(self, horizon, columns):
+        # Record the columns of a horizon the first time, fail on any later difference
+        columns = list(columns)
+        if horizon not in self.columns:
+            self.columns[horizon] = columns
+        elif self.columns[horizon] != columns:
+            missing = set(self.columns[horizon]) - set(columns)
+            extra = set(columns) - set(self.columns[horizon])
+            raise SchemaMismatch(
+                f"{horizon} features do not match the schema (missing {sorted(missing)[:5]}, unexpected {sorted(extra)[:5]}"
+                f"{', same columns in a different order' if not missing and not extra else ''})"
+            )
+
+    def to_dict(self):
+        # Everything but the scalers, which are pickled next to it
+        return {
+            'feature_version': self.feature_version,
+            'encoding': self.encoding,
+            'items': self.items,
+            'columns': self.columns,
+        }
+
+    @classmethod
+    def from_dict(cls, values, scaler_price, scaler_volume):
+        if values['feature_version'] != FEATURE_VERSION:
+            raise SchemaMismatch(f"Features are version {FEATURE_VERSION}, the schema was saved with version {values['feature_version']}")
+        return cls(values['encoding'], values['items'], scaler_price, scaler_volume, values['columns'], values['feature_version'])
+
+
+def fit_schema(data, encoding='onehot'):
+    # Same categories, in the same order, as astype('category') on the whole frame
+    scaler_price = MinMaxScaler().fit(data[['Average Price']])
+    scaler_volume = MinMaxScaler().fit(data[['Total Volume']])
+    return FeatureSchema(encoding, sorted(data['Name'].unique()), scaler_price, scaler_volume)
+
+
+def lag_column(column, horizon, lag):
+    # Lag 1 keeps the original names, e.g. 'Avg Price Last Day'
+    if lag == 1:
+        return f'{column} Last {horizon}'
+    return f'{column} {lag} {horizon}s Ago'
+
+
+def aggregate_items(data, freq):
+    # Average every item on its own, so items are never mixed into one period
+    if freq is None:
+        return data
+    return (
+        data.groupby(['Name', pd.Grouper(key='Date', freq=freq)], sort=False, observed=True)[['Average Price', 'Total Volume']]
+        .mean()
+        .reset_index()
+    )
+
+
+def add_item_features(data, horizon, lags=LAGS, windows=ROLLING_WINDOWS):
+    # Lag and rolling features computed per item in one vectorized pass over the frame
+    data = data.sort_values(['Name', 'Date'], kind='stable')
+    grouped = data.groupby('Name', sort=False, observed=True)
+
+    for lag in lags:
+        data[lag_column('Avg Price', horizon, lag)] = grouped['Average Price'].shift(lag)
+    data[lag_column('Total Volume', horizon, 1)] = grouped['Total Volume'].shift(1)
+
+    # Rolling means over earlier periods only, so the current price never leaks into its own features
+    last_price = data[lag_column('Avg Price', horizon, 1)].groupby(data['Name'], sort=False, observed=True)
+    for window in windows:
+        data[f'Avg Price Mean {window} {horizon}s'] = last_price.rolling(window, min_periods=1).mean().droplevel(0)
+
+    return data
+
+
+def encode_items(data, encoding):
+    if encoding == 'onehot':
+        # One-hot encode 'Name' column after aggregating, so the encoding is never averaged
+        return pd.get_dummies(data, columns=['Name'])
+    if encoding == 'embedding':
+        # A single integer id per item for a learned embedding, so X stays the same width however many items there are
+        data.insert(0, ITEM_ID_COLUMN, data['Name'].cat.codes.astype('int32'))
+        return data.drop(columns='Name')
+    raise ValueError(f"Unknown item encoding: {encoding}")
+
+
+def build_horizon(data, horizon, freq, encoding='onehot'):
+    horizon_data = add_item_features(aggregate_items(data, freq), horizon)
+
+    # Drop rows with NaN values caused by the shifting
+    horizon_data = horizon_data.dropna()
+
+    horizon_data = encode_items(horizon_data, encoding)
+
+    # Sort data by date for the chronological split
+    horizon_data = horizon_data.sort_values('Date', kind='stable').set_index('Date')
+
+    # Split data into features and target
+    X = horizon_data.drop('Average Price', axis=1)
+    y = horizon_data['Average Price']
+    return X, y
+
+
+def prepare_data(path='../data/daily.csv', encoding='onehot', schema=None):
     # Load the data
-    data = pd.read_csv('../data/daily.csv')
-    print("Data preprocessing module loaded.")
+    with span('read_csv', path=path) as attributes:
+        data = pd.read_csv(path)
+        attributes['rows'] = len(data)
+    logger.debug(f"Loaded {len(data)} rows from {path}")
 
     # Convert 'Date' column to datetime
     data['Date'] = pd.to_datetime(data['Date'])
 
-    # Sort data by date
-    data = data.sort_values('Date')
-    
-    # One-hot encode 'Name' column
-    data = pd.get_dummies(data, columns=['Name'])
-
-    # Normalize 'Average Price' and 'Total Volume' columns
-    scaler_price = MinMaxScaler()
-    scaler_volume = MinMaxScaler()
-    data['Average Price'] = scaler_price.fit_transform(data[['Average Price']])
-    data['Total Volume'] = scaler_volume.fit_transform(data[['Total Volume']])
-
-    # Create daily dataset
-    daily_data = data.copy()
-    daily_data.set_index('Date', inplace=True)
-    daily_data['Avg Price Last Day'] = daily_data['Average Price'].shift(1)
-    daily_data['Total Volume Last Day'] = daily_data['Total Volume'].shift(1)
-
-    # Create weekly dataset
-    weekly_data = data.resample('W', on='Date').mean()
-    weekly_data['Avg Price Last Week'] = weekly_data['Average Price'].shift(1)
-    weekly_data['Total Volume Last Week'] = weekly_data['Total Volume'].shift(1)
-
-    # Create monthly dataset
-    monthly_data = data.resample('M', on='Date').mean()
-    monthly_data['Avg Price Last Month'] = monthly_data['Average Price'].shift(1)
-    monthly_data['Total Volume Last Month'] = monthly_data['Total Volume'].shift(1)
+    # Fit the scalers and item categories, or reuse the ones a model was trained with
+    if schema is None:
+        with span('fit_schema'):
+            schema = fit_schema(data, encoding)
+    elif schema.encoding != encoding:
+        raise SchemaMismatch(f"Items are {encoding} encoded, the schema expects {schema.encoding}")
 
-    # Drop rows with NaN values caused by the shifting
-    daily_data = daily_data.dropna()
-    weekly_data = weekly_data.dropna()
-    monthly_data = monthly_data.dropna()
+    # Normalize 'Average Price' and 'Total Volume' columns, and give every horizon the same item columns and ids
+    with span('transform'):
+        data = schema.transform(data)
 
-    # Split data into features and target
-    X_daily = daily_data.drop('Average Price', axis=1)
-    y_daily = daily_data['Average Price']
-    X_weekly = weekly_data.drop('Average Price', axis=1)
-    y_weekly = weekly_data['Average Price']
-    X_monthly = monthly_data.drop('Average Price', axis=1)
-    y_monthly = monthly_data['Average Price']
-
-    # Split data into training and testing sets
-    X_train_daily, X_test_daily, y_train_daily, y_test_daily = train_test_split(X_daily, y_daily, test_size=0.2, random_state=42, shuffle=False)
-    X_train_weekly, X_test_weekly, y_train_weekly, y_test_weekly = train_test_split(X_weekly, y_weekly, test_size=0.2, random_state=42, shuffle=False)
-    X_train_monthly, X_test_monthly, y_train_monthly, y_test_monthly = train_test_split(X_monthly, y_monthly, test_size=0.2, random_state=42, shuffle=False)
-
-    return (X_train_daily, X_test_daily, y_train_daily, y_test_daily, scaler_price), (X_train_weekly, X_test_weekly, y_train_weekly, y_test_weekly, scaler_price), (X_train_monthly, X_test_monthly, y_train_monthly, y_test_monthly, scaler_price)
+    # Create the daily, weekly and monthly datasets, split into training and testing sets
+    datasets = []
+    for horizon, freq in HORIZONS:
+        with span('build_horizon', horizon=horizon, encoding=encoding) as attributes:
+            X, y = build_horizon(data, horizon, freq, encoding)
+            attributes['rows'] = len(X)
+        schema.check(horizon, X.columns)
+        if X.empty:
+            # Typically the monthly horizon of a short history, where the lags leave no rows - the horizon is kept
+            # as empty splits, so the datasets still line up with HORIZONS, and skipped by training
+            logger.warning(f"Skipping the {horizon} horizon: no rows are left after the lags")
+            datasets.append((X, X, y, y, schema.scaler_price))
+            continue
+        X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=TEST_SIZE, random_state=42, shuffle=False)
+        datasets.append((X_train, X_test, y_train, y_test, schema.scaler_price))
+
+    return datasets, schema
+
+
+def preprocess_data(path='../data/daily.csv', encoding='onehot', schema=None):
+    daily_data, weekly_data, monthly_data = prepare_data(path, encoding, schema)[0]
+    return daily_data, weekly_data, monthly_data
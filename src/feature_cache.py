@@ -0,0 +1,173 @@
+import tempfile
+import hashlib
+import shutil
+import pickle
+import json
+import time
+import os
+
+import numpy as np
+import pandas as pd
+
+from data_preprocessing import FEATURE_VERSION, HORIZONS, TEST_SIZE, prepare_data
+from instrumentation import count, get_logger, span
+
+logger = get_logger(__name__)
+
+# Size and entry limits before the least recently used entries are evicted
+MAX_CACHE_BYTES = int(os.getenv("FEATURE_CACHE_MAX_BYTES", str(2 * 1024 ** 3)))
+MAX_CACHE_ENTRIES = int(os.getenv("FEATURE_CACHE_MAX_ENTRIES", "8"))
+
+INDEX_FILE = 'index.json'
+SPLITS = ('X_train', 'X_test', 'y_train', 'y_test')
+
+
+def read_index(cache_dir):
+    try:
+        with open(os.path.join(cache_dir, INDEX_FILE)) as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {'entries': {}, 'files': {}}
+
+
+def write_index(cache_dir, index):
+    fd, temp_path = tempfile.mkstemp(dir=cache_dir, prefix='.tmp-')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(index, f, indent=2)
+    os.replace(temp_path, os.path.join(cache_dir, INDEX_FILE))
+
+
+def file_digest(path, index):
+    # Content hash of an input file, reused while its size and modification time are unchanged
+    stat = os.stat(path)
+    signature = [stat.st_size, stat.st_mtime_ns]
+    known = index['files'].get(os.path.abspath(path))
+    if known and known['signature'] == signature:
+        return known['digest']
+
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    index['files'][os.path.abspath(path)] = {'signature': signature, 'digest': digest.hexdigest()}
+    return digest.hexdigest()
+
+
+def schema_digest(schema):
+    # A saved schema changes the features through its scalers and items, so it is part of the key
+    if schema is None:
+        return None
+    values = schema.to_dict()
+    for name in ('scaler_price', 'scaler_volume'):
+        scaler = getattr(schema, name)
+        values[name] = [scaler.data_min_.tolist(), scaler.data_max_.tolist()]
+    return hashlib.blake2b(json.dumps(values, sort_keys=True).encode(), digest_size=16).hexdigest()
+
+
+def cache_key(path, encoding, schema, index):
+    parameters = {
+        'input': file_digest(path, index),
+        'encoding': encoding,
+        'schema': schema_digest(schema),
+        'feature_version': FEATURE_VERSION,
+        'horizons': HORIZONS,
+        'test_size': TEST_SIZE,
+    }
+    return hashlib.blake2b(json.dumps(parameters, sort_keys=True).encode(), digest_size=16).hexdigest()
+
+
+def as_cached(datasets):
+    # The dtypes a cache entry holds, so a miss returns the same frames a later hit will
+    return [
+        (X_train.astype(np.float32), X_test.astype(np.float32), y_train.astype(np.float64), y_test.astype(np.float64), scaler_price)
+        for X_train, X_test, y_train, y_test, scaler_price in datasets
+    ]
+
+
+def store_entry(entry_dir, datasets, schema):
+    # X as float32, which is what the model trains on, y as float64 so prices invert exactly
+    meta = {}
+    for (horizon, _), (X_train, X_test, y_train, y_test, _) in zip(HORIZONS, datasets):
+        prefix = horizon.lower()
+        for split, values in zip(SPLITS, (X_train, X_test, y_train, y_test)):
+            dtype = np.float32 if split.startswith('X') else np.float64
+            np.save(os.path.join(entry_dir, f'{prefix}_{split}.npy'), values.to_numpy(dtype=dtype))
+            np.save(os.path.join(entry_dir, f'{prefix}_{split}_dates.npy'), values.index.to_numpy())
+        meta[horizon] = {'columns': list(X_train.columns), 'target': y_train.name}
+    with open(os.path.join(entry_dir, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+    with open(os.path.join(entry_dir, 'schema.pkl'), 'wb') as f:
+        pickle.dump(schema, f)
+
+
+def load_entry(entry_dir):
+    # Frames backed directly by the memory-mapped .npy files, nothing is read until it is used
+    with open(os.path.join(entry_dir, 'meta.json')) as f:
+        meta = json.load(f)
+    with open(os.path.join(entry_dir, 'schema.pkl'), 'rb') as f:
+        schema = pickle.load(f)
+
+    datasets = []
+    for horizon, _ in HORIZONS:
+        prefix = horizon.lower()
+        frames = []
+        for split in SPLITS:
+            values = np.load(os.path.join(entry_dir, f'{prefix}_{split}.npy'), mmap_mode='r')
+            dates = pd.DatetimeIndex(np.load(os.path.join(entry_dir, f'{prefix}_{split}_dates.npy')), name='Date')
+            if split.startswith('X'):
+                frames.append(pd.DataFrame(values, index=dates, columns=meta[horizon]['columns'], copy=False))
+            else:
+                frames.append(pd.Series(values, index=dates, name=meta[horizon]['target'], copy=False))
+        datasets.append((*frames, schema.scaler_price))
+    return datasets, schema
+
+
+def directory_size(path):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+def evict(cache_dir, index, max_bytes=MAX_CACHE_BYTES, max_entries=MAX_CACHE_ENTRIES):
+    # Drop least recently used entries until the cache is within both limits
+    entries = sorted(index['entries'].items(), key=lambda item: item[1]['last_used'])
+    total = sum(entry['bytes'] for _, entry in entries)
+    while entries and (total > max_bytes or len(entries) > max_entries):
+        key, entry = entries.pop(0)
+        shutil.rmtree(os.path.join(cache_dir, key), ignore_errors=True)
+        del index['entries'][key]
+        total -= entry['bytes']
+        logger.info(f"Evicted feature cache entry {key} ({entry['bytes'] / 2**20:.1f} MiB)")
+
+
+def cached_prepare_data(path='../data/daily.csv', encoding='onehot', schema=None, cache_dir='../data/feature_cache',
+                        max_bytes=MAX_CACHE_BYTES, max_entries=MAX_CACHE_ENTRIES):
+    # prepare_data, answered from the cache when the input file and parameters are unchanged
+    os.makedirs(cache_dir, exist_ok=True)
+    index = read_index(cache_dir)
+    key = cache_key(path, encoding, schema, index)
+    entry_dir = os.path.join(cache_dir, key)
+
+    if key in index['entries'] and os.path.isdir(entry_dir):
+        logger.info(f"Loading features from cache entry {key}")
+        count('feature_cache_hits')
+        with span('feature_cache_load'):
+            datasets, schema = load_entry(entry_dir)
+        index['entries'][key]['last_used'] = time.time()
+        write_index(cache_dir, index)
+        return datasets, schema
+
+    count('feature_cache_misses')
+    datasets, schema = prepare_data(path, encoding, schema)
+    datasets = as_cached(datasets)
+
+    # Written under a temporary name first, so a crash never leaves a partial entry behind
+    temp_dir = tempfile.mkdtemp(dir=cache_dir, prefix='.tmp-')
+    with span('feature_cache_store'):
+        store_entry(temp_dir, datasets, schema)
+    shutil.rmtree(entry_dir, ignore_errors=True)
+    os.replace(temp_dir, entry_dir)
+
+    index['entries'][key] = {'last_used': time.time(), 'bytes': directory_size(entry_dir), 'input': os.path.abspath(path)}
+    evict(cache_dir, index, max_bytes, max_entries)
+    write_index(cache_dir, index)
+    logger.info(f"Stored features in cache entry {key}")
+    return datasets, schema
@@ -0,0 +1,118 @@
+import math
+import time
+
+import numpy as np
+import pandas as pd
+
+from data_preprocessing import LAGS, ROLLING_WINDOWS, build_horizon
+from artifacts import load_bundle, load_schema, save_bundle
+from model import model_inputs
+from instrumentation import get_logger
+
+logger = get_logger(__name__)
+
+# Earlier rows each item needs for the lag and rolling features of its first new row
+CONTEXT_ROWS = max(max(LAGS), max(ROLLING_WINDOWS) + 1)
+
+# Escalate to a full retrain when more than this share of the new rows belongs to items the model has never seen
+MAX_UNSEEN_SHARE = 0.05
+
+# ... or falls outside the range the scalers were fitted on
+MAX_OUT_OF_RANGE_SHARE = 0.05
+
+# ... or when the model's error on the new rows is this many times its error at the last full training
+DRIFT_RATIO = 2.0
+
+
+def keep_last_rows(data, rows):
+    return data.sort_values(['Name', 'Date'], kind='stable').groupby('Name', sort=False).tail(rows)
+
+
+def load_recent_rows(path, since, context_rows=CONTEXT_ROWS, chunksize=500000):
+    # Rows dated after `since`, plus the last few rows of every item before it, read in chunks so
+    # the full history never has to be in memory
+    context = pd.DataFrame()
+    new = []
+    for chunk in pd.read_csv(path, chunksize=chunksize):
+        chunk['Date'] = pd.to_datetime(chunk['Date'])
+        after = chunk['Date'] > since
+        new.append(chunk[after])
+        context = keep_last_rows(pd.concat([context, chunk[~after]]), context_rows)
+    return context, pd.concat(new, ignore_index=True)
+
+
+def build_new_features(context, new, schema, since):
+    # The daily features of the new rows only, with their lags taken from the context rows. The few rows of
+    # unseen items incremental_update tolerates are left for the next full retrain
+    data = pd.concat([context, new], ignore_index=True)
+    data = schema.transform(data[data['Name'].isin(schema.items)])
+    X, y = build_horizon(data, 'Day', None, schema.encoding)
+    schema.check('Day', X.columns)
+    keep = X.index > since
+    return X[keep], y[keep]
+
+
+def price_mse(model, X, y, scaler_price):
+    predictions = scaler_price.inverse_transform(model.predict(model_inputs(model, X), verbose=0))
+    actual = scaler_price.inverse_transform(y.reshape(-1, 1))
+    return float(np.mean((predictions - actual) ** 2))
+
+
+def incremental_update(model_dir='model', path='../data/daily.csv', max_steps=200, batch_size=32, drift_ratio=DRIFT_RATIO):
+    # Fine-tune the saved model on the rows scraped since it was last trained. Returns 'current' when
+    # there is nothing new, 'updated' after fine-tuning, or 'retrain' when a drift check calls for a full retrain
+    start = time.perf_counter()
+    schema, metadata = load_schema(model_dir)
+    since = pd.Timestamp(metadata['trained_until'])
+    context, new = load_recent_rows(path, since)
+    if new.empty:
+        logger.info(f"No rows after {since}, the model is up to date")
+        return 'current'
+
+    # Items the schema has no column or embedding row for can only be learned by a full retrain
+    unseen = (~new['Name'].isin(schema.items)).mean()
+    if unseen > MAX_UNSEEN_SHARE:
+        logger.warning(f"{unseen:.1%} of the new rows are items the model has never seen, retraining from scratch")
+        return 'retrain'
+
+    X, y = build_new_features(context, new, schema, since)
+    if X.empty:
+        logger.info(f"No new rows with enough history for their features after {since}")
+        return 'current'
+
+    # Prices or volumes outside the fitted range mean the scalers are stale
+    out_of_range = np.mean((y < 0) | (y > 1) | (X['Total Volume'] < 0) | (X['Total Volume'] > 1))
+    if out_of_range > MAX_OUT_OF_RANGE_SHARE:
+        logger.warning(f"{out_of_range:.1%} of the new rows fall outside the scalers' range, retraining from scratch")
+        return 'retrain'
+
+    model = load_bundle(model_dir)[0]
+    X = X.astype('float32')
+    y = np.asarray(y, dtype='float32')
+    mse_before = price_mse(model, X, y, schema.scaler_price)
+    reference = metadata.get('reference_mse')
+    if reference and mse_before > drift_ratio * reference:
+        logger.warning(f"Error on the new rows ({mse_before:.4f}) is over {drift_ratio}x the reference ({reference:.4f}), retraining from scratch")
+        return 'retrain'
+
+    # A bounded number of optimizer steps over the new rows: several epochs when they are few, a random
+    # sample of max_steps batches when even one epoch would take more steps than that
+    X_fit, y_fit = X, y
+    if len(X) > max_steps * batch_size:
+        sample = np.sort(np.random.default_rng(0).choice(len(X), max_steps * batch_size, replace=False))
+        X_fit, y_fit = X.iloc[sample], y[sample]
+    steps_per_epoch = math.ceil(len(X_fit) / batch_size)
+    epochs = max(1, max_steps // steps_per_epoch)
+    model.fit(model_inputs(model, X_fit), y_fit, epochs=epochs, batch_size=batch_size, verbose=0)
+    mse_after = price_mse(model, X, y, schema.scaler_price)
+
+    # The reference error stays the one from the last full training, so drift cannot creep in update by update
+    metadata = {
+        **metadata,
+        'trained_until': str(X.index.max()),
+        'incremental_updates': metadata.get('incremental_updates', 0) + 1,
+    }
+    save_bundle(model_dir, model, schema, metadata)
+    logger.info(f"Fine-tuned on {len(X)} new rows after {since} for {epochs * steps_per_epoch} steps in "
+                f"{time.perf_counter() - start:.1f}s, price MSE {mse_before:.4f} -> {mse_after:.4f}")
+    return 'updated'
@@ -0,0 +1,255 @@
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import argparse
+import threading
+import queue
+import json
+import time
+import sys
+import os
+
+import numpy as np
+import pandas as pd
+import tensorflow as tf
+
+# data_preprocessing records into the shared instrumentation module in utils/
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'utils'))
+
+from artifacts import load_bundle  # noqa: E402
+from instrumentation import get_logger  # noqa: E402
+
+logger = get_logger(__name__)
+
+# Activations the NumPy forward pass knows how to apply
+NUMPY_ACTIVATIONS = {
+    'relu': lambda x: np.maximum(x, 0, out=x),
+    'linear': lambda x: x,
+}
+
+
+class NumpyForward:
+    # The Dense stack (and item embedding) replayed with NumPy matrix products - for a model this small,
+    # far cheaper per call than going through TensorFlow at all
+    def __init__(self, model):
+        self.embedding = None
+        self.layers = []
+        for layer in model.layers:
+            kind = type(layer).__name__
+            if kind == 'Embedding':
+                self.embedding = layer.get_weights()[0].astype(np.float32)
+            elif kind == 'Dense':
+                activation = layer.get_config()['activation']
+                if activation not in NUMPY_ACTIVATIONS:
+                    raise ValueError(f"Unsupported activation: {activation}")
+                kernel, bias = layer.get_weights()
+                self.layers.append((kernel.astype(np.float32), bias.astype(np.float32), NUMPY_ACTIVATIONS[activation]))
+            elif kind not in ('InputLayer', 'Flatten', 'Concatenate'):
+                raise ValueError(f"Unsupported layer: {kind}")
+
+    def __call__(self, X):
+        if self.embedding is not None:
+            # Same layout as model_inputs: the item id first, then the numeric features
+            X = np.concatenate([X[:, 1:], self.embedding[X[:, 0].astype(np.int64)]], axis=1)
+        for kernel, bias, activation in self.layers:
+            X = activation(X @ kernel + bias)
+        return X
+
+
+def tensorflow_forward(model, width):
+    # One traced graph for every batch size, without the per-call setup of model.predict
+    two_inputs = len(model.inputs) > 1
+
+    @tf.function(input_signature=[tf.TensorSpec([None, width], tf.float32)])
+    def forward(X):
+        if two_inputs:
+            return model([X[:, 1:], tf.cast(X[:, :1], tf.int32)], training=False)
+        return model(X, training=False)
+
+    return lambda X: forward(X).numpy()
+
+
+class Predictor:
+    # Loads a model bundle once, then turns feature rows into prices with the scaler it was trained with
+    def __init__(self, model_dir='model', backend='numpy'):
+        self.model, self.schema, metadata = load_bundle(model_dir, compile=False)
+        self.scaler_price = self.schema.scaler_price
+        self.columns = self.schema.columns[metadata.get('horizon', 'Day')]
+        self.width = len(self.columns)
+
+        if backend == 'numpy':
+            self.forward = NumpyForward(self.model)
+        elif backend == 'tensorflow':
+            self.forward = tensorflow_forward(self.model, self.width)
+        else:
+            raise ValueError(f"Unknown backend: {backend}")
+        self.backend = backend
+
+        # Trace or allocate everything before the first real request
+        self.predict(np.zeros((1, self.width), dtype=np.float32))
+
+    def predict(self, X):
+        # Rows with named features, e.g. a frame from preprocess_data, are put in the trained column order
+        if isinstance(X, pd.DataFrame):
+            missing = [column for column in self.columns if column not in X.columns]
+            if missing:
+                raise ValueError(f"Missing features: {missing[:5]}")
+            X = X[self.columns]
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X[None, :]
+        if X.ndim != 2 or X.shape[1] != self.width:
+            raise ValueError(f"Expected rows of {self.width} features, got shape {X.shape}")
+        return self.scaler_price.inverse_transform(self.forward(X)).ravel()
+
+
+class MicroBatcher:
+    # Collects concurrent requests into one batch, up to max_batch_size rows or max_wait seconds
+    # after the first request arrived, and runs a single predict call for all of them. With max_wait=0
+    # it only takes what queued up while the previous batch ran, so a lone request never waits
+    def __init__(self, predict, max_batch_size=256, max_wait=0.0):
+        self.predict = predict
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.queue = queue.Queue()
+        self.batches = 0
+        self.rows = 0
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def submit(self, X):
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X[None, :]
+        future = Future()
+        self.queue.put((X, future))
+        return future
+
+    def collect(self, first):
+        batch = [first]
+        rows = len(first[0])
+        deadline = time.monotonic() + self.max_wait
+        while rows < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            try:
+                request = self.queue.get(timeout=timeout) if timeout > 0 else self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if request is None:
+                # Finish this batch, then stop
+                self.queue.put(None)
+                break
+            batch.append(request)
+            rows += len(request[0])
+        return batch
+
+    def run(self):
+        while True:
+            request = self.queue.get()
+            if request is None:
+                return
+            batch = self.collect(request)
+            try:
+                predictions = self.predict(np.concatenate([X for X, _ in batch]))
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            self.batches += 1
+            self.rows += len(predictions)
+            start = 0
+            for X, future in batch:
+                future.set_result(predictions[start:start + len(X)])
+                start += len(X)
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+
+
+class PredictionServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # The default backlog of 5 makes bursts of clients wait out a SYN retry
+    request_queue_size = 128
+
+
+def make_handler(predictor, batcher):
+    class PredictionHandler(BaseHTTPRequestHandler):
+        # POST /predict {"instances": [[feature, ...], ...]} -> {"prices": [...]},
+        # instances can also be {"column": value, ...} objects
+        # HTTP/1.1 keeps client connections open between requests, and without Nagle the small
+        # header and body writes go out at once instead of waiting for a delayed ACK
+        protocol_version = 'HTTP/1.1'
+        disable_nagle_algorithm = True
+
+        def send_json(self, status, body):
+            payload = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_GET(self):
+            if self.path == '/health':
+                self.send_json(200, {'status': 'ok', 'features': predictor.width, 'backend': predictor.backend})
+            else:
+                self.send_json(404, {'error': 'Not found'})
+
+        def do_POST(self):
+            if self.path != '/predict':
+                self.send_json(404, {'error': 'Not found'})
+                return
+            try:
+                body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+                instances = body['instances']
+                if instances and isinstance(instances[0], dict):
+                    instances = pd.DataFrame(instances).reindex(columns=predictor.columns)
+                    if instances.isna().any().any():
+                        raise ValueError(f"Every instance needs all {predictor.width} features")
+                instances = np.asarray(instances, dtype=np.float32)
+                if instances.ndim != 2 or instances.shape[1] != predictor.width:
+                    raise ValueError(f"Expected rows of {predictor.width} features, got shape {instances.shape}")
+                prices = batcher.submit(instances).result()
+            except (ValueError, KeyError, TypeError) as e:
+                self.send_json(400, {'error': str(e)})
+                return
+            self.send_json(200, {'prices': prices.tolist()})
+
+        def log_message(self, format, *args):
+            # One line per request would dominate the latency of small requests
+            pass
+
+    return PredictionHandler
+
+
+def serve(model_dir='model', host='127.0.0.1', port=8000, backend='numpy', max_batch_size=256, max_wait=0.0):
+    predictor = Predictor(model_dir, backend=backend)
+    batcher = MicroBatcher(predictor.predict, max_batch_size, max_wait)
+    server = PredictionServer((host, port), make_handler(predictor, batcher))
+    logger.info(f"Serving {model_dir} on http://{host}:{server.server_port}/predict")
+    return server, batcher
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve price predictions from a trained model')
+    parser.add_argument('--model', default='model', help='model bundle directory')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--backend', default='numpy', choices=['numpy', 'tensorflow'])
+    parser.add_argument('--max-batch-size', type=int, default=256)
+    parser.add_argument('--max-wait-ms', type=float, default=0.0)
+    args = parser.parse_args()
+
+    server, batcher = serve(args.model, args.host, args.port, args.backend, args.max_batch_size, args.max_wait_ms / 1000)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        batcher.close()
+
+
+if __name__ == '__main__':
+    main()
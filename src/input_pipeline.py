@@ -0,0 +1,220 @@
+from sklearn.preprocessing import MinMaxScaler
+import numpy as np
+import pandas as pd
+import pickle
+import shutil
+import zlib
+import json
+import math
+import os
+
+from data_preprocessing import HORIZONS, TEST_SIZE, ITEM_ID_COLUMN, FeatureSchema, SchemaMismatch, build_horizon
+from instrumentation import get_logger
+
+logger = get_logger(__name__)
+
+
+def bucket_of(names, buckets):
+    # Stable across runs and processes, unlike hash()
+    return np.fromiter((zlib.crc32(name.encode()) % buckets for name in names), dtype=np.int64, count=len(names))
+
+
+def partition_daily(path, directory, encoding, buckets=16, chunksize=500000, schema=None):
+    # First pass over daily.csv: fit the scalers (unless a saved schema provides them), collect the
+    # item names and split the rows into bucket files that each hold every row of a subset of the items
+    scaler_price = MinMaxScaler()
+    scaler_volume = MinMaxScaler()
+    names = set()
+    bucket_paths = [os.path.join(directory, f'bucket_{bucket}.csv') for bucket in range(buckets)]
+
+    for chunk in pd.read_csv(path, usecols=['Date', 'Average Price', 'Total Volume', 'Name'], chunksize=chunksize):
+        if schema is None:
+            scaler_price.partial_fit(chunk[['Average Price']])
+            scaler_volume.partial_fit(chunk[['Total Volume']])
+            names.update(chunk['Name'].unique())
+
+        for bucket, rows in chunk.groupby(bucket_of(chunk['Name'], buckets), sort=False):
+            rows.to_csv(bucket_paths[bucket], mode='a', header=not os.path.exists(bucket_paths[bucket]), index=False)
+
+    # Same categories, in the same order, as astype('category') on the whole frame
+    if schema is None:
+        schema = FeatureSchema(encoding, sorted(names), scaler_price, scaler_volume)
+    elif schema.encoding != encoding:
+        raise SchemaMismatch(f"Items are {encoding} encoded, the schema expects {schema.encoding}")
+    return [path for path in bucket_paths if os.path.exists(path)], schema
+
+
+class FeatureStore:
+    # The features of one horizon on disk: float32 X and y, the item code and date of every row,
+    # and the chronological order of the rows used for the train/test split
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, 'meta.json')) as f:
+            self.meta = json.load(f)
+        self.columns = self.meta['columns']
+        self.rows = self.meta['rows']
+        self.n_train = self.meta['n_train']
+        self.num_items = self.meta['num_items']
+
+        self.X = self.open('X', np.float32, (self.rows, len(self.columns)))
+        self.y = self.open('y', np.float32, (self.rows,))
+        self.order = self.open('order', np.int64, (self.rows,))
+
+    def open(self, name, dtype, shape):
+        if self.rows == 0:
+            return np.empty(shape, dtype=dtype)
+        return np.memmap(os.path.join(self.directory, f'{name}.bin'), dtype=dtype, mode='r', shape=shape)
+
+    def indices(self, split):
+        # Row numbers of a split, oldest first
+        if split == 'train':
+            return self.order[:self.n_train]
+        if split == 'test':
+            return self.order[self.n_train:]
+        raise ValueError(f"Unknown split: {split}")
+
+    def load(self, split):
+        # One split read fully into memory, in the same order as preprocess_data returns it
+        indices = np.asarray(self.indices(split))
+        return pd.DataFrame(self.X[indices], columns=self.columns), pd.Series(self.y[indices], name='Average Price')
+
+    def __len__(self):
+        return self.rows
+
+
+class ArrayWriter:
+    # Appends arrays to a raw binary file, so a horizon never has to fit in memory at once
+    def __init__(self, path, dtype):
+        self.file = open(path, 'wb')
+        self.dtype = dtype
+
+    def write(self, values):
+        self.file.write(np.ascontiguousarray(values, dtype=self.dtype).tobytes())
+
+    def close(self):
+        self.file.close()
+
+
+def write_horizon(bucket_paths, schema, horizon, freq, directory):
+    os.makedirs(directory, exist_ok=True)
+    writers = {
+        'X': ArrayWriter(os.path.join(directory, 'X.bin'), np.float32),
+        'y': ArrayWriter(os.path.join(directory, 'y.bin'), np.float32),
+        'dates': ArrayWriter(os.path.join(directory, 'dates.bin'), np.int64),
+        'codes': ArrayWriter(os.path.join(directory, 'codes.bin'), np.int32),
+    }
+    columns = None
+    rows = 0
+
+    for bucket_path in bucket_paths:
+        # round_trip parses the values exactly as they were read from daily.csv
+        data = pd.read_csv(bucket_path, float_precision='round_trip')
+        data['Date'] = pd.to_datetime(data['Date'])
+        data = schema.transform(data)
+
+        X, y = build_horizon(data, horizon, freq, schema.encoding)
+        schema.check(horizon, X.columns)
+        if columns is None:
+            columns = list(X.columns)
+
+        # build_horizon drops the names, so recover each row's item from its encoding
+        item_codes = item_codes_of(X, schema)
+        writers['X'].write(X.to_numpy(dtype=np.float32))
+        writers['y'].write(y.to_numpy(dtype=np.float32))
+        writers['dates'].write(X.index.to_numpy(dtype='datetime64[ns]').view(np.int64))
+        writers['codes'].write(item_codes)
+        rows += len(X)
+
+    for writer in writers.values():
+        writer.close()
+    if not rows:
+        # As in prepare_data, the store stays, empty, so the stores still line up with HORIZONS
+        logger.warning(f"Skipping the {horizon} horizon: no rows are left after the lags")
+
+    # preprocess_data sorts the whole horizon by date, keeping rows of the same date in item order
+    dates = np.fromfile(os.path.join(directory, 'dates.bin'), dtype=np.int64)
+    codes = np.fromfile(os.path.join(directory, 'codes.bin'), dtype=np.int32)
+    order = np.lexsort((codes, dates)).astype(np.int64)
+    order.tofile(os.path.join(directory, 'order.bin'))
+    last_date = str(pd.Timestamp(dates.max())) if rows else None
+
+    # Same split sizes as train_test_split(test_size=TEST_SIZE, shuffle=False)
+    n_test = math.ceil(rows * TEST_SIZE)
+    train_last_date = str(pd.Timestamp(dates[order[rows - n_test - 1]])) if rows > n_test else None
+    meta = {
+        'horizon': horizon,
+        'encoding': schema.encoding,
+        'columns': columns or [],
+        'rows': rows,
+        'n_train': rows - n_test,
+        'num_items': schema.num_items,
+        'last_date': last_date,
+        'train_last_date': train_last_date,
+    }
+    with open(os.path.join(directory, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+    return FeatureStore(directory)
+
+
+def item_codes_of(X, schema):
+    # The item code of every row of X
+    if schema.encoding == 'embedding':
+        return X[ITEM_ID_COLUMN].to_numpy(dtype=np.int32)
+    dummies = X[[f'Name_{name}' for name in schema.items]].to_numpy()
+    return dummies.argmax(axis=1).astype(np.int32)
+
+
+def build_feature_stores(path='../data/daily.csv', directory='../data/features', encoding='onehot', buckets=16, chunksize=500000, schema=None):
+    # Two passes over daily.csv with a bounded amount of it in memory at once: partition it by item,
+    # then build each horizon bucket by bucket into memory-mapped arrays
+    shutil.rmtree(directory, ignore_errors=True)
+    partitions = os.path.join(directory, 'partitions')
+    os.makedirs(partitions)
+
+    bucket_paths, schema = partition_daily(path, partitions, encoding, buckets, chunksize, schema)
+    stores = []
+    for horizon, freq in HORIZONS:
+        logger.info(f"Building {horizon.lower()} features")
+        stores.append(write_horizon(bucket_paths, schema, horizon, freq, os.path.join(directory, horizon.lower())))
+    shutil.rmtree(partitions)
+
+    with open(os.path.join(directory, 'schema.pkl'), 'wb') as f:
+        pickle.dump(schema, f)
+    return stores, schema
+
+
+def load_feature_stores(directory='../data/features'):
+    stores = [FeatureStore(os.path.join(directory, horizon.lower())) for horizon, _ in HORIZONS]
+    with open(os.path.join(directory, 'schema.pkl'), 'rb') as f:
+        schema = pickle.load(f)
+    return stores, schema
+
+
+def make_dataset(store, split, batch_size=32, shuffle_buffer=0, two_inputs=False, seed=None):
+    # Batches of rows read straight from the memory-mapped arrays
+    import tensorflow as tf
+
+    indices = store.indices(split)
+    width = len(store.columns)
+
+    def gather(positions):
+        rows = indices[positions]
+        return store.X[rows], store.y[rows]
+
+    dataset = tf.data.Dataset.range(len(indices))
+    if shuffle_buffer:
+        dataset = dataset.shuffle(shuffle_buffer, seed=seed, reshuffle_each_iteration=True)
+    dataset = dataset.batch(batch_size)
+
+    def read(positions):
+        X, y = tf.numpy_function(gather, [positions], [tf.float32, tf.float32])
+        X.set_shape([None, width])
+        y.set_shape([None])
+        return X, y
+
+    dataset = dataset.map(read, num_parallel_calls=tf.data.AUTOTUNE, deterministic=not shuffle_buffer)
+
+    # Same split of the item id from the numeric features as model_inputs
+    if two_inputs:
+        dataset = dataset.map(lambda X, y: ((X[:, 1:], tf.cast(X[:, :1], tf.int32)), y), num_parallel_calls=tf.data.AUTOTUNE)
+    return dataset.prefetch(tf.data.AUTOTUNE)
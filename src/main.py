@@ -1,30 +1,397 @@
-from model import create_and_evaluate_model, test_model
-from data_preprocessing import preprocess_data
-from visualization import plot_predictions, plot_loss
+import subprocess
+import importlib
+import argparse
+import sys
+import os
 
+# The shared instrumentation module lives in utils/, next to the scraper that uses it too
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'utils'))
 
-def main():
-    # Get preprocessed data
-    daily_data, weekly_data, monthly_data = preprocess_data()
+from instrumentation import get_logger, profiling, tracer  # noqa: E402
 
-    # Train a model on the daily data
-    print("Training Model:")
-    model, scaler_price, history = create_and_evaluate_model(daily_data)
+logger = get_logger('main')
+
+# The modules behind each subcommand - TensorFlow and matplotlib are only imported by the commands that use them
+COMMAND_MODULES = {
+    'preprocess': ['data_preprocessing', 'feature_cache'],
+    'train': ['data_preprocessing', 'feature_cache', 'model', 'visualization'],
+    'predict': ['data_preprocessing', 'feature_cache', 'inference'],
+    'backtest': ['data_preprocessing', 'feature_cache', 'backtesting', 'model_registry'],
+    'compare': ['data_preprocessing', 'feature_cache', 'model_registry'],
+    'plot': ['visualization'],
+    'bench': [],
+}
+
+# The names in model_registry.MODELS, listed here so parsing arguments does not import the registry
+MODEL_NAMES = ['mlp', 'last_value', 'rolling_mean', 'ridge', 'gradient_boosting']
+
+# Loss curves and test predictions of the last training run, read back by the plot command
+RESULTS_FILE = 'training_results.npz'
+
+BENCHMARKS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'benchmarks')
+
+
+def import_command(name):
+    for module in COMMAND_MODULES[name]:
+        importlib.import_module(module)
+
+
+def load_streamed_data(stores, scaler_price):
+    # Only the test splits are loaded into memory, in the (X_train, X_test, y_train, y_test, scaler) layout test_model takes
+    datasets = []
+    for store in stores:
+        X_test, y_test = store.load('test')
+        datasets.append((None, X_test, None, y_test, scaler_price))
+    return datasets
+
+
+def training_options(patience):
+    # Early stopping patience (0 turns it off) and where checkpoints go, so an interrupted run resumes
+    return {
+        'patience': patience or None,
+        'checkpoint_dir': os.getenv("CHECKPOINT_DIR", "checkpoints"),
+    }
+
+
+def load_features(encoding, schema=None, cache=True):
+    # Preprocessed features from the cache when daily.csv and the parameters are unchanged
+    if not cache:
+        from data_preprocessing import prepare_data
+        return prepare_data(encoding=encoding, schema=schema)
+    from feature_cache import cached_prepare_data
+    return cached_prepare_data(encoding=encoding, schema=schema, cache_dir=os.getenv("FEATURE_CACHE_DIR", "../data/feature_cache"))
+
+
+def saved_schema(model_dir):
+    # The scalers and columns of the saved model, so its data is preprocessed the same way instead of
+    # being refit - None without a bundle, or when the features have changed since it was saved
+    from artifacts import bundle_exists, load_schema
+    from data_preprocessing import SchemaMismatch
+
+    if not bundle_exists(model_dir):
+        return None
+    try:
+        schema, _ = load_schema(model_dir)
+    except SchemaMismatch as e:
+        logger.warning(f"{e} - the saved model in {model_dir} cannot be reused, its schema will be refit")
+        return None
+    return schema
+
+
+def refit_on_mismatch(build, schema):
+    # Features built with the saved schema, or with a freshly fitted one - and so a cold start - when the data
+    # no longer fits it, e.g. items the saved model has never seen. Returns them and whether to warm start
+    from data_preprocessing import SchemaMismatch
+
+    if schema is not None:
+        try:
+            return build(schema), True
+        except SchemaMismatch as e:
+            logger.warning(f"{e} - refitting the schema, which the saved model cannot be trained further with")
+    return build(None), False
+
+
+def train_all_horizons(args):
+    # One model per horizon and hyperparameter configuration, trained in parallel, compared in one table
+    from parallel_training import train_horizons
+
+    datasets, schema = load_features(args.encoding, cache=args.cache)
+    table = train_horizons(
+        datasets, schema, workers=args.workers or None, epochs=args.epochs, patience=args.patience or None,
+        model_dir=args.models_dir,
+    )
+    logger.info(f"\n{table.to_string(index=False)}")
+    table.to_csv('horizon_results.csv', index=False)
+    return table
+
+
+def evaluate_horizons(evaluate, datasets):
+    # (actual, predicted) of every horizon, empty for one prepare_data had no rows for
+    import numpy as np
+
+    results = {}
+    for horizon, data in zip(('day', 'week', 'month'), datasets):
+        results[horizon] = evaluate(horizon, data) if len(data[1]) else (np.empty(0), np.empty(0))
+    return results
+
+
+def save_results(path, history, results):
+    import numpy as np
+
+    # Only the MLP has loss curves
+    arrays = {'loss': history.history['loss'], 'val_loss': history.history['val_loss']} if history is not None else {}
+    for horizon, (y_true, y_pred) in results.items():
+        arrays[f'{horizon}_true'] = np.ravel(y_true)
+        arrays[f'{horizon}_pred'] = np.ravel(y_pred)
+    np.savez(path, **arrays)
+
+
+def preprocess(args):
+    # With a saved model, preprocessed the way it was trained, so in its encoding whatever --encoding says
+    schema = saved_schema(args.model_dir)
+    encoding = args.encoding
+    if schema is not None and schema.encoding != encoding:
+        logger.warning(f"The saved model in {args.model_dir} uses {schema.encoding} items, preprocessing with that instead of {encoding}")
+        encoding = schema.encoding
+    (datasets, _), _ = refit_on_mismatch(lambda schema: load_features(encoding, schema, args.cache), schema)
+    for horizon, (X_train, X_test, _, _, _) in zip(('Day', 'Week', 'Month'), datasets):
+        logger.info(f"{horizon:<6} train {X_train.shape}  test {X_test.shape}")
+
+
+def train_baseline(args):
+    # One of the registry's cheaper models, fitted on the daily data and evaluated like the MLP
+    from model_registry import evaluate_model, make_model
+    from visualization import PlotWorker, plot_predictions
+
+    (daily_data, weekly_data, monthly_data), schema = load_features(args.encoding, cache=args.cache)
+    logger.info(f"Fitting {args.model}:")
+    model = make_model(args.model).fit(daily_data[0], daily_data[2])
+
+    def evaluate(horizon, data):
+        _, X_test, _, y_test, scaler_price = data
+        actual, predicted, metrics = evaluate_model(model, X_test, y_test, scaler_price)
+        logger.info(f"{horizon:<6} MAE {metrics['MAE']:.4f}  MAPE {metrics['MAPE']:.2f}%  RMSE {metrics['RMSE']:.4f}")
+        return actual, predicted
+
+    logger.info("Making Predictions:")
+    results = evaluate_horizons(evaluate, (daily_data, weekly_data, monthly_data))
+    save_results(args.results, None, results)
+
+    if args.plot:
+        plots = PlotWorker()
+        plots.submit(plot_predictions, *results['day'], *results['week'], *results['month'])
+        plots.close()
+
+
+def train(args):
+    if args.parallel:
+        train_all_horizons(args)
+        return
+    if args.model != 'mlp':
+        train_baseline(args)
+        return
+
+    from model import create_and_evaluate_model, create_and_evaluate_model_streaming, test_model
+    from visualization import PlotWorker, plot_loss, plot_predictions
+
+    schema = saved_schema(args.model_dir)
+    warm_start = True
+
+    if args.incremental and schema is not None:
+        # Fine-tune on the rows scraped since the last run, unless a drift check asks for a full retrain
+        from incremental import incremental_update
+
+        if incremental_update(args.model_dir) != 'retrain':
+            return
+        schema = None
+        warm_start = False
+
+    if args.stream:
+        # Build the features on disk and stream the training batches from there
+        from input_pipeline import build_feature_stores
+
+        (stores, schema), fits = refit_on_mismatch(lambda schema: build_feature_stores(
+            encoding=args.encoding, directory=os.getenv("FEATURE_DIR", "../data/features"), schema=schema
+        ), schema)
+        warm_start = warm_start and fits
+        logger.info("Training Model:")
+        model, scaler_price, history = create_and_evaluate_model_streaming(
+            stores[0], schema, args.epochs, args.model_dir, warm_start=warm_start, **training_options(args.patience)
+        )
+        daily_data, weekly_data, monthly_data = load_streamed_data(stores, scaler_price)
+    else:
+        # Get preprocessed data, with items one-hot encoded or as ids for an embedding
+        ((daily_data, weekly_data, monthly_data), schema), fits = refit_on_mismatch(
+            lambda schema: load_features(args.encoding, schema, args.cache), schema
+        )
+        warm_start = warm_start and fits
+
+        # Train a model on the daily data
+        logger.info("Training Model:")
+        model, scaler_price, history = create_and_evaluate_model(
+            daily_data, schema, args.epochs, args.model_dir, warm_start=warm_start, **training_options(args.patience)
+        )
+
+    # Plots render in the background (or open at the end, with a display) while evaluation goes on
+    plots = PlotWorker()
+    if args.plot:
+        plots.submit(plot_loss, history)
 
-    # Plot the loss for each epoch
-    plot_loss(history)
-    
     # Make predictions for daily, weekly, and monthly data
-    print("\nMaking Predictions:")
-    y_true_day, y_pred_day = test_model(model, *daily_data)
-    y_true_week, y_pred_week = test_model(model, *weekly_data)
-    y_true_month, y_pred_month = test_model(model, *monthly_data)
+    logger.info("Making Predictions:")
+    results = evaluate_horizons(lambda horizon, data: test_model(model, *data), (daily_data, weekly_data, monthly_data))
+    save_results(args.results, history, results)
+
+    if args.plot:
+        plots.submit(plot_predictions, *results['day'], *results['week'], *results['month'])
+    plots.close()
+
+
+def predict(args):
+    import numpy as np
+    import pandas as pd
+    from inference import Predictor
+
+    predictor = Predictor(args.model_dir, backend=args.backend)
+    if args.input:
+        # Feature rows with named columns, e.g. written out by another tool
+        rows = pd.read_csv(args.input)
+        rows['Predicted Price'] = predictor.predict(rows)
+        if args.output:
+            rows.to_csv(args.output, index=False)
+        else:
+            logger.info(f"\n{rows['Predicted Price'].to_string()}")
+        return
+
+    # Without an input file, predict the daily test split, preprocessed with the model's own schema
+    datasets, _ = load_features(predictor.schema.encoding, predictor.schema, args.cache)
+    _, X_test, _, y_test, scaler_price = datasets[0]
+    predictions = predictor.predict(X_test)
+    actual = scaler_price.inverse_transform(np.asarray(y_test).reshape(-1, 1)).ravel()
+    logger.info(f"First 25 predictions: {predictions[:25]}")
+    logger.info(f"First 25 actual values: {actual[:25]}")
+    logger.info(f"Test MAE {np.mean(np.abs(predictions - actual)):.4f} over {len(actual)} rows")
+
+
+def backtest(args):
+    # Walk-forward evaluation over several cutoffs instead of the single 80/20 split
+    from backtesting import backtest as run_backtest, summarize
+
+    datasets, schema = load_features(args.encoding, cache=args.cache)
+    folds, items = run_backtest(
+        datasets, schema, args.folds, args.horizons, args.model, workers=args.workers or None, epochs=args.epochs,
+        patience=args.patience or None, window=args.window or None,
+    )
+    logger.info(f"\n{folds.to_string(index=False)}\n{summarize(folds).to_string()}")
+    logger.info(f"Worst items:\n{items.groupby('Horizon', sort=False).head(5).to_string(index=False)}")
+    folds.to_csv('backtest_folds.csv', index=False)
+    items.to_csv('backtest_items.csv', index=False)
+
+
+def compare(args):
+    # Every registered model on every horizon, with its accuracy and how long it took to fit and predict
+    from model_registry import compare_models
+
+    datasets, schema = load_features(args.encoding, cache=args.cache)
+    table = compare_models(datasets, schema, args.models, args.epochs, args.patience or None, args.horizons)
+    logger.info(f"\n{table.to_string(index=False)}")
+    table.to_csv('model_comparison.csv', index=False)
+
+
+def plot(args):
+    from types import SimpleNamespace
+    import numpy as np
+    from visualization import plot_loss, plot_predictions
+
+    results = np.load(args.results)
+
+    # Plot the loss for each epoch
+    if 'loss' in results.files:
+        plot_loss(SimpleNamespace(history={'loss': results['loss'], 'val_loss': results['val_loss']}))
 
     # Plot predictions
     plot_predictions(
-        y_true_day, y_pred_day, y_true_week, y_pred_week, y_true_month, y_pred_month
+        results['day_true'], results['day_pred'], results['week_true'], results['week_pred'], results['month_true'], results['month_pred']
     )
 
 
+def bench(args):
+    # Runs benchmarks/bench_<name>.py with the remaining arguments
+    script = os.path.join(BENCHMARKS_DIR, f'bench_{args.name}.py')
+    if not os.path.exists(script):
+        names = sorted(name[6:-3] for name in os.listdir(BENCHMARKS_DIR) if name.startswith('bench_') and name.endswith('.py'))
+        raise SystemExit(f"Unknown benchmark {args.name!r}, choose from: {', '.join(names)}")
+    return subprocess.call([sys.executable, script, *args.bench_args], cwd=BENCHMARKS_DIR)
+
+
+def add_feature_options(command):
+    command.add_argument('--encoding', default=os.getenv("ITEM_ENCODING", "onehot"), choices=['onehot', 'embedding'])
+    command.add_argument('--no-cache', dest='cache', action='store_false', default=os.getenv("FEATURE_CACHE", "1") != "0",
+                         help='always preprocess daily.csv instead of using the feature cache')
+    command.add_argument('--model-dir', default=os.getenv("MODEL_DIR", "model"))
+
+
+def add_training_options(command):
+    command.add_argument('--model', default=os.getenv("MODEL_TYPE", "mlp"), choices=MODEL_NAMES)
+    command.add_argument('--epochs', type=int, default=int(os.getenv("EPOCHS", "1000")))
+    command.add_argument('--patience', type=int, default=int(os.getenv("EARLY_STOPPING_PATIENCE", "20")), help='0 turns early stopping off')
+
+
+def build_parser():
+    # Flags default to the environment variables main has always read
+    parser = argparse.ArgumentParser(description='Steam market price models')
+    subparsers = parser.add_subparsers(dest='command')
+
+    command = subparsers.add_parser('preprocess', help='build (or load the cached) features')
+    add_feature_options(command)
+    command.set_defaults(handler=preprocess)
+
+    command = subparsers.add_parser('train', help='train the daily model and evaluate it on every horizon')
+    add_feature_options(command)
+    add_training_options(command)
+    command.add_argument('--stream', action='store_true', default=os.getenv("STREAM_TRAINING") == "1", help='stream batches from disk')
+    command.add_argument('--incremental', action='store_true', default=os.getenv("INCREMENTAL_TRAINING") == "1",
+                         help='fine-tune the saved model on the new rows')
+    command.add_argument('--parallel', action='store_true', default=os.getenv("PARALLEL_TRAINING") == "1",
+                         help='train every horizon and configuration in a process pool')
+    command.add_argument('--workers', type=int, default=int(os.getenv("TRAINING_WORKERS", "0")))
+    command.add_argument('--models-dir', default=os.getenv("MODELS_DIR", "models"))
+    command.add_argument('--results', default=RESULTS_FILE)
+    command.add_argument('--no-plot', dest='plot', action='store_false')
+    command.set_defaults(handler=train)
+
+    command = subparsers.add_parser('predict', help='predict prices with the saved model')
+    add_feature_options(command)
+    command.add_argument('--input', help='CSV of feature rows, instead of the daily test split')
+    command.add_argument('--output', help='CSV to write the rows and their predictions to')
+    command.add_argument('--backend', default='numpy', choices=['numpy', 'tensorflow'])
+    command.set_defaults(handler=predict)
+
+    command = subparsers.add_parser('backtest', help='walk-forward evaluation of every horizon over several cutoffs')
+    add_feature_options(command)
+    command.add_argument('--folds', type=int, default=4)
+    command.add_argument('--horizons', nargs='+', choices=['Day', 'Week', 'Month'])
+    command.add_argument('--window', type=int, default=0, help='train on only this many periods before each cutoff (0: all)')
+    add_training_options(command)
+    command.add_argument('--workers', type=int, default=int(os.getenv("TRAINING_WORKERS", "0")))
+    command.set_defaults(handler=backtest)
+
+    command = subparsers.add_parser('compare', help='fit every model on every horizon and compare accuracy and cost')
+    add_feature_options(command)
+    command.add_argument('--models', nargs='+', choices=MODEL_NAMES)
+    command.add_argument('--horizons', nargs='+', choices=['Day', 'Week', 'Month'])
+    command.add_argument('--epochs', type=int, default=int(os.getenv("EPOCHS", "1000")))
+    command.add_argument('--patience', type=int, default=int(os.getenv("EARLY_STOPPING_PATIENCE", "20")), help='0 turns early stopping off')
+    command.set_defaults(handler=compare)
+
+    command = subparsers.add_parser('plot', help='plot the loss and predictions of the last training run')
+    command.add_argument('--results', default=RESULTS_FILE)
+    command.set_defaults(handler=plot)
+
+    command = subparsers.add_parser('bench', help='run one of the benchmarks in ../benchmarks')
+    command.add_argument('name', help='e.g. startup for bench_startup.py')
+    command.add_argument('bench_args', nargs=argparse.REMAINDER)
+    command.set_defaults(handler=bench)
+
+    return parser
+
+
+def main(argv=None):
+    # Without a subcommand, main trains as it always has
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or (argv[0].startswith('-') and argv[0] not in ('-h', '--help')):
+        argv = ['train', *argv]
+
+    args = build_parser().parse_args(argv)
+    with profiling(), tracer.span(args.command):
+        result = args.handler(args)
+
+    # Where the run spent its time, also written to TRACE_FILE when set
+    if args.command != 'bench':
+        tracer.report()
+    tracer.close()
+    return result
+
+
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
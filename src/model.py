@@ -1,13 +1,22 @@
-from tensorflow.keras.callbacks import TensorBoard
-from tensorflow.keras.utils import plot_model
+from tensorflow.keras.callbacks import TensorBoard, EarlyStopping, BackupAndRestore, ModelCheckpoint
 import numpy as np
 import tensorflow as tf
 import os
 import datetime
+import time
+
+from instrumentation import get_logger, span
+from artifacts import bundle_exists, check_schema, load_bundle, load_schema, save_bundle
 
 os.environ['XLA_FLAGS'] = '--xla_gpu_cuda_data_dir=/home/blue/miniconda3/envs/tf/lib'
 
-def create_model(input_shape):
+logger = get_logger(__name__)
+
+def create_model(input_shape, num_items=None, embedding_dim=8, learning_rate=0.001):
+    # With num_items the first feature column is an item id that feeds a learned embedding
+    if num_items is not None:
+        return create_embedding_model(input_shape, num_items, embedding_dim, learning_rate)
+
     # Define the model
     model = tf.keras.models.Sequential([
         tf.keras.layers.Dense(64, activation='relu', input_shape=input_shape),
@@ -20,25 +29,133 @@ def create_model(input_shape):
     ])
 
     # Compile the model
-    model.compile(optimizer='adam', loss='mean_squared_error', metrics=[tf.keras.metrics.MeanAbsoluteError()])
+    model.compile(optimizer=tf.keras.optimizers.Adam(learning_rate), loss='mean_squared_error', metrics=[tf.keras.metrics.MeanAbsoluteError()])
+
+    return model
+
+
+def create_embedding_model(input_shape, num_items, embedding_dim=8, learning_rate=0.001):
+    # Numeric features and the item id come in as two inputs, see model_inputs
+    features = tf.keras.Input(shape=(input_shape[0] - 1,), name='features')
+    item_id = tf.keras.Input(shape=(1,), dtype='int32', name='item_id')
+
+    # The embedding replaces one dense input column per item
+    embedding = tf.keras.layers.Embedding(num_items, embedding_dim)(item_id)
+    x = tf.keras.layers.Concatenate()([features, tf.keras.layers.Flatten()(embedding)])
+    x = tf.keras.layers.Dense(64, activation='relu')(x)
+    x = tf.keras.layers.Dense(32, activation='relu')(x)
+    x = tf.keras.layers.Dense(32, activation='relu')(x)
+    x = tf.keras.layers.Dense(16, activation='relu')(x)
+    x = tf.keras.layers.Dense(8, activation='relu')(x)
+    x = tf.keras.layers.Dense(4, activation='relu')(x)
+    outputs = tf.keras.layers.Dense(1)(x)
+    model = tf.keras.Model(inputs=[features, item_id], outputs=outputs)
+
+    # Compile the model
+    model.compile(optimizer=tf.keras.optimizers.Adam(learning_rate), loss='mean_squared_error', metrics=[tf.keras.metrics.MeanAbsoluteError()])
 
     return model
 
 
-def train_model(model, X_train, y_train, X_test, y_test, epochs=1000):
+def model_inputs(model, X):
+    # Embedding models take the item id column separately from the numeric features
+    if len(model.inputs) == 1:
+        return X
+    X = np.asarray(X, dtype='float32')
+    return [X[:, 1:], X[:, :1].astype('int32')]
+
+
+def create_tensorboard(model, run_name=None):
     # Get the current time
     current_time = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
 
-    # Initialize TensorBoard with a log directory that includes the current time
-    log_dir = f'logs/{current_time}'
+    # Initialize TensorBoard with a log directory that includes the current time,
+    # and the run name when several models train at once
+    log_dir = f'logs/{current_time}' if run_name is None else f'logs/{current_time}-{run_name}'
     os.makedirs(log_dir, exist_ok=True)  # create the directory if it does not exist
     tensorboard = TensorBoard(log_dir=log_dir)
 
-    # Save the model architecture to a file
-    plot_model(model, to_file=os.path.join(log_dir, 'model.png'), show_shapes=True)
+    # Save the model architecture to a file, when pydot and graphviz are installed
+    try:
+        import pydot  # noqa: F401
+        from tensorflow.keras.utils import plot_model
+        plot_model(model, to_file=os.path.join(log_dir, 'model.png'), show_shapes=True)
+    except ImportError:
+        pass
+
+    return tensorboard
+
+
+class TrainingReport(tf.keras.callbacks.Callback):
+    # Times every epoch, so the end of training can report what early stopping saved
+    def __init__(self, epochs):
+        super().__init__()
+        self.epochs = epochs
+        self.epoch_times = []
+        self.first_epoch = None
+        self.last_epoch = None
+
+    def on_train_begin(self, logs=None):
+        self.start = time.perf_counter()
+
+    def on_epoch_begin(self, epoch, logs=None):
+        if self.first_epoch is None:
+            self.first_epoch = epoch
+        self.epoch_start = time.perf_counter()
+
+    def on_epoch_end(self, epoch, logs=None):
+        self.epoch_times.append(time.perf_counter() - self.epoch_start)
+        self.last_epoch = epoch
+
+    def on_train_end(self, logs=None):
+        if self.last_epoch is None:
+            logger.info(f"No epochs left to run out of {self.epochs}")
+            return
+        ran = self.last_epoch + 1
+        elapsed = time.perf_counter() - self.start
+        skipped = self.epochs - ran
+        saved = skipped * sum(self.epoch_times) / len(self.epoch_times)
+        if self.first_epoch:
+            logger.info(f"Resumed from epoch {self.first_epoch}")
+        logger.info(f"Trained {ran} of {self.epochs} epochs in {elapsed:.1f}s, "
+                    f"{skipped} epochs (~{saved:.1f}s) saved by early stopping")
+
+
+def training_callbacks(model, epochs, patience=None, checkpoint_dir=None, run_name=None):
+    callbacks = [create_tensorboard(model, run_name), TrainingReport(epochs)]
+
+    # Stop once val_loss has not improved for `patience` epochs and keep the best weights seen
+    if patience is not None:
+        callbacks.append(EarlyStopping(monitor='val_loss', patience=patience, restore_best_weights=True))
+
+    # A backup of the weights, optimizer state and epoch after every epoch, picked up again if
+    # training is restarted after a crash, plus the best model so far
+    if checkpoint_dir is not None:
+        os.makedirs(checkpoint_dir, exist_ok=True)
+        callbacks.append(BackupAndRestore(os.path.join(checkpoint_dir, 'backup')))
+        callbacks.append(ModelCheckpoint(os.path.join(checkpoint_dir, 'best.keras'), monitor='val_loss', save_best_only=True))
+
+    return callbacks
+
+
+def train_model(model, X_train, y_train, X_test, y_test, epochs=1000, patience=None, checkpoint_dir=None, batch_size=32, run_name=None, verbose='auto'):
+    callbacks = training_callbacks(model, epochs, patience, checkpoint_dir, run_name)
 
     # Train the model with TensorBoard callback
-    history = model.fit(X_train, y_train, epochs=epochs, validation_data=(X_test, y_test), callbacks=[tensorboard])
+    with span('fit', model='mlp', rows=len(X_train)):
+        history = model.fit(
+            model_inputs(model, X_train), y_train, epochs=epochs, batch_size=batch_size,
+            validation_data=(model_inputs(model, X_test), y_test), callbacks=callbacks, verbose=verbose,
+        )
+
+    return model, history
+
+
+def train_model_on_datasets(model, train_dataset, test_dataset, epochs=1000, patience=None, checkpoint_dir=None):
+    # Same as train_model, with batches streamed from tf.data datasets instead of arrays in memory
+    callbacks = training_callbacks(model, epochs, patience, checkpoint_dir)
+    with span('fit', model='mlp', streamed=True):
+        history = model.fit(train_dataset, epochs=epochs, validation_data=test_dataset, callbacks=callbacks)
 
     return model, history
 
@@ -48,12 +165,12 @@ def test_model(model,X_train, X_test,y_train, y_test, scaler_price):
     X_test = np.nan_to_num(X_test).astype('float32')
     y_test = np.nan_to_num(y_test).astype('float32')
 
-    # Evaluate the model
-    loss = model.evaluate(X_test, y_test)
-    print('Test loss:', loss)
-
-    # Make predictions
-    predictions = model.predict(X_test)
+    # Make predictions, and evaluate the model on them instead of a second pass with model.evaluate
+    with span('predict', model='mlp', rows=len(X_test)):
+        predictions = model.predict(model_inputs(model, X_test))
+    errors = predictions.ravel() - y_test
+    loss = [float(np.mean(errors ** 2)), float(np.mean(np.abs(errors)))]
+    logger.info(f'Test loss: {loss}')
 
     # Inverse transform the predictions and the actual values
     predictions = scaler_price.inverse_transform(predictions)
@@ -61,34 +178,85 @@ def test_model(model,X_train, X_test,y_train, y_test, scaler_price):
 
     return y_test, predictions
 
-def create_and_evaluate_model(data, epochs=1000, model_path='model.h5'):
+def training_metadata(trained_until, y_test, predictions):
+    # Saved with the bundle: the last date trained on, where incremental updates start, and the
+    # test error in prices, the reference their drift check compares against
+    return {
+        'horizon': 'Day',
+        'trained_until': str(trained_until),
+        'reference_mse': float(np.mean((np.ravel(predictions) - np.ravel(y_test)) ** 2)),
+    }
+
+
+def load_or_create_model(model_dir, schema, columns, num_items, horizon='Day', warm_start=True):
+    # Reuse the saved model only if it was trained on exactly these features, otherwise fail
+    # rather than silently predicting with the wrong scaling or columns
+    if warm_start and bundle_exists(model_dir):
+        saved_schema, metadata = load_schema(model_dir)
+        check_schema(saved_schema, schema, metadata.get('horizon', horizon), columns)
+        logger.info("Loading existing model")
+        return load_bundle(model_dir)[0]
+
+    logger.info("Creating new model")
+    return create_model([len(columns)], num_items)
+
+
+def create_and_evaluate_model(data, schema, epochs=1000, model_dir='model', patience=None, checkpoint_dir=None, warm_start=True):
     X_train, X_test, y_train, y_test, scaler_price = data
+    num_items = schema.num_items
     X_train = X_train.astype('float32')
-    y_train = y_train.astype('float32')
     X_test = X_test.astype('float32')
-    y_test = y_test.astype('float32')
+
+    # As arrays - Keras 3 cannot evaluate on arrays after validating on a pandas Series
+    y_train = np.asarray(y_train, dtype='float32')
+    y_test = np.asarray(y_test, dtype='float32')
+
+    # The model is only fitted on the training split, so incremental updates pick up from its end and
+    # still learn the test-period rows
+    trained_until = X_train.index.max()
 
     # Check if a trained model already exists
-    if os.path.exists(model_path):
-        print("Loading existing model")
-        model = tf.keras.models.load_model(model_path)
-    else:
-        print("Creating new model")
-        model = create_model([X_train.shape[1]])
-
-    model, history = train_model(model, X_train, y_train, X_test, y_test, epochs)
+    model = load_or_create_model(model_dir, schema, list(X_train.columns), num_items, warm_start=warm_start)
+
+    model, history = train_model(model, X_train, y_train, X_test, y_test, epochs, patience, checkpoint_dir)
     y_test, predictions = test_model(model,X_train, X_test, y_train, y_test, scaler_price)
 
-    print('Training loss:', history.history['loss'])
-    print('Validation loss:', history.history['val_loss'])
+    logger.info(f"Final training loss {history.history['loss'][-1]:.6f}, validation loss {history.history['val_loss'][-1]:.6f}")
+    logger.debug(f"Training loss: {history.history['loss']}")
+    logger.debug(f"Validation loss: {history.history['val_loss']}")
+    logger.debug(f"First 25 predictions: {predictions[:25].ravel()}")
+    logger.debug(f"First 25 actual values: {y_test[:25].ravel()}")
 
-    weights = model.get_weights()
-    print('Weights:', weights)
+    # Save the model together with the scalers and columns it was trained on
+    save_bundle(model_dir, model, schema, training_metadata(trained_until, y_test, predictions))
 
-    print('First 25 predictions:', predictions[:25])
-    print('First 25 actual values:', y_test[:25])   
+    return model, scaler_price, history
 
-    # Save the model
-    model.save(model_path)
 
-    return model, scaler_price, history
+def create_and_evaluate_model_streaming(store, schema, epochs=1000, model_dir='model', batch_size=32, shuffle_buffer=10000,
+                                        patience=None, checkpoint_dir=None, warm_start=True):
+    # Train from a FeatureStore on disk, so the training data never has to fit in memory
+    from input_pipeline import make_dataset
+
+    model = load_or_create_model(model_dir, schema, store.columns, store.num_items, warm_start=warm_start)
+
+    two_inputs = len(model.inputs) > 1
+    train_dataset = make_dataset(store, 'train', batch_size, shuffle_buffer, two_inputs)
+    test_dataset = make_dataset(store, 'test', batch_size, two_inputs=two_inputs)
+    model, history = train_model_on_datasets(model, train_dataset, test_dataset, epochs, patience, checkpoint_dir)
+
+    # The test split is a fifth of the data, small enough to evaluate in memory
+    X_test, y_test = store.load('test')
+    y_test, predictions = test_model(model, None, X_test, None, y_test, schema.scaler_price)
+
+    logger.info(f"Final training loss {history.history['loss'][-1]:.6f}, validation loss {history.history['val_loss'][-1]:.6f}")
+    logger.debug(f"Training loss: {history.history['loss']}")
+    logger.debug(f"Validation loss: {history.history['val_loss']}")
+    logger.debug(f"First 25 predictions: {predictions[:25].ravel()}")
+    logger.debug(f"First 25 actual values: {y_test[:25].ravel()}")
+
+    # Save the model together with the scalers and columns it was trained on, trained until the end of the training split
+    trained_until = store.meta.get('train_last_date', store.meta['last_date'])
+    save_bundle(model_dir, model, schema, training_metadata(trained_until, y_test, predictions))
+
+    return model, schema.scaler_price, history
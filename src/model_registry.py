@@ -0,0 +1,171 @@
+import time
+
+import numpy as np
+import pandas as pd
+
+from data_preprocessing import HORIZONS, ITEM_ID_COLUMN
+from backtesting import error_metrics
+from parallel_training import horizon_order
+from instrumentation import get_logger, span
+
+logger = get_logger(__name__)
+
+# Share of the training rows (the latest ones) the MLP holds out for early stopping
+VALIDATION_SHARE = 0.1
+
+
+def column_indices(columns, prefix):
+    matches = [index for index, column in enumerate(columns) if column.startswith(prefix)]
+    if not matches:
+        raise ValueError(f"No feature column starting with {prefix!r}")
+    return matches
+
+
+class RegressionModel:
+    # Every model fits on the preprocessed X and scaled y, and predicts scaled prices for rows of X
+    def __init__(self, num_items=None, epochs=1000, patience=20, config=None):
+        self.num_items = num_items
+        self.epochs = epochs
+        self.patience = patience
+        self.config = config or {}
+
+    def fit(self, X, y):
+        self.columns = list(X.columns)
+        return self
+
+    def predict(self, X):
+        raise NotImplementedError
+
+
+class LastValue(RegressionModel):
+    # The price of the previous period
+    def fit(self, X, y):
+        super().fit(X, y)
+        self.column = column_indices(self.columns, 'Avg Price Last ')[0]
+        return self
+
+    def predict(self, X):
+        return np.asarray(X, dtype=np.float64)[:, self.column]
+
+
+class RollingMean(RegressionModel):
+    # The mean price over the longest rolling window of earlier periods
+    def fit(self, X, y):
+        super().fit(X, y)
+        windows = column_indices(self.columns, 'Avg Price Mean ')
+        self.column = max(windows, key=lambda index: int(self.columns[index].split()[3]))
+        return self
+
+    def predict(self, X):
+        return np.asarray(X, dtype=np.float64)[:, self.column]
+
+
+class Ridge(RegressionModel):
+    # Linear regression on the lag features (and one-hot items), with a little L2 regularization
+    def fit(self, X, y):
+        from sklearn.linear_model import Ridge as SklearnRidge
+
+        super().fit(X, y)
+        # An item id is a label, not a quantity, so it has no place in a linear model
+        self.features = [index for index, column in enumerate(self.columns) if column != ITEM_ID_COLUMN]
+        self.model = SklearnRidge(alpha=self.config.get('alpha', 1.0)).fit(np.asarray(X, dtype=np.float64)[:, self.features], y)
+        return self
+
+    def predict(self, X):
+        return self.model.predict(np.asarray(X, dtype=np.float64)[:, self.features])
+
+
+class GradientBoosting(RegressionModel):
+    # Histogram gradient boosting, with the item id as a categorical feature when there are few enough items
+    def fit(self, X, y):
+        from sklearn.ensemble import HistGradientBoostingRegressor
+
+        super().fit(X, y)
+        X = np.asarray(X, dtype=np.float64)
+        categorical = None
+        if ITEM_ID_COLUMN in self.columns and X[:, self.columns.index(ITEM_ID_COLUMN)].max() < 255:
+            categorical = [self.columns.index(ITEM_ID_COLUMN)]
+        self.model = HistGradientBoostingRegressor(
+            max_iter=self.config.get('max_iter', 200), learning_rate=self.config.get('learning_rate', 0.1),
+            categorical_features=categorical, early_stopping=True, random_state=0,
+        ).fit(X, y)
+        return self
+
+    def predict(self, X):
+        return self.model.predict(np.asarray(X, dtype=np.float64))
+
+
+class MLP(RegressionModel):
+    # The Keras Dense stack from model.create_model, stopped early on the latest training rows
+    def fit(self, X, y):
+        from model import create_model, train_model
+
+        super().fit(X, y)
+        X = np.asarray(X, dtype=np.float32)
+        y = np.asarray(y, dtype=np.float32)
+        validation = max(1, int(len(X) * VALIDATION_SHARE))
+        self.model = create_model(
+            [X.shape[1]], self.num_items, self.config.get('embedding_dim', 8), self.config.get('learning_rate', 0.001)
+        )
+        self.model, self.history = train_model(
+            self.model, X[:-validation], y[:-validation], X[-validation:], y[-validation:], self.epochs, self.patience,
+            batch_size=self.config.get('batch_size', 32), run_name=self.config.get('run_name'), verbose=0,
+        )
+        return self
+
+    def predict(self, X):
+        # The whole set in one call
+        from model import model_inputs
+
+        return np.asarray(self.model.predict_on_batch(model_inputs(self.model, np.asarray(X, dtype=np.float32)))).ravel()
+
+
+MODELS = {
+    'mlp': MLP,
+    'last_value': LastValue,
+    'rolling_mean': RollingMean,
+    'ridge': Ridge,
+    'gradient_boosting': GradientBoosting,
+}
+
+
+def make_model(name, num_items=None, epochs=1000, patience=20, config=None):
+    if name not in MODELS:
+        raise ValueError(f"Unknown model {name!r}, choose from: {', '.join(MODELS)}")
+    return MODELS[name](num_items, epochs, patience, config)
+
+
+def evaluate_model(model, X_test, y_test, scaler_price):
+    # Price errors of a fitted model, with the time its predictions took
+    start = time.perf_counter()
+    with span('predict', model=type(model).__name__, rows=len(X_test)):
+        predictions = model.predict(X_test)
+    predict_seconds = time.perf_counter() - start
+
+    predicted = scaler_price.inverse_transform(np.asarray(predictions, dtype=np.float64).reshape(-1, 1)).ravel()
+    actual = scaler_price.inverse_transform(np.asarray(y_test, dtype=np.float64).reshape(-1, 1)).ravel()
+    metrics = error_metrics(actual, predicted)
+    metrics['RMSE'] = float(np.sqrt(np.mean((predicted - actual) ** 2))) if len(actual) else np.nan
+    return actual, predicted, {**metrics, 'Predict Seconds': round(predict_seconds, 4)}
+
+
+def compare_models(datasets, schema, names=None, epochs=1000, patience=20, horizons=None):
+    # Every model fitted on each horizon's training split and scored on its test split, most accurate first,
+    # so the table shows what the MLP buys over the baselines and at what cost
+    num_items = schema.num_items
+    rows = []
+    for (horizon, _), (X_train, X_test, y_train, y_test, scaler_price) in zip(HORIZONS, datasets):
+        # Horizons not asked for, and any prepare_data had no rows for
+        if horizons and horizon not in horizons or X_train.empty:
+            continue
+        for name in names or MODELS:
+            model = make_model(name, num_items, epochs, patience)
+            start = time.perf_counter()
+            with span('registry_fit', model=name, horizon=horizon, rows=len(X_train)):
+                model.fit(X_train, y_train)
+            fit_seconds = time.perf_counter() - start
+            _, _, metrics = evaluate_model(model, X_test, y_test, scaler_price)
+            rows.append({'Horizon': horizon, 'Model': name, 'Fit Seconds': round(fit_seconds, 4), **metrics})
+            logger.info(f"{horizon} {name}: MAE {metrics['MAE']:.4f} in {fit_seconds:.2f}s")
+
+    return pd.DataFrame(rows).sort_values(['Horizon', 'MAE'], key=horizon_order, ignore_index=True)
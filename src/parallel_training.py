@@ -0,0 +1,130 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import multiprocessing
+import itertools
+import time
+import os
+
+import numpy as np
+import pandas as pd
+
+from data_preprocessing import HORIZONS
+from instrumentation import get_logger
+
+logger = get_logger(__name__)
+
+# Hyperparameter configurations tried for every horizon
+DEFAULT_CONFIGS = [
+    {'learning_rate': 0.001, 'batch_size': 32, 'embedding_dim': 8},
+    {'learning_rate': 0.0003, 'batch_size': 64, 'embedding_dim': 16},
+]
+
+
+def init_worker(threads, tensorflow=True):
+    # TensorFlow reads its thread pool sizes once, before the first op runs, so set them first thing
+    os.environ['TF_NUM_INTRAOP_THREADS'] = str(threads)
+    os.environ['TF_NUM_INTEROP_THREADS'] = '1'
+    os.environ['OMP_NUM_THREADS'] = str(threads)
+    os.environ.setdefault('TF_CPP_MIN_LOG_LEVEL', '2')
+
+    # Workers fitting only the scikit-learn and numpy models never import TensorFlow
+    if not tensorflow:
+        return
+    import tensorflow as tf
+    tf.config.threading.set_intra_op_parallelism_threads(threads)
+    tf.config.threading.set_inter_op_parallelism_threads(1)
+
+
+def train_run(horizon, index, config, data, epochs, patience, model_dir, schema):
+    # One model for one horizon and configuration, in a worker process
+    from model import create_model, model_inputs, train_model
+    from artifacts import save_bundle
+
+    X_train, X_test, y_train, y_test, scaler_price = data
+    num_items = schema.num_items
+    X_train = X_train.astype('float32')
+    X_test = X_test.astype('float32')
+    y_train = y_train.astype('float32')
+    y_test = y_test.astype('float32')
+
+    run_name = f'{horizon.lower()}-{index}'
+    start = time.perf_counter()
+    model = create_model([X_train.shape[1]], num_items, config.get('embedding_dim', 8), config.get('learning_rate', 0.001))
+    model, history = train_model(
+        model, X_train, y_train, X_test, y_test, epochs, patience,
+        batch_size=config.get('batch_size', 32), run_name=run_name, verbose=0,
+    )
+    elapsed = time.perf_counter() - start
+
+    # Errors in prices rather than scaled values, so horizons compare directly
+    predictions = scaler_price.inverse_transform(model.predict(model_inputs(model, X_test), verbose=0))
+    actual = scaler_price.inverse_transform(y_test.to_numpy().reshape(-1, 1))
+    errors = predictions - actual
+
+    if model_dir is not None:
+        save_bundle(os.path.join(model_dir, run_name), model, schema, {'horizon': horizon, 'config': config})
+
+    return {
+        'Horizon': horizon,
+        'Config': index,
+        **config,
+        'Epochs': len(history.epoch),
+        'Best Val Loss': float(np.min(history.history['val_loss'])),
+        'Test MAE': float(np.mean(np.abs(errors))),
+        'Test RMSE': float(np.sqrt(np.mean(errors ** 2))),
+        'Train Rows': len(X_train),
+        'Seconds': round(elapsed, 2),
+        'PID': os.getpid(),
+    }
+
+
+def train_horizons(datasets, schema, configs=None, workers=None, epochs=1000, patience=20, model_dir=None):
+    # A separate model for every horizon and configuration, trained in parallel worker processes,
+    # each saved as a bundle under model_dir when one is given
+    configs = configs or DEFAULT_CONFIGS
+    runs = [
+        (horizon, index, config, data)
+        for (horizon, _), data in zip(HORIZONS, datasets)
+        for index, config in enumerate(configs)
+        # A horizon prepare_data had no rows for
+        if len(data[0])
+    ]
+    workers = workers or min(len(runs), os.cpu_count() or 1)
+
+    # Split the cores between the workers, so they do not oversubscribe the CPU
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    logger.info(f"Training {len(runs)} models on {workers} workers with {threads} TensorFlow threads each")
+
+    start = time.perf_counter()
+    results = []
+    if workers == 1:
+        init_worker(threads)
+        for horizon, index, config, data in runs:
+            results.append(train_run(horizon, index, config, data, epochs, patience, model_dir, schema))
+    else:
+        # Spawned, not forked - TensorFlow's runtime is not fork-safe
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(workers, mp_context=context, initializer=init_worker, initargs=(threads,)) as executor:
+            futures = [executor.submit(train_run, *run, epochs, patience, model_dir, schema) for run in runs]
+            for future in as_completed(futures):
+                result = future.result()
+                logger.info(f"Finished {result['Horizon']} config {result['Config']} in {result['Seconds']}s")
+                results.append(result)
+    elapsed = time.perf_counter() - start
+
+    table = pd.DataFrame(results).sort_values(['Horizon', 'Test RMSE'], key=horizon_order, ignore_index=True)
+    table.attrs['elapsed'] = elapsed
+    logger.info(f"Trained {len(runs)} models in {elapsed:.1f}s ({table['Seconds'].sum():.1f}s of training in total)")
+    return table
+
+
+def horizon_order(column):
+    # Day, Week, Month rather than alphabetical order
+    if column.name == 'Horizon':
+        return column.map({horizon: order for order, (horizon, _) in enumerate(HORIZONS)})
+    return column
+
+
+def config_grid(**values):
+    # Every combination of the given hyperparameter values, e.g. config_grid(learning_rate=[1e-3, 3e-4], batch_size=[32, 64])
+    keys = list(values)
+    return [dict(zip(keys, combination)) for combination in itertools.product(*values.values())]
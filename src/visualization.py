@@ -1,40 +1,118 @@
-import matplotlib.pyplot as plt
+from concurrent.futures import ThreadPoolExecutor
+import sys
+import os
+
+import matplotlib
 import numpy as np
 
+# Without a display (or with PLOT_HEADLESS=1) figures are rendered straight to PNG files in PLOT_DIR
+HEADLESS = os.getenv(
+    "PLOT_HEADLESS", "1" if sys.platform.startswith('linux') and not (os.getenv("DISPLAY") or os.getenv("WAYLAND_DISPLAY")) else "0"
+) == "1"
+PLOT_DIR = os.getenv("PLOT_DIR", "plots")
+
+if HEADLESS:
+    matplotlib.use('Agg')
+
+import matplotlib.pyplot as plt  # noqa: E402 - the backend has to be chosen first
+
+from instrumentation import get_logger  # noqa: E402
+
+logger = get_logger(__name__)
+
+# Above this many points a scatter is replaced by a hexbin density plot ('hexbin') or a stratified sample ('sample')
+MAX_POINTS = int(os.getenv("PLOT_MAX_POINTS", "20000"))
+LARGE_PLOTS = os.getenv("PLOT_LARGE", "hexbin")
+
+
+def finish(fig, name):
+    if not HEADLESS:
+        plt.show()
+        return None
+    os.makedirs(PLOT_DIR, exist_ok=True)
+    path = os.path.join(PLOT_DIR, name)
+    fig.savefig(path)
+    plt.close(fig)
+    logger.info(f"Saved {path}")
+    return path
+
+
 def plot_loss(history):
-    plt.figure(figsize=(10,6))
+    fig = plt.figure(figsize=(10,6))
     plt.plot(history.history['loss'])
     plt.plot(history.history['val_loss'])
     plt.title('Model loss')
     plt.ylabel('Loss')
     plt.xlabel('Epoch')
     plt.legend(['Train', 'Validation'], loc='upper right')
-    plt.show()
+    return finish(fig, 'loss.png')
+
+
+def stratified_sample(y_true, size, seed=0):
+    # One random point from each of `size` equally sized strata of the points sorted by actual value,
+    # so the sample covers the whole price range instead of just the dense low end
+    order = np.argsort(y_true, kind='stable')
+    positions = ((np.arange(size) + np.random.default_rng(seed).random(size)) * (len(y_true) / size)).astype(np.int64)
+    return order[positions]
+
+
+def plot_horizon(ax, y_true, y_pred, title):
+    y_true = np.ravel(y_true)
+    y_pred = np.ravel(y_pred)
+
+    if len(y_true) <= MAX_POINTS:
+        ax.scatter(y_true, y_pred, alpha=0.3)
+    elif LARGE_PLOTS == 'hexbin':
+        image = ax.hexbin(y_true, y_pred, gridsize=100, bins='log', mincnt=1, cmap='viridis')
+        ax.figure.colorbar(image, ax=ax, label='Points (log)')
+        title += f' ({len(y_true)} points)'
+    else:
+        sample = stratified_sample(y_true, MAX_POINTS)
+        ax.scatter(y_true[sample], y_pred[sample], alpha=0.3, s=8)
+        title += f' ({MAX_POINTS} of {len(y_true)} points)'
+
+    if len(y_true):
+        low, high = y_true.min(), y_true.max()
+        ax.plot([low, high], [low, high], 'r')
+    ax.set_title(title, loc='left')  # adjust title position here
+    ax.set_xlabel('Actual Values')
+    ax.set_ylabel('Predicted Values')
 
 
 def plot_predictions(y_true_day, y_pred_day, y_true_week, y_pred_week, y_true_month, y_pred_month):
     fig, axs = plt.subplots(3, figsize=(10, 18))
 
-    # Plot for day
-    axs[0].scatter(y_true_day, y_pred_day, alpha=0.3)
-    axs[0].plot([min(y_true_day), max(y_true_day)], [min(y_true_day), max(y_true_day)], 'r')
-    axs[0].set_title('Day Predictions', loc='left')  # adjust title position here
-    axs[0].set_xlabel('Actual Values')
-    axs[0].set_ylabel('Predicted Values')
-
-    # Plot for week
-    axs[1].scatter(y_true_week, y_pred_week, alpha=0.3)
-    axs[1].plot([min(y_true_week), max(y_true_week)], [min(y_true_week), max(y_true_week)], 'r')
-    axs[1].set_title('Week Predictions', loc='left')  # adjust title position here
-    axs[1].set_xlabel('Actual Values')
-    axs[1].set_ylabel('Predicted Values')
-
-    # Plot for month
-    axs[2].scatter(y_true_month, y_pred_month, alpha=0.3)
-    axs[2].plot([min(y_true_month), max(y_true_month)], [min(y_true_month), max(y_true_month)], 'r')
-    axs[2].set_title('Month Predictions', loc='left')  # adjust title position here
-    axs[2].set_xlabel('Actual Values')
-    axs[2].set_ylabel('Predicted Values')
+    plot_horizon(axs[0], y_true_day, y_pred_day, 'Day Predictions')
+    plot_horizon(axs[1], y_true_week, y_pred_week, 'Week Predictions')
+    plot_horizon(axs[2], y_true_month, y_pred_month, 'Month Predictions')
 
     plt.tight_layout()
-    plt.show()
+    return finish(fig, 'predictions.png')
+
+
+class PlotWorker:
+    # Renders headless plots on a background thread while training and evaluation carry on. pyplot is only
+    # ever used from that one thread; interactive windows have to open on the main thread, so there the
+    # plots are deferred until close()
+    def __init__(self):
+        self.executor = ThreadPoolExecutor(max_workers=1) if HEADLESS else None
+        self.futures = []
+        self.deferred = []
+
+    def submit(self, plot, *args):
+        if self.executor is None:
+            self.deferred.append((plot, args))
+        else:
+            self.futures.append(self.executor.submit(plot, *args))
+
+    def close(self):
+        # Waits for the rendering still running and re-raises its errors
+        for plot, args in self.deferred:
+            plot(*args)
+        self.deferred = []
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            paths = [future.result() for future in self.futures]
+            self.futures = []
+            return paths
+        return []
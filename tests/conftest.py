@@ -0,0 +1,10 @@
+import os
+import sys
+
+# The project modules live in src/ and utils/, the stub server and fixtures in benchmarks/, and they import each
+# other by bare module name
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for directory in ('src', 'utils', 'benchmarks'):
+    path = os.path.join(ROOT, directory)
+    if path not in sys.path:
+        sys.path.insert(0, path)
@@ -0,0 +1,58 @@
+import asyncio
+
+import pandas as pd
+import pytest
+
+from stub_server import start_stub
+from transport import Transport
+import scraper
+import crawler
+from crawler import RequestBudget, crawl
+from storage import MarketStore
+
+ITEMS = 12
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    # The scraper pointed at the stub server, with a fresh transport that does not rate limit
+    server = start_stub(items=ITEMS)
+    transport = Transport(rate_limits={endpoint: (1e6, 1e6) for endpoint in
+                                       ('search', 'listings', 'priceoverview', 'pricehistory', 'itemordershistogram', 'default')})
+    monkeypatch.setattr(scraper, 'STEAM_URL', server.base_url)
+    monkeypatch.setattr(scraper, 'transport', transport)
+    monkeypatch.setattr(crawler, 'transport', transport)
+    yield server
+    transport.close()
+    server.shutdown()
+    server.server_close()
+
+
+def run_crawl(store, budget=None):
+    links = scraper.iter_item_links(ITEMS, page_size=5)
+    return asyncio.run(crawl(scraper.DirectClient(), links, 'stub', workers=4, store=store, budget=budget))
+
+
+def test_crawl_against_stub(stub, tmp_path):
+    store = MarketStore(str(tmp_path / 'market.db'), str(tmp_path))
+    budget = RequestBudget()
+    items, daily, processed = run_crawl(store, budget)
+
+    # Every search result is its own item, in search order, found without the browser
+    assert list(items['Name']) == [f'Stub Item {index}' for index in range(ITEMS)]
+    assert stub.requests['listings'] == ITEMS
+    assert stub.requests['search'] == 3
+    assert 'browser' not in budget.summary()
+    assert len(processed) == ITEMS
+    assert daily['Date'].notna().all()
+    assert not daily.duplicated(['Name', 'Date']).any()
+
+    # The store and its CSV copy hold the same rows
+    stored = pd.read_csv(tmp_path / 'daily.csv')
+    assert len(stored) == len(daily)
+
+    # A second crawl only adds rows newer than what is stored - here none
+    _, daily_again, _ = run_crawl(store)
+    store.close()
+    assert daily_again.empty
+    assert len(pd.read_csv(tmp_path / 'daily.csv')) == len(daily)
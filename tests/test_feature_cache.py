@@ -0,0 +1,48 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from synthetic import write_daily_csv
+from data_preprocessing import prepare_data
+from feature_cache import cached_prepare_data, read_index
+
+
+@pytest.mark.parametrize('encoding', ['onehot', 'embedding'])
+def test_hit_returns_what_the_miss_did(tmp_path, encoding):
+    # Same values, dates, columns and dtypes from the miss that stores an entry and the hit that loads it,
+    # and the same values as prepare_data with X as the float32 the model trains on
+    path = write_daily_csv(str(tmp_path / 'daily.csv'), 10, 150)
+    cache_dir = str(tmp_path / 'cache')
+    expected, _ = prepare_data(path, encoding)
+    miss, _ = cached_prepare_data(path, encoding, cache_dir=cache_dir)
+    hit, _ = cached_prepare_data(path, encoding, cache_dir=cache_dir)
+
+    for fresh, stored, loaded in zip(expected, miss, hit):
+        for values, stored_values, loaded_values in zip(fresh[:4], stored[:4], loaded[:4]):
+            if isinstance(loaded_values, pd.DataFrame):
+                pd.testing.assert_frame_equal(stored_values, loaded_values)
+            else:
+                pd.testing.assert_series_equal(stored_values, loaded_values)
+            assert list(values.index) == list(loaded_values.index)
+            np.testing.assert_array_equal(np.asarray(values, dtype=loaded_values.to_numpy().dtype), loaded_values.to_numpy())
+        assert list(fresh[0].columns) == list(loaded[0].columns)
+
+
+def test_least_recently_used_entry_is_evicted_over_the_size_limit(tmp_path):
+    paths = [write_daily_csv(str(tmp_path / f'daily_{seed}.csv'), 10, 150, seed=seed) for seed in range(3)]
+    cache_dir = str(tmp_path / 'cache')
+    cached_prepare_data(paths[0], cache_dir=cache_dir)
+    entry_bytes = max(entry['bytes'] for entry in read_index(cache_dir)['entries'].values())
+
+    # Room for two entries; using the first again leaves the second as the least recently used
+    limits = {'cache_dir': cache_dir, 'max_bytes': int(entry_bytes * 2.5), 'max_entries': 10}
+    cached_prepare_data(paths[1], **limits)
+    cached_prepare_data(paths[0], **limits)
+    cached_prepare_data(paths[2], **limits)
+
+    entries = read_index(cache_dir)['entries']
+    inputs = {entry['input'] for entry in entries.values()}
+    assert inputs == {os.path.abspath(paths[0]), os.path.abspath(paths[2])}
+    assert sorted(entries) == sorted(name for name in os.listdir(cache_dir) if not name.endswith('.json'))
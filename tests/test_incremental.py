@@ -0,0 +1,75 @@
+import os
+
+import pytest
+
+from synthetic import make_daily_frame
+from artifacts import current_version, load_schema
+from incremental import incremental_update
+
+NEW_DAYS = 5
+
+
+@pytest.fixture
+def history(tmp_path, monkeypatch):
+    # A bundle trained on all but the last few days of daily.csv, in the data/ and work/ layout main expects
+    from bench_incremental import full_training
+
+    frame = make_daily_frame(10, 150)
+    cutoff = sorted(frame['Date'].unique())[-NEW_DAYS - 1]
+    (tmp_path / 'data').mkdir()
+    (tmp_path / 'work').mkdir()
+    monkeypatch.chdir(tmp_path / 'work')
+    frame[frame['Date'] <= cutoff].to_csv('../data/daily.csv', index=False)
+    full_training('../data/daily.csv', 'model', 'embedding', epochs=5)
+    return frame
+
+
+def write_new_rows(frame, change=None):
+    if change is not None:
+        frame = frame.copy()
+        later = frame['Date'] > sorted(frame['Date'].unique())[-NEW_DAYS - 1]
+        frame.loc[later] = change(frame.loc[later])
+    frame.to_csv('../data/daily.csv', index=False)
+
+
+DRIFT = {
+    'price jump': lambda rows: rows.assign(**{'Average Price': rows['Average Price'] * 3}),
+    'new items': lambda rows: rows.assign(Name=rows['Name'] + ' (new)'),
+    # Every price stays within the scalers' range, but belongs to another item
+    'prices swapped between items': lambda rows: rows.assign(**{'Average Price': rows['Average Price'].to_numpy()[::-1]}),
+}
+
+
+def test_new_rows_like_the_old_ones_are_fine_tuned(history):
+    frame = history
+    write_new_rows(frame)
+    assert incremental_update('model', '../data/daily.csv') == 'updated'
+    assert load_schema('model')[1]['incremental_updates'] == 1
+
+
+@pytest.mark.parametrize('name', DRIFT)
+def test_drift_asks_for_a_retrain(history, name):
+    frame = history
+    version = current_version('model')
+    write_new_rows(frame, DRIFT[name])
+    assert incremental_update('model', '../data/daily.csv') == 'retrain'
+    # The saved model is left alone for the full retrain
+    assert current_version('model') == version
+
+
+def test_train_refits_the_schema_after_drift(history):
+    # main's train --incremental falls through to a full retrain: a new schema, which learns the new items
+    import main
+
+    frame = history
+    write_new_rows(frame, DRIFT['new items'])
+    args = main.build_parser().parse_args([
+        'train', '--incremental', '--no-cache', '--no-plot', '--encoding', 'embedding', '--model-dir', 'model',
+        '--epochs', '1', '--patience', '0', '--results', 'results.npz',
+    ])
+    args.handler(args)
+
+    schema, metadata = load_schema('model')
+    assert any(name.endswith(' (new)') for name in schema.items)
+    assert 'incremental_updates' not in metadata
+    assert os.path.exists('results.npz')
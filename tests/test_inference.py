@@ -0,0 +1,77 @@
+import threading
+
+import numpy as np
+import pytest
+import requests
+
+from synthetic import write_daily_csv
+from data_preprocessing import prepare_data
+from inference import Predictor, serve
+
+
+@pytest.fixture(scope='module', params=['onehot', 'embedding'])
+def bundle(request, tmp_path_factory):
+    # A small model trained for one epoch and saved as a bundle, with the prices Keras predicts for its test split
+    from model import create_model, model_inputs
+    from artifacts import save_bundle
+
+    directory = tmp_path_factory.mktemp(request.param)
+    datasets, schema = prepare_data(write_daily_csv(str(directory / 'daily.csv'), 10, 150), request.param)
+    X_train, X_test, y_train, _, scaler_price = datasets[0]
+    model = create_model([X_train.shape[1]], schema.num_items)
+    model.fit(model_inputs(model, X_train.astype('float32')), y_train.astype('float32'), epochs=1, verbose=0)
+    model_dir = str(directory / 'model')
+    save_bundle(model_dir, model, schema, {'horizon': 'Day'})
+
+    X_test = X_test.astype('float32')
+    expected = scaler_price.inverse_transform(model.predict(model_inputs(model, X_test.to_numpy()), verbose=0)).ravel()
+    return model_dir, X_test, expected
+
+
+@pytest.fixture(scope='module')
+def server(bundle):
+    server, batcher = serve(bundle[0], port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f'http://127.0.0.1:{server.server_port}'
+    server.shutdown()
+    server.server_close()
+    batcher.close()
+
+
+def test_backends_predict_the_same_prices(bundle):
+    model_dir, X_test, expected = bundle
+    numpy_prices = Predictor(model_dir, backend='numpy').predict(X_test.to_numpy())
+    tensorflow_prices = Predictor(model_dir, backend='tensorflow').predict(X_test.to_numpy())
+    np.testing.assert_allclose(numpy_prices, expected, rtol=1e-4, atol=1e-4)
+    np.testing.assert_allclose(numpy_prices, tensorflow_prices, rtol=1e-4, atol=1e-4)
+
+
+def test_predict_takes_named_columns_in_any_order(bundle):
+    model_dir, X_test, expected = bundle
+    prices = Predictor(model_dir).predict(X_test[X_test.columns[::-1]])
+    np.testing.assert_allclose(prices, expected, rtol=1e-4, atol=1e-4)
+
+
+def test_http_predicts_rows_and_named_instances(bundle, server):
+    _, X_test, expected = bundle
+    for instances in (X_test[:5].to_numpy().tolist(), X_test[:5].to_dict(orient='records')):
+        response = requests.post(f'{server}/predict', json={'instances': instances})
+        assert response.status_code == 200
+        np.testing.assert_allclose(response.json()['prices'], expected[:5], rtol=1e-4, atol=1e-4)
+
+
+@pytest.mark.parametrize('body', [
+    {'rows': [[0.0]]},
+    {'instances': [[0.0, 1.0]]},
+    {'instances': [['a'] * 3]},
+    {'instances': [{'Total Volume': 1.0}]},
+])
+def test_http_rejects_bad_input_with_400(server, body):
+    response = requests.post(f'{server}/predict', json=body)
+    assert response.status_code == 400
+    assert 'error' in response.json()
+
+
+def test_http_rejects_invalid_json_with_400(server):
+    response = requests.post(f'{server}/predict', data=b'{"instances": [')
+    assert response.status_code == 400
@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+
+from synthetic import write_daily_csv
+from data_preprocessing import preprocess_data
+from input_pipeline import build_feature_stores, make_dataset
+
+
+@pytest.fixture(scope='module')
+def daily_csv(tmp_path_factory):
+    return write_daily_csv(str(tmp_path_factory.mktemp('daily') / 'daily.csv'), 20, 150)
+
+
+@pytest.mark.parametrize('encoding', ['onehot', 'embedding'])
+def test_streamed_splits_match_preprocess_data(daily_csv, tmp_path, encoding):
+    # The streamed splits hold exactly the rows preprocess_data returns, in the same order, whatever the buckets
+    datasets = preprocess_data(daily_csv, encoding)
+    stores, _ = build_feature_stores(daily_csv, str(tmp_path), encoding, buckets=3, chunksize=500)
+    for (X_train, X_test, y_train, y_test, _), store in zip(datasets, stores):
+        assert list(X_train.columns) == store.columns
+        for split, X, y in (('train', X_train, y_train), ('test', X_test, y_test)):
+            X_store, y_store = store.load(split)
+            np.testing.assert_array_equal(X.to_numpy(dtype=np.float32), X_store.to_numpy())
+            np.testing.assert_array_equal(y.to_numpy(dtype=np.float32), y_store.to_numpy())
+
+
+def test_streamed_epoch_has_the_in_memory_loss(daily_csv, tmp_path):
+    # One unshuffled epoch from the same weights sees the same batches, so ends on the same loss
+    from model import create_model, model_inputs
+
+    X_train, _, y_train, _, _ = preprocess_data(daily_csv, 'embedding')[0]
+    stores, schema = build_feature_stores(daily_csv, str(tmp_path), 'embedding')
+    model = create_model([X_train.shape[1]], schema.num_items)
+    weights = model.get_weights()
+    inputs = model_inputs(model, X_train.astype('float32'))
+    memory_loss = model.fit(inputs, y_train.to_numpy(dtype=np.float32), batch_size=64, epochs=1, shuffle=False, verbose=0).history['loss'][-1]
+
+    model.set_weights(weights)
+    model.optimizer = None
+    model.compile(optimizer='adam', loss='mean_squared_error')
+    dataset = make_dataset(stores[0], 'train', 64, two_inputs=True)
+    stream_loss = model.fit(dataset, epochs=1, shuffle=False, verbose=0).history['loss'][-1]
+    assert stream_loss == pytest.approx(memory_loss, rel=1e-4)
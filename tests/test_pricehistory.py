@@ -0,0 +1,56 @@
+from datetime import datetime
+import json
+import math
+import os
+
+import pytest
+
+from bench_pricehistory import make_pricehistory
+from stub_server import FIXTURES
+from scraper import process_pricehistory_data, process_pricehistory_data_loop
+
+
+def load_fixture_prices():
+    with open(os.path.join(FIXTURES, 'pricehistory.json')) as f:
+        return json.load(f)['prices']
+
+
+def assert_equivalent(expected, actual):
+    assert list(expected) == list(actual), 'dates differ'
+    for day in expected:
+        assert expected[day]['Total Volume'] == actual[day]['Total Volume'], f'volume differs on {day}'
+        assert math.isclose(expected[day]['Average Price'], actual[day]['Average Price'], rel_tol=1e-12), f'price differs on {day}'
+
+
+@pytest.mark.parametrize('last_date', [None, datetime(2023, 1, 1)])
+@pytest.mark.parametrize('rows', [1, 1000, 20000])
+def test_matches_loop_on_synthetic_history(rows, last_date):
+    data = make_pricehistory(rows)
+    assert_equivalent(process_pricehistory_data_loop(data, last_date), process_pricehistory_data(data, last_date))
+
+
+@pytest.mark.parametrize('last_date', [None, datetime(2020, 1, 1)])
+def test_matches_loop_on_recorded_history(last_date):
+    data = load_fixture_prices()
+    assert_equivalent(process_pricehistory_data_loop(data, last_date), process_pricehistory_data(data, last_date))
+
+
+def test_offsets_of_the_same_hour_are_merged():
+    # Two timezone offsets that land on the same hour are one entry, averaged over both, not the last one seen
+    data = [
+        ['Dec 06 2013 01: +0', 2.0, '3'],
+        ['Dec 06 2013 01: +1', 4.0, '5'],
+        ['Dec 07 2013 01: +0', 1.0, '1'],
+    ]
+    expected = {
+        'Dec 06 2013 01:': {'Average Price': 3.0, 'Total Volume': 8},
+        'Dec 07 2013 01:': {'Average Price': 1.0, 'Total Volume': 1},
+    }
+    assert process_pricehistory_data(data) == expected
+    assert process_pricehistory_data_loop(data) == expected
+
+
+def test_last_date_is_exclusive():
+    data = [['Dec 06 2013 01: +0', 2.0, '3'], ['Dec 07 2013 01: +0', 1.0, '1']]
+    assert list(process_pricehistory_data(data, datetime(2013, 12, 6, 1))) == ['Dec 07 2013 01:']
+    assert process_pricehistory_data([]) == {}
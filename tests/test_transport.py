@@ -0,0 +1,92 @@
+import pytest
+import requests
+
+from stub_server import start_stub
+import transport as transport_module
+from transport import Transport
+
+MAX_RETRIES = 3
+
+
+@pytest.fixture
+def stub():
+    server = start_stub(items=5)
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    # The delays the transport waits between attempts, recorded instead of slept
+    delays = []
+    monkeypatch.setattr(transport_module.time, 'sleep', delays.append)
+    return delays
+
+
+@pytest.fixture
+def transport():
+    transport = Transport(rate_limits={'priceoverview': (1e6, 1e6)}, max_retries=MAX_RETRIES, backoff=0.5, max_backoff=10)
+    yield transport
+    transport.close()
+
+
+def get_priceoverview(transport, stub):
+    return transport.get(f'{stub.base_url}/market/priceoverview/?appid=730&market_hash_name=Stub')
+
+
+def test_429_waits_for_retry_after(stub, sleeps, transport):
+    stub.fail('priceoverview', 429, headers={'Retry-After': '7'})
+    response = get_priceoverview(transport, stub)
+
+    assert response.status_code == 200
+    assert sleeps == [7.0]
+    assert stub.requests['priceoverview'] == 2
+    assert transport.retries['priceoverview'] == 1
+    assert transport.statuses['priceoverview'] == {429: 1, 200: 1}
+
+
+def test_retry_after_is_capped_at_max_backoff(stub, sleeps, transport):
+    stub.fail('priceoverview', 429, headers={'Retry-After': '3600'})
+    assert get_priceoverview(transport, stub).status_code == 200
+    assert sleeps == [10]
+
+
+def test_5xx_backs_off_exponentially(stub, sleeps, transport):
+    stub.fail('priceoverview', 503, times=2)
+    stub.fail('priceoverview', 502)
+    response = get_priceoverview(transport, stub)
+
+    assert response.status_code == 200
+    assert stub.requests['priceoverview'] == 4
+    # backoff * 2 ** attempt, plus up to a quarter of that as jitter
+    assert len(sleeps) == 3
+    for attempt, delay in enumerate(sleeps):
+        assert 0.5 * 2 ** attempt <= delay <= 0.5 * 2 ** attempt * 1.25
+
+
+def test_gives_up_after_the_last_attempt(stub, sleeps, transport):
+    stub.fail('priceoverview', 500, times=MAX_RETRIES + 5)
+    response = get_priceoverview(transport, stub)
+
+    # The last error response is returned for the caller to handle, with no wait after it
+    assert response.status_code == 500
+    assert stub.requests['priceoverview'] == MAX_RETRIES + 1
+    assert len(sleeps) == MAX_RETRIES
+    assert transport.retries['priceoverview'] == MAX_RETRIES
+
+
+def test_other_errors_are_not_retried(stub, sleeps, transport):
+    stub.fail('priceoverview', 403)
+    assert get_priceoverview(transport, stub).status_code == 403
+    assert sleeps == []
+    assert stub.requests['priceoverview'] == 1
+
+
+def test_connection_errors_raise_after_the_last_attempt(sleeps):
+    transport = Transport(max_retries=1, backoff=0.5, timeout=1)
+    with pytest.raises(requests.ConnectionError):
+        transport.get('http://127.0.0.1:9/market/priceoverview/')
+    assert len(sleeps) == 1
+    assert transport.errors['priceoverview'] == 2
+    transport.close()
@@ -0,0 +1,97 @@
+import asyncio
+
+from instrumentation import get_logger, span
+from scraper import BLOCKED_RESOURCES, DISCOVERY_TIMEOUT, get_appid, parse_item_nameid
+
+logger = get_logger(__name__)
+
+
+class BrowserPool:
+    # One Chromium instance with a fixed number of contexts, each holding a page that is reused across links
+    def __init__(self, size=2, timeout=DISCOVERY_TIMEOUT):
+        self.size = size
+        self.timeout = timeout
+        self.playwright = None
+        self.browser = None
+        self.pages = None
+        self.lock = asyncio.Lock()
+
+    async def start(self):
+        # Launch lazily, so a crawl that only sees cached items never starts Chromium
+        async with self.lock:
+            if self.browser is not None:
+                return self
+
+            # Imported here, so crawls that never need the browser run without Playwright installed
+            from playwright.async_api import async_playwright
+
+            self.playwright = await async_playwright().start()
+            self.browser = await self.playwright.chromium.launch()
+
+            self.pages = asyncio.Queue()
+            for _ in range(self.size):
+                context = await self.browser.new_context()
+                page = await context.new_page()
+                self.pages.put_nowait(page)
+        return self
+
+    async def close(self):
+        if self.browser is not None:
+            await self.browser.close()
+        if self.playwright is not None:
+            await self.playwright.stop()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def get_item_id(self, link):
+        await self.start()
+
+        # Wait for a free page, then hand it back for the next link
+        page = await self.pages.get()
+        try:
+            with span('browser_discovery'):
+                item_nameid = await self.discover_item_nameid(page, link)
+        finally:
+            self.pages.put_nowait(page)
+
+        appid = get_appid(link)
+        logger.debug(f"Item nameid: {item_nameid}, appid: {appid}")
+        return item_nameid, appid
+
+    async def discover_item_nameid(self, page, link):
+        found = asyncio.get_running_loop().create_future()
+
+        # Define a callback function for the route
+        async def handle_route(route, request):
+            # Skip images, stylesheets and fonts
+            if request.resource_type in BLOCKED_RESOURCES:
+                await route.abort()
+                return
+
+            # The histogram request carries the item nameid - the histogram itself is fetched later
+            if 'itemordershistogram' in request.url:
+                if not found.done():
+                    found.set_result(parse_item_nameid(request.url))
+                await route.abort()
+                return
+
+            # Continue the request
+            await route.continue_()
+
+        # Start network interception
+        await page.route('**', handle_route)
+        try:
+            # Navigate to the item page and stop as soon as the histogram request shows up
+            await page.goto(link, wait_until='commit', timeout=self.timeout)
+            return await asyncio.wait_for(found, self.timeout / 1000)
+        except Exception as e:
+            logger.warning(f"Histogram request not seen for {link}: {e}")
+            return None
+        finally:
+            # Stop network interception and leave the page blank for the next link
+            await page.unroute('**', handle_route)
+            await page.goto('about:blank')
@@ -0,0 +1,214 @@
+from concurrent.futures import ThreadPoolExecutor
+from collections import Counter, defaultdict
+import pandas as pd
+import asyncio
+import os
+import traceback
+
+from browser_pool import BrowserPool
+from instrumentation import count, get_logger, span
+from nameid_cache import get_market_hash_name
+from scraper import (
+    get_appid,
+    get_listing_page,
+    parse_item_details,
+    parse_listing_item_nameid,
+    fill_order_summary,
+    get_priceoverview_data,
+    get_pricehistory_data,
+    get_histogram_data,
+    build_item_frames,
+    clean_data,
+    steam_headers,
+)
+from transport import transport
+
+logger = get_logger(__name__)
+
+
+class RequestBudget:
+    # Counts the requests each item costs, by kind (listing page, browser, API endpoints)
+    def __init__(self):
+        self.items = defaultdict(Counter)
+
+    def count(self, link, kind):
+        self.items[link][kind] += 1
+
+    def summary(self):
+        if not self.items:
+            return {}
+        totals = Counter()
+        for counts in self.items.values():
+            totals.update(counts)
+        per_item = {kind: total / len(self.items) for kind, total in totals.items()}
+        per_item['total'] = sum(totals.values()) / len(self.items)
+        per_item['max'] = max(sum(counts.values()) for counts in self.items.values())
+        return per_item
+
+
+class Crawler:
+    # Shared state of one crawl: the client, browser pool, item nameid cache, request budget and storage
+    def __init__(self, client, pool, sessionid, cache=None, budget=None, store=None):
+        self.client = client
+        self.pool = pool
+        self.sessionid = sessionid
+        self.cache = cache
+        self.budget = budget if budget is not None else RequestBudget()
+        self.store = store
+
+    async def resolve_item_id(self, link, html):
+        # Returns the item nameid, the appid and whether the id came from the cache
+        appid = get_appid(link)
+        market_hash_name = get_market_hash_name(link)
+        if self.cache is not None:
+            item_nameid = self.cache.get(appid, market_hash_name)
+            if item_nameid is not None:
+                return item_nameid, appid, True
+
+        # The listing page usually shows the id already, the browser is the last resort
+        item_nameid = parse_listing_item_nameid(html)
+        if item_nameid is None:
+            self.budget.count(link, 'browser')
+            item_nameid, appid = await self.pool.get_item_id(link)
+
+        if self.cache is not None and item_nameid is not None:
+            self.cache.put(appid, market_hash_name, item_nameid)
+        return item_nameid, appid, False
+
+    async def fetch_histogram(self, link, html, item_nameid, cached, headers):
+        self.budget.count(link, 'histogram')
+        histogram_data = await asyncio.to_thread(get_histogram_data, item_nameid, headers, self.client)
+        if histogram_data is None and cached:
+            # The histogram endpoint rejected the cached id - evict it and rediscover it
+            logger.warning(f"Cached item nameid {item_nameid} rejected for {link}")
+            self.cache.evict(get_appid(link), get_market_hash_name(link))
+            item_nameid, _, _ = await self.resolve_item_id(link, html)
+            self.budget.count(link, 'histogram')
+            histogram_data = await asyncio.to_thread(get_histogram_data, item_nameid, headers, self.client)
+        return histogram_data
+
+    def last_date(self, name):
+        # Latest daily row already stored for the item, read from the storage index
+        if self.store is None:
+            return None
+        return self.store.last_date(name)
+
+    async def fetch_item(self, link):
+        with span('item', link=link):
+            return await self.fetch_item_frames(link)
+
+    async def fetch_item_frames(self, link):
+        logger.debug(f"Processing link: {link}")
+        headers = steam_headers(self.sessionid)
+
+        # Load the listing page once and read the details and item nameid from it
+        self.budget.count(link, 'listing')
+        html = await asyncio.to_thread(get_listing_page, self.client, link)
+        if html is None:
+            raise RuntimeError(f"Failed to fetch listing page {link}")
+
+        details = parse_item_details(html)
+        name = details[0]
+        item_nameid, appid, cached = await self.resolve_item_id(link, html)
+
+        # The remaining endpoints only depend on the name, appid and item nameid
+        self.budget.count(link, 'priceoverview')
+        self.budget.count(link, 'pricehistory')
+        overview, pricehistory_data, histogram_data = await asyncio.gather(
+            asyncio.to_thread(get_priceoverview_data, name, appid, headers),
+            asyncio.to_thread(get_pricehistory_data, name, headers, appid),
+            self.fetch_histogram(link, html, item_nameid, cached, headers),
+        )
+        details = fill_order_summary(details, histogram_data)
+
+        item_df, daily_df, processed_df = build_item_frames(details, overview, pricehistory_data, histogram_data, self.last_date(name))
+        return clean_data(item_df, daily_df, processed_df)
+
+    async def crawl_link(self, link):
+        # Keep the same 3 attempts per link as the sequential crawl
+        for _ in range(3):
+            try:
+                return await self.fetch_item(link)
+            except Exception as e:
+                logger.warning(f"Failed to process link {link} due to {e}")
+                count('item_retries')
+                logger.debug(traceback.format_exc())
+        logger.error(f"Failed to process link {link} after {3} retries")
+        return None
+
+    def save(self, frames):
+        # Append the new rows as soon as an item is done, so a crash keeps what was crawled
+        if self.store is None:
+            return
+        item_df, daily_df, processed_df = frames
+
+        # Snapshots are kept over time, so stamp them with the time they were scraped
+        scraped_at = pd.Timestamp.now().floor('s')
+        self.store.append('items', item_df.assign(**{'Scraped At': scraped_at}))
+        self.store.append('daily', daily_df)
+        processed_df = processed_df.assign(Date=scraped_at)
+        self.store.append_order_books(processed_df['Name'], processed_df['Date'], processed_df['Order Book'])
+        self.store.append('processed', processed_df.drop(columns='Order Book'))
+
+    async def worker(self, queue, results):
+        while True:
+            entry = await queue.get()
+            if entry is None:
+                return
+            index, link = entry
+            results[index] = await self.crawl_link(link)
+            if results[index] is not None:
+                # SQLite and CSV writes block, so keep them off the event loop the other workers run on
+                await asyncio.to_thread(self.save, results[index])
+
+    async def produce(self, item_links, queue, workers):
+        # Pull links in a thread, so a paginating generator never blocks the event loop
+        loop = asyncio.get_running_loop()
+        iterator = iter(item_links)
+        index = 0
+        while True:
+            link = await loop.run_in_executor(None, next, iterator, None)
+            if link is None:
+                break
+            await queue.put((index, link))
+            index += 1
+
+        # One stop marker per worker
+        for _ in range(workers):
+            await queue.put(None)
+
+    async def crawl_links(self, item_links, workers):
+        # Links may come from a generator, so workers start on them as they arrive
+        queue = asyncio.Queue(maxsize=workers * 2)
+
+        # Start a bounded pool of workers that pull links off the queue
+        results = {}
+        tasks = [asyncio.create_task(self.worker(queue, results)) for _ in range(workers)]
+        await asyncio.gather(self.produce(item_links, queue, workers), *tasks)
+
+        # Keep the frames in link order, like the sequential crawl
+        frames = [results[index] for index in sorted(results) if results[index] is not None]
+        if not frames:
+            logger.warning("No item was crawled successfully")
+            return pd.DataFrame(), pd.DataFrame(), pd.DataFrame()
+        all_items_df = pd.concat([frame[0] for frame in frames], ignore_index=True)
+        all_daily_df = pd.concat([frame[1] for frame in frames], ignore_index=True)
+        all_processed_df = pd.concat([frame[2] for frame in frames], ignore_index=True)
+
+        return all_items_df, all_daily_df, all_processed_df
+
+
+async def crawl(client, item_links, sessionid, workers=8, browser_contexts=None, cache=None, budget=None, store=None):
+    # Every item runs up to 3 blocking requests at once, so size the thread pool to match
+    loop = asyncio.get_running_loop()
+    loop.set_default_executor(ThreadPoolExecutor(max_workers=workers * 3))
+    # ... and keep as many connections per host open as there are threads that may use them
+    transport.set_pool_size(max(transport.pool_size, workers * 3))
+
+    # Browser contexts used for item nameid discovery, started once for the whole crawl
+    if browser_contexts is None:
+        browser_contexts = int(os.getenv("BROWSER_CONTEXTS", str(min(workers, 4))))
+
+    async with BrowserPool(size=browser_contexts) as pool:
+        crawler = Crawler(client, pool, sessionid, cache=cache, budget=budget, store=store)
+        return await crawler.crawl_links(item_links, workers)
@@ -0,0 +1,182 @@
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+import contextvars
+import functools
+import threading
+import subprocess
+import tracemalloc
+import resource
+import logging
+import signal
+import shutil
+import json
+import time
+import sys
+import os
+
+# Spans and counters are appended to this JSONL file as they happen, one JSON object per line
+TRACE_FILE = os.getenv("TRACE_FILE")
+
+# Also track Python allocations per span with tracemalloc - noticeably slower, so off by default
+TRACE_MEMORY = os.getenv("TRACE_MEMORY") == "1"
+
+# DEBUG shows the per-request and per-item detail that used to be printed, WARNING only problems
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+
+# 'cprofile' writes a .prof file readable by pstats or snakeviz, 'py-spy' samples the process with py-spy
+PROFILER = os.getenv("PROFILER")
+PROFILE_FILE = os.getenv("PROFILE_FILE")
+
+# The innermost open span of the current thread or asyncio task, so spans record their parent
+current_span = contextvars.ContextVar('current_span', default=None)
+
+
+def get_logger(name):
+    # One handler on the root logger for the whole process, configured by the first module that asks
+    root = logging.getLogger()
+    if not root.handlers:
+        logging.basicConfig(level=LOG_LEVEL.upper(), format='%(asctime)s %(levelname)-7s %(name)s: %(message)s', stream=sys.stdout)
+    return logging.getLogger(name)
+
+
+def peak_rss():
+    # High-water mark of the process's resident memory in bytes (ru_maxrss is in KiB on Linux, bytes on macOS)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class Tracer:
+    # Timing spans, counters and memory high-water marks for one process
+    def __init__(self, path=TRACE_FILE, trace_memory=TRACE_MEMORY):
+        self.path = path
+        self.file = None
+        self.lock = threading.Lock()
+        self.counters = Counter()
+        self.durations = defaultdict(list)
+        self.trace_memory = trace_memory
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def write(self, record):
+        if self.path is None:
+            return
+        line = json.dumps(record, default=str)
+        with self.lock:
+            if self.file is None:
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+                self.file = open(self.path, 'a', buffering=1)
+            self.file.write(line + '\n')
+
+    @contextmanager
+    def span(self, name, **attributes):
+        # Times the block; the yielded dict takes attributes only known inside it, e.g. the bytes fetched
+        parent = current_span.get()
+        token = current_span.set(name)
+        start_time = time.time()
+        start = time.perf_counter()
+        status = 'ok'
+        try:
+            yield attributes
+        except BaseException as e:
+            status = type(e).__name__
+            raise
+        finally:
+            duration = time.perf_counter() - start
+            current_span.reset(token)
+            with self.lock:
+                self.durations[name].append(duration)
+            record = {
+                'type': 'span', 'name': name, 'parent': parent, 'start': start_time, 'duration': duration,
+                'status': status, 'pid': os.getpid(), 'thread': threading.current_thread().name,
+                'peak_rss': peak_rss(), **attributes,
+            }
+            if self.trace_memory:
+                record['traced_memory'], record['traced_peak'] = tracemalloc.get_traced_memory()
+            self.write(record)
+
+    def traced(self, name=None):
+        # Decorator form of span, named after the function unless a name is given
+        def decorate(func):
+            span_name = name or func.__qualname__
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.span(span_name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorate
+
+    def count(self, name, value=1):
+        with self.lock:
+            self.counters[name] += value
+
+    def summary(self):
+        with self.lock:
+            spans = {
+                name: {'count': len(durations), 'total': sum(durations), 'mean': sum(durations) / len(durations), 'max': max(durations)}
+                for name, durations in self.durations.items()
+            }
+            return {'spans': spans, 'counters': dict(self.counters), 'peak_rss': peak_rss()}
+
+    def report(self, logger=None):
+        # Where the time went, slowest span first, plus the counters - written to the trace as well
+        summary = self.summary()
+        self.write({'type': 'summary', 'pid': os.getpid(), 'time': time.time(), **summary})
+        log = (logger or get_logger(__name__)).info
+        for name, stats in sorted(summary['spans'].items(), key=lambda item: -item[1]['total']):
+            log(f"{name:<28} {stats['count']:7d} x  total {stats['total']:9.3f}s  mean {stats['mean'] * 1000:9.2f}ms  max {stats['max'] * 1000:9.2f}ms")
+        for name, value in sorted(summary['counters'].items()):
+            log(f"{name:<28} {value}")
+        log(f"{'peak rss':<28} {summary['peak_rss'] / 2**20:.1f} MiB")
+        return summary
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+
+# The process-wide tracer every module records into
+tracer = Tracer()
+span = tracer.span
+traced = tracer.traced
+count = tracer.count
+
+
+@contextmanager
+def profiling(profiler=PROFILER, path=PROFILE_FILE):
+    # Profiles the block with cProfile, or attaches py-spy to this process, when a profiler is chosen
+    if not profiler:
+        yield
+        return
+
+    if profiler == 'cprofile':
+        import cProfile
+
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            profile.dump_stats(path or 'profile.prof')
+            get_logger(__name__).info(f"Wrote cProfile stats to {path or 'profile.prof'}")
+        return
+
+    if profiler == 'py-spy':
+        if shutil.which('py-spy') is None:
+            raise RuntimeError("PROFILER=py-spy needs py-spy on the PATH (pip install py-spy)")
+        path = path or 'profile.speedscope.json'
+        # py-spy needs ptrace rights on this process, e.g. run as root or with kernel.yama.ptrace_scope=0
+        sampler = subprocess.Popen(['py-spy', 'record', '--pid', str(os.getpid()), '--format', 'speedscope', '--output', path])
+        try:
+            yield
+        finally:
+            # py-spy writes its profile when interrupted, not when terminated
+            sampler.send_signal(signal.SIGINT)
+            sampler.wait()
+            get_logger(__name__).info(f"Wrote py-spy profile to {path}")
+        return
+
+    raise ValueError(f"Unknown profiler: {profiler}")
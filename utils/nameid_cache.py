@@ -0,0 +1,72 @@
+from urllib.parse import unquote
+import sqlite3
+import threading
+
+from instrumentation import count
+
+
+def get_market_hash_name(link):
+    # Listing links look like .../market/listings/<appid>/<market_hash_name>
+    if '/listings/' not in link:
+        return None
+    parts = link.split('/listings/')[1].split('/')
+    if len(parts) < 2:
+        return None
+    return unquote(parts[1].split('?')[0])
+
+
+class NameidCache:
+    # The item_nameid of a market listing never changes, so it is kept on disk between crawls
+    def __init__(self, path='nameid_cache.db'):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS item_nameids ('
+            'appid TEXT NOT NULL, '
+            'market_hash_name TEXT NOT NULL, '
+            'item_nameid TEXT NOT NULL, '
+            'PRIMARY KEY (appid, market_hash_name))'
+        )
+        self.connection.commit()
+
+    def get(self, appid, market_hash_name):
+        with self.lock:
+            row = self.connection.execute(
+                'SELECT item_nameid FROM item_nameids WHERE appid = ? AND market_hash_name = ?',
+                (appid, market_hash_name),
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                count('nameid_cache_misses')
+                return None
+            self.hits += 1
+            count('nameid_cache_hits')
+            return row[0]
+
+    def put(self, appid, market_hash_name, item_nameid):
+        with self.lock:
+            self.connection.execute(
+                'INSERT OR REPLACE INTO item_nameids (appid, market_hash_name, item_nameid) VALUES (?, ?, ?)',
+                (appid, market_hash_name, item_nameid),
+            )
+            self.connection.commit()
+
+    def evict(self, appid, market_hash_name):
+        # Drop an id the histogram endpoint rejected so it is rediscovered
+        with self.lock:
+            self.connection.execute(
+                'DELETE FROM item_nameids WHERE appid = ? AND market_hash_name = ?',
+                (appid, market_hash_name),
+            )
+            self.connection.commit()
+            self.evictions += 1
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
+
+    def close(self):
+        self.connection.close()
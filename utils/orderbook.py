@@ -0,0 +1,78 @@
+import numpy as np
+
+# Distances from the mid price, in percent, at which book depth is measured
+DEPTH_PERCENTS = (1, 5, 10)
+
+SIDES = ('bid', 'ask')
+
+
+def parse_order_graph(graph):
+    # [[price, cumulative quantity, label], ...] -> float64 prices, int64 cumulative and per-level quantities
+    count = len(graph or [])
+    prices = np.fromiter((level[0] for level in graph or []), dtype=np.float64, count=count)
+    cumulative = np.fromiter((level[1] for level in graph or []), dtype=np.int64, count=count)
+    quantities = np.diff(cumulative, prepend=0)
+    return prices, cumulative, quantities
+
+
+def parse_order_book(histogram_data):
+    # Full depth of both sides of the book: bids are sorted best (highest) first, asks best (lowest) first
+    histogram_data = histogram_data or {}
+    book = {}
+    for side, key in (('bid', 'buy_order_graph'), ('ask', 'sell_order_graph')):
+        prices, cumulative, quantities = parse_order_graph(histogram_data.get(key))
+        book[f'{side}_price'] = prices
+        book[f'{side}_cumulative'] = cumulative
+        book[f'{side}_quantity'] = quantities
+    return book
+
+
+def order_book_features(book, depth_percents=DEPTH_PERCENTS):
+    bid_prices, bid_quantities = book['bid_price'], book['bid_quantity']
+    ask_prices, ask_quantities = book['ask_price'], book['ask_quantity']
+
+    best_bid = bid_prices[0] if len(bid_prices) else np.nan
+    best_ask = ask_prices[0] if len(ask_prices) else np.nan
+    mid_price = np.nanmean([best_bid, best_ask]) if len(bid_prices) or len(ask_prices) else np.nan
+    spread = best_ask - best_bid
+
+    # Quantity resting within N% of the mid price on each side, for every N at once
+    percents = np.asarray(depth_percents, dtype=np.float64)[:, None] / 100
+    bid_depth = (bid_prices[None, :] >= mid_price * (1 - percents)) @ bid_quantities
+    ask_depth = (ask_prices[None, :] <= mid_price * (1 + percents)) @ ask_quantities
+    total_depth = bid_depth + ask_depth
+    imbalance = np.divide(bid_depth - ask_depth, total_depth, out=np.full(len(depth_percents), np.nan), where=total_depth > 0)
+
+    features = {
+        'Best Bid': float(best_bid),
+        'Best Ask': float(best_ask),
+        'Mid Price': float(mid_price),
+        'Spread': float(spread),
+        'Relative Spread': float(spread / mid_price) if mid_price else np.nan,
+        'Bid Levels': len(bid_prices),
+        'Ask Levels': len(ask_prices),
+        'Bid Quantity': int(book['bid_cumulative'][-1]) if len(bid_prices) else 0,
+        'Ask Quantity': int(book['ask_cumulative'][-1]) if len(ask_prices) else 0,
+    }
+    for percent, bid, ask, ratio in zip(depth_percents, bid_depth, ask_depth, imbalance):
+        features[f'Bid Depth {percent}%'] = int(bid)
+        features[f'Ask Depth {percent}%'] = int(ask)
+        features[f'Imbalance {percent}%'] = float(ratio)
+    return features
+
+
+def pack_order_book(book):
+    # One row per snapshot, each array stored as a raw little-endian column
+    row = {}
+    for key, values in book.items():
+        row[key] = values.astype(values.dtype.newbyteorder('<')).tobytes()
+    return row
+
+
+def unpack_order_book(row):
+    book = {}
+    for side in SIDES:
+        book[f'{side}_price'] = np.frombuffer(row[f'{side}_price'], dtype='<f8')
+        book[f'{side}_cumulative'] = np.frombuffer(row[f'{side}_cumulative'], dtype='<i8')
+        book[f'{side}_quantity'] = np.frombuffer(row[f'{side}_quantity'], dtype='<i8')
+    return book
@@ -0,0 +1,180 @@
+from bs4 import BeautifulSoup
+import os
+
+# Fastest first - the first one that imports is used unless HTML_PARSER names another
+ENGINES = ('selectolax', 'lxml', 'html.parser')
+
+# Script and style blocks make up most of a listing page and never hold the values we read
+SKIPPED_BLOCKS = (('<script', '</script>'), ('<style', '</style>'))
+
+
+def css_to_xpath(selector):
+    # Only the simple '.class' and '#id' selectors the scraper uses are supported
+    if selector.startswith('.'):
+        return f"//*[contains(concat(' ', normalize-space(@class), ' '), ' {selector[1:]} ')]"
+    if selector.startswith('#'):
+        return f"//*[@id='{selector[1:]}']"
+    raise ValueError(f"Unsupported selector: {selector}")
+
+
+class SelectolaxEngine:
+    name = 'selectolax'
+
+    def __init__(self):
+        # Lexbor is the maintained backend, older releases only ship the Modest one
+        try:
+            from selectolax.lexbor import LexborHTMLParser as HTMLParser
+        except ImportError:
+            from selectolax.parser import HTMLParser
+        self.parser = HTMLParser
+
+    def parse(self, html):
+        return self.parser(html)
+
+    def select(self, doc, selector):
+        return doc.css(selector)
+
+    def text(self, node):
+        return node.text()
+
+    def attr(self, node, name):
+        return node.attributes.get(name)
+
+
+class LxmlEngine:
+    name = 'lxml'
+
+    def __init__(self):
+        import lxml.html
+        self.html = lxml.html
+
+    def parse(self, html):
+        # lxml refuses empty documents
+        return self.html.fromstring(html or '<html></html>')
+
+    def select(self, doc, selector):
+        return doc.xpath(css_to_xpath(selector))
+
+    def text(self, node):
+        return node.text_content()
+
+    def attr(self, node, name):
+        return node.get(name)
+
+
+class SoupEngine:
+    name = 'html.parser'
+
+    def parse(self, html):
+        return BeautifulSoup(html, 'html.parser')
+
+    def select(self, doc, selector):
+        return doc.select(selector)
+
+    def text(self, node):
+        return node.text
+
+    def attr(self, node, name):
+        return node.get(name)
+
+
+ENGINE_CLASSES = {
+    'selectolax': SelectolaxEngine,
+    'lxml': LxmlEngine,
+    'html.parser': SoupEngine,
+}
+
+engines = {}
+
+
+def available_engines():
+    names = []
+    for name in ENGINES:
+        try:
+            get_engine(name)
+            names.append(name)
+        except ImportError:
+            pass
+    return names
+
+
+def get_engine(name=None):
+    # Pick the requested engine, or the fastest one installed
+    name = name or os.getenv("HTML_PARSER")
+    if name is None:
+        for candidate in ENGINES:
+            try:
+                return get_engine(candidate)
+            except ImportError:
+                continue
+    if name not in engines:
+        engines[name] = ENGINE_CLASSES[name]()
+    return engines[name]
+
+
+def strip_blocks(html, start_tag, end_tag):
+    # Cut every start_tag ... end_tag block out of the page with plain string searches
+    parts = []
+    position = 0
+    while True:
+        start = html.find(start_tag, position)
+        if start == -1:
+            break
+        end = html.find(end_tag, start)
+        if end == -1:
+            break
+        parts.append(html[position:start])
+        position = end + len(end_tag)
+    parts.append(html[position:])
+    return ''.join(parts)
+
+
+def strip_page(html):
+    # Keep only the body markup, without the scripts and styles
+    body = html.find('<body')
+    if body != -1:
+        html = html[body:]
+    for start_tag, end_tag in SKIPPED_BLOCKS:
+        html = strip_blocks(html, start_tag, end_tag)
+    return html
+
+
+def select_text(engine, doc, selector):
+    nodes = engine.select(doc, selector)
+    if not nodes:
+        raise ValueError(f"No element matches {selector}")
+    return engine.text(nodes[0])
+
+
+def parse_item_links(results_html, engine=None):
+    engine = engine or get_engine()
+    doc = engine.parse(results_html)
+
+    # Extract item links
+    return [engine.attr(node, 'href') for node in engine.select(doc, '.market_listing_row_link')]
+
+
+def parse_promote_values(html, engine=None):
+    # Text of every 'market_commodity_orders_header_promote' element, in page order
+    engine = engine or get_engine()
+    doc = engine.parse(html)
+    return [engine.text(node) for node in engine.select(doc, '.market_commodity_orders_header_promote')]
+
+
+def parse_item_details(html, engine=None):
+    engine = engine or get_engine()
+    doc = engine.parse(strip_page(html))
+
+    # Extract the item details from the HTML
+    name = select_text(engine, doc, '.market_listing_item_name')
+    game = select_text(engine, doc, '.market_listing_game_name')
+    item_type_element = select_text(engine, doc, '#largeiteminfo_item_type')
+
+    # Extract the data from the 'market_commodity_orders_header_promote' elements
+    elements = [engine.text(node) for node in engine.select(doc, '.market_commodity_orders_header_promote')]
+    items_for_sale = elements[0] if len(elements) > 0 else None
+    sell_price = elements[1] if len(elements) > 1 else None
+    buy_requests = elements[2] if len(elements) > 2 else None
+    buy_price = elements[3] if len(elements) > 3 else None
+
+    return name, game, item_type_element, items_for_sale, sell_price, buy_requests, buy_price
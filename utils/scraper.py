@@ -1,15 +1,20 @@
-from scraper_api import ScraperAPIClient
-from playwright.sync_api import sync_playwright
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from bs4 import BeautifulSoup
 from collections import defaultdict
 from dotenv import load_dotenv
 import pandas as pd
-import requests
+import numpy as np
+import asyncio
 import os
 import re
 import json
-import traceback
+
+from orderbook import parse_order_book, order_book_features
+from instrumentation import get_logger, profiling, span, tracer
+import parsers
+from transport import STEAM_URL, transport
+
+logger = get_logger('scraper')
 
 # Get the username and password from environment variables
 load_dotenv()
@@ -19,6 +24,28 @@ sessionid = os.getenv("STEAM_LOGIN_SECURE")
 api_key = os.getenv("API_KEY")
 
 
+# Client used when no ScraperAPI key is configured - fetches pages directly
+class DirectClient:
+    def get(self, url, headers=None, **kwargs):
+        # ScraperAPI-only options such as render and premium are ignored
+        return transport.get(url, headers=headers)
+
+
+def get_client():
+    if api_key:
+        # Only needed with a ScraperAPI key, so crawls without one (e.g. against a local stub) work without it
+        from scraper_api import ScraperAPIClient
+
+        return ScraperAPIClient(api_key=api_key)
+    return DirectClient()
+
+
+def steam_headers(sessionid):
+    return {
+        'Cookie': f'steamLoginSecure={sessionid}'
+    }
+
+
 # Login to Steam - To get the cookies - To-Do
 def login(page):
     # Navigate to the login page
@@ -35,75 +62,76 @@ def login(page):
     page.wait_for_navigation()
 
 
-def get_item_links(client):
-    # Send a GET request to the ScrapingBee API
-    url = "https://steamcommunity.com/market/search/render/?query=&start=10&count=50&search_descriptions=0&sort_column=popular&sort_dir=desc"
-    response = requests.get(url)
-    # Check if the request was successful
-    if response.status_code == 200:
-        data = json.loads(response.text)
-        # Parse the HTML from the response
-        soup = BeautifulSoup(data['results_html'], 'html.parser')
+# Largest page the market search endpoint returns
+SEARCH_PAGE_SIZE = 100
 
-        # Get all item elements
-        item_elements = soup.select('.market_listing_row_link')
 
-        # Extract item links
-        item_links = [item['href'] for item in item_elements]
-        return item_links
+def get_search_page(start, count):
+    url = f"{STEAM_URL}/market/search/render/?query=&start={start}&count={count}&search_descriptions=0&sort_column=popular&sort_dir=desc"
+    response = transport.get(url)
+    # Check if the request was successful
+    if response.status_code == 200:
+        return json.loads(response.text)
     else:
-        print(f"Failed to fetch page: {response.text[:100]}")  # Only print the first 100 characters
+        logger.warning(f"Failed to fetch page: {response.text[:100]}")  # Only log the first 100 characters
+        return None
 
-        return []
 
+def iter_item_links(limit=None, page_size=SEARCH_PAGE_SIZE):
+    # Yield item links page by page, fetching the next page while the current one is parsed
+    yielded = 0
+    start = 0
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        future = executor.submit(get_search_page, start, page_size)
+        while future is not None:
+            data = future.result()
+            if not data or not data.get('results_html'):
+                return
 
+            # Stop at the item limit or at the end of the search results
+            start += page_size
+            total_count = data.get('total_count', 0)
+            future = None
+            if start < total_count and (limit is None or start < limit):
+                future = executor.submit(get_search_page, start, page_size)
 
+            with span('parse', kind='search'):
+                links = parsers.parse_item_links(data['results_html'])
+            for link in links:
+                if limit is not None and yielded >= limit:
+                    return
+                yield link
+                yielded += 1
 
-def get_item_id(link):
-    with sync_playwright() as p:
-        browser = p.chromium.launch()
-        page = browser.new_page()
 
-        # Define a list to store the item nameid and appid
-        item_nameid = [None]
-        appid = [None]
+def get_item_links(client, limit=None):
+    return list(iter_item_links(limit))
 
-        # Define a callback function for the route
-        def handle_route(route, request):
-            # Check if the request URL matches the expected pattern
-            if 'itemordershistogram' in request.url:
-                # Extract the item nameid from the URL
-                item_nameid[0] = request.url.split('item_nameid=')[1].split('&')[0]
-                
-            # Continue the request
-            route.continue_()
 
-        # Start network interception
-        page.route('**', handle_route)
+# Resource types the listing page does not need to reveal the item nameid
+BLOCKED_RESOURCES = {'image', 'stylesheet', 'font', 'media'}
 
-        # Navigate to the item page
-        page.goto(link)
+# How long to wait for the itemordershistogram request, in milliseconds
+DISCOVERY_TIMEOUT = 30000
 
-        if '/listings/' in link:
-            appid[0] = link.split('/listings/')[1].split('/')[0]
-        else:
-            print(f"Failed to find '/listings/' in {link}")
-            print(appid[0])
 
-        # Stop network interception
-        page.unroute('**')
+def get_appid(link):
+    if '/listings/' in link:
+        return link.split('/listings/')[1].split('/')[0]
+    logger.warning(f"Failed to find '/listings/' in {link}")
+    return None
 
-        browser.close()
-    print(f"Item nameid: {item_nameid[0]}, appid: {appid[0]}")
-    return item_nameid[0], appid[0]
 
+def parse_item_nameid(url):
+    # Extract the item nameid from an itemordershistogram request URL
+    return url.split('item_nameid=')[1].split('&')[0]
 
 
 def get_histogram_data(item_nameid, headers, client):
     
     # Define the histogram link
-    histogram_link = f"https://steamcommunity.com/market/itemordershistogram?country=US&language=english&currency=1&item_nameid={item_nameid}&two_factor=0"
-    print(f'histogram link: {histogram_link}, {item_nameid}')
+    histogram_link = f"{STEAM_URL}/market/itemordershistogram?country=US&language=english&currency=1&item_nameid={item_nameid}&two_factor=0"
+    logger.debug(f'histogram link: {histogram_link}, {item_nameid}')
     # Send a GET request to the histogram route with the headers
     response = client.get(histogram_link, headers=headers, premium=True)
 
@@ -111,74 +139,73 @@ def get_histogram_data(item_nameid, headers, client):
         # Parse the JSON response
         histogram_data = response.json()
 
-        return histogram_data
-    else:
-        print(f"Failed to get histogram data for item with nameid {item_nameid}")
-        return None
+        # Steam answers an unknown item nameid with success != 1
+        if histogram_data.get('success', 1) == 1:
+            return histogram_data
 
+    logger.warning(f"Failed to get histogram data for item with nameid {item_nameid}")
+    return None
 
-def process_histogram(histogram_data):
-    # If histogram_data is None, return empty lists
-    if histogram_data is None:
-        return {
-            "Buy Order Graph": [],
-            "Sell Order Graph": [],
-        }
 
-    # Extract data
-    buy_order_graph = histogram_data['buy_order_graph']
-    sell_order_graph = histogram_data['sell_order_graph']
+def process_histogram(histogram_data):
+    # Full order book as NumPy arrays of price, cumulative and per-level quantity for each side,
+    # plus the features derived from it
+    with span('parse', kind='histogram'):
+        book = parse_order_book(histogram_data)
+        return book, order_book_features(book)
 
-    # Ensure both lists are the same length
-    max_len = max(len(buy_order_graph), len(sell_order_graph))
-    buy_order_graph += [None] * (max_len - len(buy_order_graph))
-    sell_order_graph += [None] * (max_len - len(sell_order_graph))
 
-    processed_data = {
-        "Buy Order Graph": buy_order_graph,
-        "Sell Order Graph": sell_order_graph,
-    }
-    
-    return processed_data
+def get_listing_page(client, link):
+    # The listing page is the heaviest request of an item, so it is loaded exactly once
+    response = client.get(link, render=True, premium=True)
 
+    # Check if the request was successful
+    if response.status_code == 200:
+        return response.text
+    else:
+        logger.warning(f"Failed to fetch page: {response.text[:100]}")
+        return None
 
-def get_item_details(client, link, headers):
 
-    # Send a GET request to the ScrapingBee API
-    response = client.get(link,render=True, premium=True)
+def parse_item_details(html):
+    with span('parse', kind='listing'):
+        details = parsers.parse_item_details(html)
+    logger.debug(f'Name: {details[0]}')
+    return details
 
-    # Check if the request was successful
-    if response.status_code == 200:
-        # Parse the HTML from the response
-        soup = BeautifulSoup(response.text, 'html.parser')
 
-        # Extract the item details from the HTML
-        name = soup.select_one('.market_listing_item_name').text
-        print(f'Name: {name}')
-        game = soup.select_one('.market_listing_game_name').text
-        item_type_element = soup.select_one('#largeiteminfo_item_type').text
+def parse_listing_item_nameid(html):
+    # The listing page loads its order book with Market_LoadOrderSpread( <item_nameid> )
+    match = re.search(r'Market_LoadOrderSpread\(\s*(\d+)\s*\)', html)
+    return match.group(1) if match else None
 
-        # Get all elements with the class 'market_commodity_orders_header_promote'
-        elements = soup.select('.market_commodity_orders_header_promote')
 
-        # Extract the data from the elements
-        items_for_sale = elements[0].text if len(elements) > 0 else None
-        sell_price = elements[1].text if len(elements) > 1 else None
-        buy_requests = elements[2].text if len(elements) > 2 else None
-        buy_price = elements[3].text if len(elements) > 3 else None
+def fill_order_summary(details, histogram_data):
+    # The order counts and prices are filled in by the page's own histogram request,
+    # so take them from the histogram summaries when the page snapshot does not have them
+    name, game, item_type_element, items_for_sale, sell_price, buy_requests, buy_price = details
+    if histogram_data and None in (items_for_sale, sell_price, buy_requests, buy_price):
+        sell = parsers.parse_promote_values(histogram_data.get('sell_order_summary', ''))
+        buy = parsers.parse_promote_values(histogram_data.get('buy_order_summary', ''))
+        items_for_sale = items_for_sale or (sell[0] if len(sell) > 0 else None)
+        sell_price = sell_price or (sell[1] if len(sell) > 1 else None)
+        buy_requests = buy_requests or (buy[0] if len(buy) > 0 else None)
+        buy_price = buy_price or (buy[1] if len(buy) > 1 else None)
+    return name, game, item_type_element, items_for_sale, sell_price, buy_requests, buy_price
 
 
-        return name, game, item_type_element, items_for_sale, sell_price, buy_requests, buy_price
-    else:
-        print(f"Failed to fetch page: {response.text}")
+def get_item_details(client, link, headers):
+    html = get_listing_page(client, link)
+    if html is None:
         return None, None, None, None, None, None, None
+    return parse_item_details(html)
 
 def get_priceoverview_data(name,appid, headers):
     # Navigate to the priceoverview route
     name_encoded = name.replace(' ', '%20').replace('&', '%26')
-    priceoverview_link = f"https://steamcommunity.com/market/priceoverview/?appid={appid}&currency=1&market_hash_name={name_encoded}"
+    priceoverview_link = f"{STEAM_URL}/market/priceoverview/?appid={appid}&currency=1&market_hash_name={name_encoded}"
     # Send a GET request to the priceoverview route
-    response = requests.get(priceoverview_link)
+    response = transport.get(priceoverview_link)
 
     if response.status_code == 200:
         # Parse the JSON response
@@ -188,24 +215,21 @@ def get_priceoverview_data(name,appid, headers):
         lowest_price = priceoverview_data['lowest_price']
         volume = priceoverview_data['volume']
         median_price = priceoverview_data['median_price']
-        print(f"Lowest Price: {lowest_price}, Volume: {volume}, Median Price: {median_price}")
+        logger.debug(f"Lowest Price: {lowest_price}, Volume: {volume}, Median Price: {median_price}")
         return lowest_price, volume, median_price
     else:
-        print(f"Failed to get priceoverview data for {name}")
+        logger.warning(f"Failed to get priceoverview data for {name}")
         return None, None, None
 
 
 def get_pricehistory_data(name, headers, appid):
-    print("in get_pricehistory_data, name is:", name)
     name_encoded = name.replace(' ', '%20').replace('&', '%26')
 
-    pricehistory_link = f"https://steamcommunity.com/market/pricehistory/?appid={appid}&market_hash_name={name_encoded}"
-    
-    # Print the pricehistory_link for debugging
-    print('This is pricehistory_link:', pricehistory_link)
+    pricehistory_link = f"{STEAM_URL}/market/pricehistory/?appid={appid}&market_hash_name={name_encoded}"
+    logger.debug(f'pricehistory link: {pricehistory_link}')
 
     # Send a GET request to the pricehistory route with the headers
-    response = requests.get(pricehistory_link, headers=headers)
+    response = transport.get(pricehistory_link, headers=headers)
 
     if response.status_code == 200:
         # Parse the JSON response
@@ -213,16 +237,71 @@ def get_pricehistory_data(name, headers, appid):
 
         return pricehistory_data['prices']
     else:
-        print(f"Failed to get pricehistory data for {name}")
+        logger.warning(f"Failed to get pricehistory data for {name}")
         return None
 
 
+MONTHS = {month: f'{number:02d}' for number, month in enumerate(
+    ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec'], start=1)}
+
+
+def parse_pricehistory_dates(date_strings):
+    # "Dec 06 2013 01:" -> datetime64, going through ISO strings that NumPy parses in C
+    return np.array(
+        [f'{date[7:11]}-{MONTHS[date[:3]]}-{date[4:6]}T{date[12:14]}' for date in date_strings],
+        dtype='datetime64[h]',
+    ).astype('datetime64[ns]')
+
+
+@tracer.traced('parse_pricehistory')
 def process_pricehistory_data(pricehistory_data, last_date=None):
+    if not pricehistory_data:
+        return {}
+    logger.debug(f'last_date: {last_date}')
+
+    # Each row is [date, price, volume] - split the whole array into columns at once
+    raw_dates, prices, volumes = zip(*pricehistory_data)
+    prices = np.asarray(prices, dtype=np.float64)
+    volumes = np.asarray(volumes).astype(np.int64)
+
+    # Number the distinct date strings in the order they first appear, so each one is handled once, then
+    # number their hours - strings with different timezone offsets for the same hour are one entry
+    codes, date_strings = pd.factorize(np.asarray(raw_dates, dtype=object), sort=False)
+    hours = [date_string.rsplit(" ", 1)[0] for date_string in date_strings]  # Remove the timezone offset
+    hour_codes, days = pd.factorize(np.asarray(hours, dtype=object), sort=False)
+    codes = hour_codes[codes]
+    days = list(days)
+
+    # Keep only rows newer than last_date
+    if last_date is not None and not pd.isna(last_date):
+        newer = parse_pricehistory_dates(days) > pd.Timestamp(last_date).to_datetime64()
+        mask = newer[codes]
+        codes, prices, volumes = codes[mask], prices[mask], volumes[mask]
+
+    # Average price and total volume per date
+    counts = np.bincount(codes, minlength=len(days))
+    price_sums = np.bincount(codes, weights=prices, minlength=len(days))
+    volume_sums = np.bincount(codes, weights=volumes, minlength=len(days))
+    present = np.flatnonzero(counts)
+    avg_prices = (price_sums[present] / counts[present]).tolist()
+    total_volumes = volume_sums[present].astype(np.int64).tolist()
+
+    return {
+        days[index]: {
+            "Average Price": avg_price,
+            "Total Volume": total_volume
+        }
+        for index, avg_price, total_volume in zip(present.tolist(), avg_prices, total_volumes)
+    }
+
+
+def process_pricehistory_data_loop(pricehistory_data, last_date=None):
+    # Row-by-row version of process_pricehistory_data, kept as a reference for benchmarks/bench_pricehistory.py
     if not pricehistory_data:
         return {}
     # Create a dictionary to store the daily data
     daily_data = defaultdict(list)
-    print(f'last_date: {last_date}', )
+    logger.debug(f'last_date: {last_date}')
 
     # Iterate over the prices data
     for price_data in pricehistory_data:
@@ -266,92 +345,47 @@ def process_pricehistory_data(pricehistory_data, last_date=None):
     return processed_data
 
 
-def process_item_links(client, link, sessionid):
-    print(f"Processing link: {link}")
-    item_nameid, appid = get_item_id(link)
-    
-    headers = {
-        'Cookie': f'steamLoginSecure={sessionid}'
-    }
-
-    # Send a GET request to the ScrapingBee API
-    response = client.get(f"{link}?render_js=true&headers={json.dumps(headers)}")
-
-
-    # Check if the request was successful
-    if response.status_code == 200:
-        # Parse the HTML from the response
-        soup = BeautifulSoup(response.text, 'html.parser')
-
-        # Get item details
-        name, game, item_type_element, items_for_sale, sell_price, buy_requests, buy_price = get_item_details(client, link, headers)
-
-        # Get priceoverview data
-        lowest_price, volume, median_price = get_priceoverview_data(name, appid, headers)
-
-    # Get pricehistory data
-    pricehistory_data = get_pricehistory_data(name, headers, appid)
-
-    if pricehistory_data:
-        # Load existing data
-        try:
-            existing_daily_df = pd.read_csv('daily.csv')
-            last_date = pd.to_datetime(existing_daily_df[existing_daily_df['Name'] == name]['Date']).max()
-        except (FileNotFoundError, pd.errors.EmptyDataError):
-            last_date = None
-
-        # Process pricehistory data
-        daily_data = process_pricehistory_data(pricehistory_data, last_date)
-
-    # Get histogram data
-    histogram_data = get_histogram_data(item_nameid, headers, client)
-
-    if histogram_data:
-        # Load existing data
-        try:
-            existing_processed_df = pd.read_csv('processed.csv')
-            if 'Date' in existing_processed_df.columns:
-                last_date = pd.to_datetime(existing_processed_df[existing_processed_df['Name'] == name]['Date']).max()
-            else:
-                last_date = None
-        except (FileNotFoundError, pd.errors.EmptyDataError):
-            last_date = None
+def build_item_frames(details, overview, pricehistory_data, histogram_data, last_date=None):
+    name, game, item_type_element, items_for_sale, sell_price, buy_requests, buy_price = details
+    lowest_price, volume, median_price = overview
 
+    if not pricehistory_data:
+        raise RuntimeError(f"No pricehistory data for {name}")
+    if not histogram_data:
+        raise RuntimeError(f"No histogram data for {name}")
+
+    # Process pricehistory data, keeping only rows newer than last_date
+    daily_data = process_pricehistory_data(pricehistory_data, last_date)
+
+    # Process histogram data
+    book, processed_data = process_histogram(histogram_data)
+
+    data = {
+        'Name': [name],
+        'Game': [game],
+        'Item Type': [item_type_element],
+        'Items for Sale': [items_for_sale],
+        'Sell Price': [sell_price],
+        'Buy Requests': [buy_requests],
+        'Buy Price': [buy_price],
+        'Lowest Price': [lowest_price],
+        'Volume': [volume],
+        'Median Price': [median_price],
+        'Daily Data': [daily_data],
+        'Histogram Data': [processed_data]
+    }
 
-        # Process histogram data
-        processed_data = process_histogram(histogram_data)
+    item_df, daily_df, processed_df = create_dataframes(name, data, daily_data, processed_data)
 
-        
-        data = {
-            'Name': [name],
-            'Game': [game],
-            'Item Type': [item_type_element],
-            'Items for Sale': [items_for_sale],
-            'Sell Price': [sell_price],
-            'Buy Requests': [buy_requests],
-            'Buy Price': [buy_price],
-            'Lowest Price': [lowest_price],
-            'Volume': [volume],
-            'Median Price': [median_price],
-            'Daily Data': [daily_data],
-            'Histogram Data': [processed_data]
-        }
+    # Keep the full book with its snapshot, storage writes it to its own table
+    processed_df['Order Book'] = [book]
+    return item_df, daily_df, processed_df
 
-        item_df, daily_df, processed_df = create_dataframes(name, data, daily_data, processed_data)
 
-        return item_df, daily_df, processed_df
-    else:
-        print(f"Failed to fetch page: {response.text}")
-        return None, None, None
-    
 def create_dataframes(name, data, daily_data, processed_data):
-    for key, value in data.items():
-        print(f"{key}: {len(value)}")
-
     item_df = pd.DataFrame(data)
 
-    for key, value in daily_data.items():
-        print(f"{key}: {len(value)}")
+    logger.debug(f"{name}: {len(daily_data)} new daily rows")
 
     # Create a DataFrame to store the daily data
     daily_df = pd.DataFrame(daily_data).T
@@ -359,11 +393,10 @@ def create_dataframes(name, data, daily_data, processed_data):
     daily_df.reset_index(inplace=True)
     daily_df['Name'] = name  # Add a column to link the data to the item
 
-    for key, value in processed_data.items():
-        print(f"{key}: {len(value)}")
-        
-    # Create a DataFrame to store the processed data
-    processed_df = pd.DataFrame(processed_data)
+    logger.debug(f"{name} order book: {processed_data}")
+
+    # Create a DataFrame to store the processed data, one row per order book snapshot
+    processed_df = pd.DataFrame([processed_data])
     processed_df['Name'] = name  # Add a column to link the data to the item
 
     return item_df, daily_df, processed_df
@@ -383,61 +416,60 @@ def clean_data(item_df, daily_df, processed_df):
     # Convert 'Date' to datetime 
     daily_df['Date'] = pd.to_datetime(daily_df['Date'], format='%b %d %Y %H:')
 
-    # Replace None values with empty lists in the 'Buy Order Graph' and 'Sell Order Graph' columns
-    processed_df['Buy Order Graph'] = processed_df['Buy Order Graph'].apply(lambda d: d if isinstance(d, list) else [])
-    processed_df['Sell Order Graph'] = processed_df['Sell Order Graph'].apply(lambda d: d if isinstance(d, list) else [])
-
-    # Split 'Buy Order Graph' and 'Sell Order Graph' into separate columns
-    processed_df[['Buy Order Graph 1','Buy Order Graph 2' ]] = pd.DataFrame(processed_df['Buy Order Graph'].tolist(), index=processed_df.index)[[0, 1]]
-    processed_df[['Sell Order Graph 1', 'Sell Order Graph 2']] = pd.DataFrame(processed_df['Sell Order Graph'].tolist(), index=processed_df.index)[[0, 1]]
-    processed_df.columns = ["Buy Order Graph", "Sell Order Graph", "Name", "Lowest Buy", "Volume", "2nd Lowest Buy", "2nd Volume"]
+    # The order book features are already numeric, computed during ingest by process_histogram
 
     return item_df, daily_df, processed_df
 
 
+def main(workers=None):
+    # The crawler imports this module, so import it here
+    from crawler import crawl, RequestBudget
+    from nameid_cache import NameidCache
+    from storage import MarketStore
 
-def process_link(client, link, sessionid):
-    item_df, daily_df, processed_df = process_item_links(client, link, sessionid)
-    item_df, daily_df, processed_df = clean_data(item_df, daily_df, processed_df)
-    
-    return item_df, daily_df, processed_df
-
-def main(): 
     # Initialize the ScrapingBee client
-    client = ScraperAPIClient(api_key=api_key)
-    
-    headers = {
-        'Cookie': f'steamLoginSecure={sessionid}'
-    }
-    # Get item links
-    item_links = get_item_links(client)
-    
-    item_dfs = []
-    daily_dfs = []
-    processed_dfs = []
-    
-    print(f"Found {len(item_links)} items")
-    for link in item_links:
-        for _ in range(3):
-            try:
-                item_df, daily_df, processed_df = process_link(client, link, sessionid)
-                item_dfs.append(item_df)
-                daily_dfs.append(daily_df)
-                processed_dfs.append(processed_df)
-                break
-            except Exception as e:
-                print(f"Failed to process link {link} due to {e}")
-                traceback.print_exc()
-        else:
-            print(f"Failed to process link {link} after {3} retries")
-
-    all_items_df = pd.concat(item_dfs, ignore_index=True)
-    all_daily_df = pd.concat(daily_dfs, ignore_index=True)
-    all_processed_df = pd.concat(processed_dfs, ignore_index=True)
-
-    all_items_df.to_csv('items.csv', index=False)
-    all_daily_df.to_csv('daily.csv', index=False)
-    all_processed_df.to_csv('processed.csv', index=False)
+    client = get_client()
+
+    # Number of items crawled at once - 1 crawls them one after another
+    if workers is None:
+        workers = int(os.getenv("CRAWL_WORKERS", "1"))
+
+    # Number of items to crawl, 0 crawls every search result
+    limit = int(os.getenv("CRAWL_LIMIT", "50")) or None
+
+    # Item links stream in page by page, so items are processed while pagination continues
+    item_links = iter_item_links(limit)
+
+    # Known item nameids are read from disk instead of the browser
+    cache = NameidCache(os.getenv("NAMEID_CACHE", "nameid_cache.db"))
+
+    # New rows are appended to the database and to items.csv, daily.csv and processed.csv as items finish
+    store = MarketStore(os.getenv("MARKET_DB", "market.db"), os.getenv("DATA_DIR", "."))
+
+    # One browser pool serves the whole crawl, so even the sequential crawl goes through the crawler
+    budget = RequestBudget()
+    with profiling(), span('crawl', workers=workers):
+        all_items_df, all_daily_df, all_processed_df = asyncio.run(
+            crawl(client, item_links, sessionid, workers, cache=cache, budget=budget, store=store)
+        )
+    store.close()
+    logger.info(f"Crawled {len(all_items_df)} items, {len(all_daily_df)} new daily rows")
+
+    # Requests spent per item, by kind
+    logger.info(f"Request budget per item: {budget.summary()}")
+
+    stats = cache.stats()
+    logger.info(f"Item nameid cache: {stats['hits']} hits, {stats['misses']} misses, {stats['evictions']} evictions")
+    cache.close()
+
+    for endpoint, endpoint_stats in transport.stats().items():
+        logger.info(f"{endpoint}: {endpoint_stats['requests']} requests, {endpoint_stats['retries']} retries, "
+                    f"statuses {endpoint_stats['statuses']}, avg latency {endpoint_stats['avg_latency']:.3f}s")
+    transport.close()
+
+    # Where the crawl spent its time, also written to TRACE_FILE when set
+    tracer.report(logger)
+    tracer.close()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,151 @@
+from datetime import datetime
+import pandas as pd
+import sqlite3
+import threading
+import json
+import csv
+import os
+
+from orderbook import pack_order_book, unpack_order_book
+from instrumentation import get_logger
+
+logger = get_logger(__name__)
+
+ORDER_BOOK_COLUMNS = ['bid_price', 'bid_cumulative', 'bid_quantity', 'ask_price', 'ask_cumulative', 'ask_quantity']
+
+# Format of the Date columns, as written to the CSV files read by preprocess_data
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+SCHEMA = [
+    'CREATE TABLE IF NOT EXISTS daily ("Date" TEXT NOT NULL, "Average Price" REAL, "Total Volume" INTEGER, "Name" TEXT NOT NULL)',
+    'CREATE UNIQUE INDEX IF NOT EXISTS daily_name_date ON daily ("Name", "Date")',
+    # Full order book per snapshot, one raw float64/int64 array per column
+    'CREATE TABLE IF NOT EXISTS order_books ("Name" TEXT NOT NULL, "Date" TEXT NOT NULL, '
+    'bid_price BLOB, bid_cumulative BLOB, bid_quantity BLOB, ask_price BLOB, ask_cumulative BLOB, ask_quantity BLOB)',
+    'CREATE INDEX IF NOT EXISTS order_books_name_date ON order_books ("Name", "Date")',
+]
+
+# Index created on each table once pandas has created it
+INDEXES = {
+    'items': 'CREATE INDEX IF NOT EXISTS items_name_date ON items ("Name", "Scraped At")',
+    'processed': 'CREATE INDEX IF NOT EXISTS processed_name_date ON processed ("Name", "Date")',
+}
+
+
+def insert_or_ignore(inserted):
+    # pandas to_sql insert method that skips rows already stored, noting in `inserted` whether each row was new
+    def insert(table, conn, keys, data_iter):
+        columns = ', '.join(f'"{key}"' for key in keys)
+        placeholders = ', '.join('?' * len(keys))
+        statement = f'INSERT OR IGNORE INTO "{table.name}" ({columns}) VALUES ({placeholders})'
+        for row in data_iter:
+            inserted.append(conn.execute(statement, row).rowcount == 1)
+    return insert
+
+
+def csv_header(path):
+    with open(path, newline='') as f:
+        return next(csv.reader(f), None)
+
+
+def to_storable(df):
+    # SQLite and CSV cannot hold lists, dicts or timestamps, so store them as JSON and text
+    df = df.copy()
+    for column in df.columns:
+        if pd.api.types.is_datetime64_any_dtype(df[column]):
+            df[column] = df[column].dt.strftime(DATE_FORMAT)
+        elif df[column].dtype == object:
+            df[column] = df[column].apply(lambda value: json.dumps(value) if isinstance(value, (list, dict)) else value)
+    return df
+
+
+class MarketStore:
+    # Append-only storage for the scraped tables: a SQLite database indexed on (Name, Date)
+    # plus CSV copies that only ever get new rows appended
+    def __init__(self, path='market.db', csv_dir='.'):
+        self.path = path
+        self.csv_dir = csv_dir
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        for statement in SCHEMA:
+            self.connection.execute(statement)
+        self.connection.commit()
+
+    def csv_path(self, table):
+        return os.path.join(self.csv_dir, f'{table}.csv')
+
+    def append(self, table, df):
+        if df is None or df.empty:
+            return
+        df = to_storable(df)
+
+        with self.lock:
+            inserted = []
+            df.to_sql(table, self.connection, if_exists='append', index=False, method=insert_or_ignore(inserted))
+            if table in INDEXES:
+                self.connection.execute(INDEXES[table])
+            self.connection.commit()
+
+            # Mirror only the rows the database took into the CSV file, so it never gets the duplicates it skipped
+            df = df[inserted]
+            if not df.empty:
+                self.append_csv(table, df)
+
+    def append_csv(self, table, df):
+        # Append under the existing header, in its column order. A file written with other columns, e.g. by an
+        # older version of the scraper, is moved aside rather than mixed with rows it has no header for
+        path = self.csv_path(table)
+        header = csv_header(path) if os.path.exists(path) else None
+        if header is not None and sorted(header) != sorted(df.columns):
+            rotated = os.path.join(self.csv_dir, f"{table}.{datetime.now().strftime('%Y%m%d-%H%M%S')}.csv")
+            os.replace(path, rotated)
+            logger.warning(f"{path} has different columns than the {table} table, moved it to {rotated}")
+            header = None
+        if header is not None:
+            df = df[header]
+        df.to_csv(path, mode='a', header=header is None, index=False)
+
+    def append_order_books(self, names, dates, books):
+        rows = []
+        for name, date, book in zip(names, dates, books):
+            packed = pack_order_book(book)
+            rows.append((name, pd.Timestamp(date).strftime(DATE_FORMAT), *(packed[column] for column in ORDER_BOOK_COLUMNS)))
+
+        columns = ', '.join(ORDER_BOOK_COLUMNS)
+        placeholders = ', '.join('?' * (len(ORDER_BOOK_COLUMNS) + 2))
+        with self.lock:
+            self.connection.executemany(f'INSERT INTO order_books ("Name", "Date", {columns}) VALUES ({placeholders})', rows)
+            self.connection.commit()
+
+    def load_order_books(self, name):
+        # All stored snapshots of an item, oldest first, as (date, book) pairs
+        with self.lock:
+            rows = self.connection.execute(
+                f'SELECT "Date", {", ".join(ORDER_BOOK_COLUMNS)} FROM order_books WHERE "Name" = ? ORDER BY "Date"',
+                (name,),
+            ).fetchall()
+        return [
+            (datetime.strptime(row[0], DATE_FORMAT), unpack_order_book(dict(zip(ORDER_BOOK_COLUMNS, row[1:]))))
+            for row in rows
+        ]
+
+    def last_date(self, name):
+        # Most recent daily row stored for an item, answered from the (Name, Date) index
+        with self.lock:
+            row = self.connection.execute('SELECT MAX("Date") FROM daily WHERE "Name" = ?', (name,)).fetchone()
+        if row is None or row[0] is None:
+            return None
+        return datetime.strptime(row[0], DATE_FORMAT)
+
+    def export_csv(self, table, path, chunksize=100000):
+        # Stream a whole table to CSV, e.g. to rebuild ../data/daily.csv from the database
+        query = f'SELECT * FROM "{table}"'
+        if table == 'daily':
+            query += ' ORDER BY "Name", "Date"'
+        with self.lock:
+            chunks = pd.read_sql_query(query, self.connection, chunksize=chunksize)
+            for index, chunk in enumerate(chunks):
+                chunk.to_csv(path, mode='w' if index == 0 else 'a', header=index == 0, index=False)
+
+    def close(self):
+        self.connection.close()
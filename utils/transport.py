@@ -0,0 +1,227 @@
+from collections import Counter, defaultdict
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from urllib.parse import urlsplit
+from requests.adapters import HTTPAdapter
+from dotenv import load_dotenv
+import requests
+import random
+import threading
+import time
+import os
+
+from instrumentation import count, get_logger, span
+
+logger = get_logger(__name__)
+
+# Requests per second and burst size for each Steam endpoint
+DEFAULT_RATE_LIMITS = {
+    'search': (0.5, 2),
+    'listings': (1, 4),
+    'priceoverview': (0.5, 4),
+    'pricehistory': (0.5, 4),
+    'itemordershistogram': (1, 4),
+    'default': (1, 4),
+}
+
+# Statuses worth retrying - Steam answers 429 when it throttles us
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+def parse_rate_limits(value):
+    # Parse "priceoverview=0.5:4,pricehistory=0.25:2" into {endpoint: (rate, capacity)}
+    rate_limits = {}
+    for entry in filter(None, (part.strip() for part in (value or '').split(','))):
+        endpoint, limit = entry.split('=')
+        rate, _, capacity = limit.partition(':')
+        rate_limits[endpoint.strip()] = (float(rate), float(capacity or 1))
+    return rate_limits
+
+
+def endpoint_for(url):
+    # Name the Steam endpoint a URL belongs to, e.g. /market/priceoverview/ -> priceoverview
+    path = urlsplit(url).path
+    for endpoint in ('search', 'listings', 'priceoverview', 'pricehistory', 'itemordershistogram'):
+        if f'/{endpoint}' in path:
+            return endpoint
+    return 'default'
+
+
+def parse_retry_after(value):
+    # Retry-After is either a number of seconds or an HTTP date
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        # Block until a token is available
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class Transport:
+    # Shared HTTP layer: one keep-alive session per host, a token bucket per endpoint and backoff on throttling
+    def __init__(self, rate_limits=None, max_retries=4, backoff=1.0, max_backoff=60.0, pool_size=16, timeout=30):
+        self.rate_limits = dict(DEFAULT_RATE_LIMITS)
+        self.rate_limits.update(rate_limits or {})
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.pool_size = pool_size
+        self.timeout = timeout
+
+        self.sessions = {}
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+        # Per-endpoint counters
+        self.requests = Counter()
+        self.retries = Counter()
+        self.errors = Counter()
+        self.statuses = defaultdict(Counter)
+        self.latency = defaultdict(list)
+
+    def set_rate_limit(self, endpoint, rate, capacity):
+        with self.lock:
+            self.rate_limits[endpoint] = (rate, capacity)
+            self.buckets.pop(endpoint, None)
+
+    def set_pool_size(self, pool_size):
+        # Connections kept per host, e.g. one per crawler thread - sessions already open get a new adapter
+        with self.lock:
+            self.pool_size = pool_size
+            for session in self.sessions.values():
+                self.mount(session)
+
+    def mount(self, session):
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+
+    def get_session(self, url):
+        host = urlsplit(url).netloc
+        with self.lock:
+            if host not in self.sessions:
+                session = requests.Session()
+                self.mount(session)
+                self.sessions[host] = session
+            return self.sessions[host]
+
+    def get_bucket(self, endpoint):
+        with self.lock:
+            if endpoint not in self.buckets:
+                rate, capacity = self.rate_limits.get(endpoint, self.rate_limits['default'])
+                self.buckets[endpoint] = TokenBucket(rate, capacity)
+            return self.buckets[endpoint]
+
+    def get_delay(self, attempt, response=None):
+        # Honour Retry-After when Steam sends one, otherwise back off exponentially with jitter
+        delay = None
+        if response is not None:
+            delay = parse_retry_after(response.headers.get('Retry-After'))
+        if delay is None:
+            delay = self.backoff * 2 ** attempt
+            delay += random.uniform(0, delay / 4)
+        return min(delay, self.max_backoff)
+
+    def record(self, endpoint, status, elapsed):
+        with self.lock:
+            self.requests[endpoint] += 1
+            self.statuses[endpoint][status] += 1
+            self.latency[endpoint].append(elapsed)
+
+    def get(self, url, headers=None, endpoint=None):
+        endpoint = endpoint or endpoint_for(url)
+        with span('fetch', endpoint=endpoint) as attributes:
+            response = self.get_with_retries(url, headers, endpoint, attributes)
+            attributes['status'] = response.status_code
+            attributes['bytes'] = len(response.content)
+            count('bytes_fetched', attributes['bytes'])
+            return response
+
+    def get_with_retries(self, url, headers, endpoint, attributes):
+        session = self.get_session(url)
+        bucket = self.get_bucket(endpoint)
+
+        for attempt in range(self.max_retries + 1):
+            attributes['attempts'] = attempt + 1
+            with span('rate_limit_wait', endpoint=endpoint):
+                bucket.acquire()
+            start = time.perf_counter()
+            count('requests')
+            try:
+                response = session.get(url, headers=headers, timeout=self.timeout)
+            except requests.RequestException as e:
+                self.record(endpoint, type(e).__name__, time.perf_counter() - start)
+                with self.lock:
+                    self.errors[endpoint] += 1
+                count('request_errors')
+                if attempt == self.max_retries:
+                    raise
+                delay = self.get_delay(attempt)
+            else:
+                self.record(endpoint, response.status_code, time.perf_counter() - start)
+                if response.status_code not in RETRY_STATUSES or attempt == self.max_retries:
+                    return response
+                delay = self.get_delay(attempt, response)
+
+            logger.warning(f"Retrying {endpoint} request in {delay:.1f}s (attempt {attempt + 1} of {self.max_retries})")
+            with self.lock:
+                self.retries[endpoint] += 1
+            count('retries')
+            time.sleep(delay)
+
+    def stats(self):
+        with self.lock:
+            stats = {}
+            for endpoint in self.requests:
+                latency = sorted(self.latency[endpoint])
+                stats[endpoint] = {
+                    'requests': self.requests[endpoint],
+                    'retries': self.retries[endpoint],
+                    'errors': self.errors[endpoint],
+                    'statuses': dict(self.statuses[endpoint]),
+                    'avg_latency': sum(latency) / len(latency),
+                    'p50_latency': latency[len(latency) // 2],
+                    'max_latency': latency[-1],
+                }
+            return stats
+
+    def close(self):
+        for session in self.sessions.values():
+            session.close()
+
+
+# The settings below may come from a .env file, like the scraper's credentials
+load_dotenv()
+
+# Base URL of the Steam Community market - point it at a local stand-in to crawl offline
+STEAM_URL = os.getenv("STEAM_BASE_URL", "https://steamcommunity.com")
+
+# Shared HTTP transport for every direct Steam request. It lives here rather than in scraper.py, which is also run
+# as a script: as __main__ it would be a second module with a second transport, token buckets and stats
+transport = Transport(rate_limits=parse_rate_limits(os.getenv("STEAM_RATE_LIMITS")))